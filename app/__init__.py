@@ -5,8 +5,15 @@ from app.detection.detector import detector
 from app.detection.model import model
 from app.extensions import db, migrate, csrf
 from app.utils.detector import DetectorManager
+from app.utils.model_registry import model_registry
+from app.utils.state_cache import state_cache
+from app.utils.model_store import model_store, migrate_legacy_blobs
+from app.utils.detection_writer import detection_writer
+from app.utils.cctv import camera_stream_manager
+from app.utils.model_export import model_exporter
 import os
 import signal
+import multiprocessing
 
 # Global detector manager instance
 detector_manager = None
@@ -16,6 +23,7 @@ def handle_shutdown_signal(signal, frame):
     if detector_manager:
         detector_manager.stop_all()
     print("Detector manager stopped.")
+    detection_writer.stop()
     os._exit(0)
 
 def create_app():
@@ -34,6 +42,35 @@ def create_app():
     app.register_blueprint(detector)
     app.register_blueprint(model)
 
+    # Content-addressed weights on disk
+    model_store.init_app(app)
+
+    # Shared model cache used by all detector threads
+    model_registry.configure(
+        max_idle_models=app.config['MODEL_CACHE_SIZE'],
+        max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+        max_batch_wait=app.config['INFERENCE_MAX_WAIT_MS'] / 1000.0
+    )
+
+    # Inference worker processes are spawned and re-import this module, they must not start detectors
+    if multiprocessing.parent_process() is not None:
+        return app
+
+    # Older rows still holding the weights blob are moved to the model store once
+    migrate_legacy_blobs(app)
+
+    # Camera/detector state for the streaming loops, kept current by the write routes
+    state_cache.init_app(app)
+
+    # Background persistence of detections
+    detection_writer.init_app(app)
+
+    # CPU-optimised model exports run in the background
+    model_exporter.init_app(app)
+
+    # Frames are downscaled once on the capture thread for every consumer
+    camera_stream_manager.configure(default_capture_width=app.config['CAPTURE_WIDTH'])
+
     # Initialize DetectorManager
     global detector_manager
     detector_manager = DetectorManager()
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import re
+import struct
+import time
+import logging
+from urllib.parse import parse_qs
+from app.utils.async_streaming import async_stream_hub
+from app.utils.state_cache import state_cache
+from app.utils.streaming import mjpeg_part, latency_headers, STREAM_TIERS, DEFAULT_STREAM_TIER
+from app.utils.metrics import stage_seconds, stream_clients, source_label
+from app.utils.latency import latency_tracker
+
+logger = logging.getLogger(__name__)
+
+MJPEG_HEADERS = [
+    (b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+    (b'cache-control', b'no-cache, no-store, must-revalidate'),
+    (b'pragma', b'no-cache'),
+    (b'expires', b'0')
+]
+
+# Same URLs as the Flask stream routes, so templates work unchanged under either server
+STREAM_ROUTES = [
+    (re.compile(r'^/cctv/stream/(\d+)$'), 'camera'),
+    (re.compile(r'^/detector/stream_detector/(\d+)$'), 'detector')
+]
+
+EVENT_STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no')
+]
+
+EVENT_ROUTES = [
+    (re.compile(r'^/detector/detections/(\d+)$'), 'detections')
+]
+
+WEBSOCKET_ROUTES = [
+    (re.compile(r'^/ws/cctv/(\d+)$'), 'camera'),
+    (re.compile(r'^/ws/detector/(\d+)$'), 'detector')
+]
+
+
+def websocket_frame(frame, subscriber):
+    """Binary message: 4-byte big-endian header length, JSON header, JPEG bytes."""
+    header = json.dumps({
+        'seq': frame.seq,
+        'capture_seq': frame.capture_seq,
+        'captured_at': frame.captured_at,
+        'detected_at': frame.detected_at,
+        'sent_at': time.time(),
+        'tier': subscriber.tier,
+        'delivered': subscriber.delivered,
+        'dropped': subscriber.dropped
+    }).encode()
+    return struct.pack('>I', len(header)) + header + frame.jpeg
+
+
+class StreamingASGIApp:
+    """ASGI entry point serving the MJPEG and WebSocket streams on the event loop and everything else through Flask.
+
+    A viewer costs a coroutine and a bounded queue instead of a worker thread, so a
+    single process can hold hundreds of tiles. Run with one worker process, the
+    detector threads live inside it: uvicorn asgi:app --workers 1
+    """
+
+    def __init__(self, flask_app):
+        from asgiref.wsgi import WsgiToAsgi
+
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        async_stream_hub.init_app(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            for pattern, kind in STREAM_ROUTES:
+                match = pattern.match(scope['path'])
+                if match:
+                    await self._stream(kind, int(match.group(1)), scope, receive, send)
+                    return
+            for pattern, kind in EVENT_ROUTES:
+                match = pattern.match(scope['path'])
+                if match:
+                    await self._events(kind, int(match.group(1)), scope, receive, send)
+                    return
+
+        if scope['type'] == 'websocket':
+            for pattern, kind in WEBSOCKET_ROUTES:
+                match = pattern.match(scope['path'])
+                if match:
+                    await self._websocket(kind, int(match.group(1)), scope, receive, send)
+                    return
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                async_stream_hub.stop_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _reject(self, send, status, text):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': text.encode()})
+
+    async def _resolve_source(self, kind, source_id, query):
+        """Source key for a stream request, or (None, error) when it cannot be streamed."""
+        # The state cache may reload from the database when its TTL expired, keep that off the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._lookup_source, kind, source_id, query
+        )
+
+    def _lookup_source(self, kind, source_id, query):
+        if kind == 'camera':
+            camera = state_cache.get_camera(source_id)
+            if not camera:
+                return None, "Camera does not exist"
+            if not camera['status']:
+                return None, "Camera is off"
+            return ('camera', camera['ip_address']), None
+
+        detector = state_cache.get_detector(source_id)
+        if not detector or not detector['running']:
+            logger.warning(f"Attempted to stream inactive or non-existent detector {source_id}")
+            return None, "Detector is off or does not exist"
+
+        # Same side effect as the Flask route: starts the thread and applies the tracking toggle,
+        # left out by listing page thumbnails so they don't switch the detector's mode
+        if 'tracking' in query:
+            from app import detector_manager
+            tracking = query['tracking'][0].lower() == 'true'
+            detector_manager.update_detectors(tracking_status={source_id: tracking})
+        return (kind, source_id), None
+
+    def _stream_tier(self, query):
+        """The requested stream tier, or None when it is not one of STREAM_TIERS."""
+        tier = query.get('tier', [DEFAULT_STREAM_TIER])[0]
+        return tier if tier in STREAM_TIERS else None
+
+    async def _wait_for_disconnect(self, receive, disconnect_type):
+        # Anything else a WebSocket client sends is ignored
+        while True:
+            message = await receive()
+            if message['type'] == disconnect_type:
+                return
+
+    async def _deliver(self, kind, subscriber, disconnected, send_frame):
+        """Send frames until the source ends or the client leaves. Returns True if the source ended."""
+        metrics_source = source_label(subscriber.source_key)
+        while True:
+            next_frame = asyncio.ensure_future(subscriber.next_frame())
+            done, _ = await asyncio.wait({next_frame, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_frame.cancel()
+                return False
+
+            frame = next_frame.result()
+            if frame is None:
+                return True
+
+            # Waits while the client's socket buffer is full, the pump keeps replacing queued frames meanwhile
+            send_start = time.time()
+            await send_frame(frame)
+            sent_at = time.time()
+            subscriber.delivered += 1
+            stage_seconds.observe(sent_at - send_start, stage='send', source=metrics_source)
+            if frame.captured_at:
+                latency_tracker.record(frame.camera, f"delivered_{kind}", sent_at - frame.captured_at)
+
+    async def _serve(self, kind, source_id, source_key, transport, receive, disconnect_type, send_frame, finish, tier=None):
+        queue_size = async_stream_hub.websocket_queue_size if transport == 'websocket' else None
+        subscriber = async_stream_hub.subscribe(source_key, transport, queue_size, tier)
+        metrics_source = source_label(source_key)
+        stream_clients.inc(source=metrics_source)
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive, disconnect_type))
+        logger.info(f"Async {kind} {transport} stream {source_id} opened (viewer {subscriber.id}, tier {tier})")
+
+        try:
+            if await self._deliver(kind, subscriber, disconnected, lambda frame: send_frame(frame, subscriber)):
+                await finish()
+        except OSError:
+            # Client went away mid-send
+            pass
+        finally:
+            disconnected.cancel()
+            async_stream_hub.unsubscribe(subscriber)
+            stream_clients.dec(source=metrics_source)
+            logger.info(f"Async {kind} {transport} stream {source_id} closed (viewer {subscriber.id}): "
+                        f"{subscriber.delivered} frames delivered, {subscriber.dropped} dropped")
+
+    async def _stream(self, kind, source_id, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        tier = self._stream_tier(query)
+        if tier is None:
+            await self._reject(send, 400, "Unknown stream tier")
+            return
+
+        source_key, error = await self._resolve_source(kind, source_id, query)
+        if source_key is None:
+            await self._reject(send, 400, error)
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': MJPEG_HEADERS})
+
+        async def send_frame(frame, subscriber):
+            headers = latency_headers(frame.capture_seq, frame.captured_at, frame.detected_at) if frame.captured_at else None
+            await send({'type': 'http.response.body', 'body': mjpeg_part(frame.jpeg, headers), 'more_body': True})
+
+        async def finish():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+        await self._serve(kind, source_id, source_key, 'mjpeg', receive, 'http.disconnect', send_frame, finish, tier)
+
+    async def _events(self, kind, source_id, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        source_key, error = await self._resolve_source(kind, source_id, query)
+        if source_key is None:
+            await self._reject(send, 400, error)
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': EVENT_STREAM_HEADERS})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        async def send_event(event, subscriber):
+            await send({'type': 'http.response.body', 'body': f"data: {event.data}\n\n".encode(), 'more_body': True})
+
+        async def finish():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+        await self._serve(kind, source_id, source_key, 'sse', receive, 'http.disconnect', send_event, finish)
+
+    async def _websocket(self, kind, source_id, scope, receive, send):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+
+        query = parse_qs(scope.get('query_string', b'').decode())
+        tier = self._stream_tier(query)
+        if tier is None:
+            await send({'type': 'websocket.close', 'code': 4400, 'reason': "Unknown stream tier"})
+            return
+
+        source_key, error = await self._resolve_source(kind, source_id, query)
+        if source_key is None:
+            await send({'type': 'websocket.close', 'code': 4400, 'reason': error})
+            return
+
+        await send({'type': 'websocket.accept'})
+
+        async def send_frame(frame, subscriber):
+            await send({'type': 'websocket.send', 'bytes': websocket_frame(frame, subscriber)})
+
+        async def finish():
+            # Source stopped, the page shows its offline state instead of reconnecting at once
+            await send({'type': 'websocket.close', 'code': 4410, 'reason': 'Source ended'})
+
+        await self._serve(kind, source_id, source_key, 'websocket', receive, 'websocket.disconnect', send_frame, finish, tier)
@@ -1,18 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, Response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, jsonify
 from app.models import Camera, Detector
 from app.forms import CameraForm
-import cv2
 import logging
 import time
-from app.utils.detector import CameraStreamManager
+import uuid
+from app.utils.cctv import camera_stream_manager
+from app.utils.streaming import (frame_cache, mjpeg_part, latency_headers, tier_interval, STREAM_TIERS,
+                                 DEFAULT_STREAM_TIER, SNAPSHOT_LINGER, SNAPSHOT_TIMEOUT)
+from app.utils.latency import latency_tracker
+from app.utils.metrics import stage_seconds, stream_clients, camera_label
+from app.utils.state_cache import state_cache, camera_changed
 
 logger = logging.getLogger(__name__)
 
 cctv = Blueprint('cctv', __name__, url_prefix='/cctv')
 
-# Initialize CameraStreamManager
-camera_stream_manager = CameraStreamManager()
-
 @cctv.route('/main', methods=['GET', 'POST'])
 def main_cctv():
     form = CameraForm()
@@ -22,10 +24,17 @@ def main_cctv():
             location=form.location.data,
             ip_address=form.ip_address.data,
             status=form.status.data,
-            type=form.type.data
+            type=form.type.data,
+            motion_gate=form.motion_gate.data,
+            motion_threshold=form.motion_threshold.data,
+            motion_refresh=form.motion_refresh.data,
+            roi=(form.roi.data or '').strip() or None,
+            capture_width=form.capture_width.data or None,
+            inference_size=form.inference_size.data or None
         )
         db.session.add(camera)
         db.session.commit()
+        camera_changed.send(camera.id)
         logger.info(f"Camera added: {camera.location}, IP: {camera.ip_address}")
         flash('Camera added successfully!', 'success')
         return redirect(url_for('cctv.main_cctv'))
@@ -43,9 +52,16 @@ def edit_camera(id):
         camera.type = form.type.data
         old_status = camera.status
         camera.status = form.status.data
+        camera.motion_gate = form.motion_gate.data
+        camera.motion_threshold = form.motion_threshold.data
+        camera.motion_refresh = form.motion_refresh.data
+        camera.roi = (form.roi.data or '').strip() or None
+        camera.capture_width = form.capture_width.data or None
+        camera.inference_size = form.inference_size.data or None
         try:
             from app import db
             db.session.commit()
+            camera_changed.send(id)
             logger.info(f"Camera updated: ID={id}, Status={camera.status}")
             if not camera.status and old_status:
                 camera_stream_manager.stop_inactive_streams()
@@ -78,7 +94,11 @@ def stream_camera(id):
     if not camera.status:
         return "Camera is off", 400
 
-    consumer_id = f"cctv_{id}_{int(time.time())}"  # Unique consumer ID
+    tier = request.args.get('tier', DEFAULT_STREAM_TIER)
+    if tier not in STREAM_TIERS:
+        return "Unknown stream tier", 400
+
+    consumer_id = f"cctv_{id}_{uuid.uuid4().hex[:8]}"  # Unique consumer ID
     
     # Cleanup and get stream
     camera_stream_manager.cleanup_dead_streams()
@@ -91,37 +111,54 @@ def stream_camera(id):
     if camera_stream is None:
         return "Stream not available", 500
 
-    def generate_frames(camera_stream, app, camera_id, camera_ip, consumer_id):
+    def generate_frames(camera_stream, app, camera_id, camera_ip, consumer_id, tier):
         frame_count = 0
         max_empty_frames = 150
         empty_frame_count = 0
+        last_seq = None
+        min_interval = tier_interval(tier)
+        last_sent_at = 0.0
 
         # Variabel untuk menghitung FPS
         fps = 0
         frame_counter_for_fps = 0
         start_time = time.time()
 
-        logger.info(f"Starting CCTV frame generation for camera {camera_id} ({camera_ip}) - Consumer: {consumer_id}")
+        logger.info(f"Starting CCTV frame generation for camera {camera_id} ({camera_ip}) - Consumer: {consumer_id}, tier: {tier}")
+        metrics_source = f"camera:{camera_label(camera_ip)}"
+        stream_clients.inc(source=metrics_source)
 
         try:
             while True:
                 try:
                     # Check camera status every 30 frames
                     if frame_count % 30 == 0:
-                        with app.app_context():
-                            current_camera = Camera.query.get(camera_id)
-                            if not current_camera or not current_camera.status:
-                                logger.info(f"Camera {camera_id} became inactive during CCTV streaming")
-                                break
-
-                    frame = camera_stream.get_frame()
-                    if frame is not None:
+                        if not state_cache.is_camera_active(camera_id):
+                            logger.info(f"Camera {camera_id} became inactive during CCTV streaming")
+                            break
+
+                    # Block until the camera publishes a newer frame (timeout counts as an empty frame)
+                    frame_ref = camera_stream.acquire_frame(last_seq, timeout=0.033)
+                    if frame_ref is not None:
                         empty_frame_count = 0
+                        last_seq = frame_ref.seq
 
-                        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                        if ret:
-                            yield (b'--frame\r\n'
-                                   b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+                        if time.time() - last_sent_at < min_interval:
+                            # Over the tier's frame rate, skip without encoding
+                            frame_ref.release()
+                            continue
+
+                        # Encoded once per frame and tier and shared with every viewer of that tier,
+                        # the capture slot is released before the (possibly slow) send
+                        with frame_ref:
+                            jpeg = frame_cache.get_jpeg(('camera', camera_ip), frame_ref.seq, frame_ref.frame, tier)
+                        if jpeg is not None:
+                            send_start = time.time()
+                            last_sent_at = send_start
+                            yield mjpeg_part(jpeg, latency_headers(frame_ref.seq, frame_ref.captured_at))
+                            sent_at = time.time()
+                            stage_seconds.observe(sent_at - send_start, stage='send', source=metrics_source)
+                            latency_tracker.record(camera_ip, 'delivered_camera', sent_at - frame_ref.captured_at)
                         else:
                             logger.warning(f"Failed to encode frame for camera {camera_id}")
                     else:
@@ -131,7 +168,6 @@ def stream_camera(id):
                             break
 
                     frame_count += 1
-                    time.sleep(0.033)  # ~30 FPS
 
                 except GeneratorExit:
                     logger.info(f"Client disconnected from camera {camera_id} CCTV stream")
@@ -143,12 +179,13 @@ def stream_camera(id):
         except Exception as e:
             logger.error(f"Unexpected error in CCTV stream for camera {camera_id}: {e}")
         finally:
+            stream_clients.dec(source=metrics_source)
             # Release camera stream consumer
             logger.info(f"Releasing CCTV stream consumer {consumer_id} for camera {camera_id}")
             camera_stream_manager.release_stream(camera_ip, consumer_id)
 
     return Response(
-        generate_frames(camera_stream, current_app._get_current_object(), id, camera.ip_address, consumer_id),
+        generate_frames(camera_stream, current_app._get_current_object(), id, camera.ip_address, consumer_id, tier),
         mimetype='multipart/x-mixed-replace; boundary=frame',
         headers={
             'Cache-Control': 'no-cache, no-store, must-revalidate',
@@ -156,6 +193,42 @@ def stream_camera(id):
             'Expires': '0'
         }
     )
+
+@cctv.route('/snapshot/<int:id>')
+def snapshot_camera(id):
+    """Latest frame as a single JPEG, polled by the listing page previews when streams go over MJPEG."""
+    tier = request.args.get('tier', DEFAULT_STREAM_TIER)
+    if tier not in STREAM_TIERS:
+        return "Unknown stream tier", 400
+
+    camera = state_cache.get_camera(id)
+    if not camera:
+        return "Camera does not exist", 404
+    if not camera['status']:
+        return "Camera is off", 400
+
+    camera_ip = camera['ip_address']
+    consumer_id = f"snapshot_{id}_{uuid.uuid4().hex[:8]}"
+    camera_stream = camera_stream_manager.get_camera_stream(camera_ip, consumer_id)
+    if camera_stream is None:
+        return "Stream not available", 503
+    # Held a little longer so the next snapshot finds the camera still open
+    camera_stream_manager.release_stream_later(camera_ip, consumer_id, SNAPSHOT_LINGER)
+
+    frame_ref = camera_stream.acquire_frame(None, timeout=SNAPSHOT_TIMEOUT)
+    if frame_ref is None:
+        return "No frame available", 503
+    with frame_ref:
+        jpeg = frame_cache.get_jpeg(('camera', camera_ip), frame_ref.seq, frame_ref.frame, tier)
+    if jpeg is None:
+        return "Failed to encode frame", 500
+
+    return Response(jpeg, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache, no-store, must-revalidate'})
+
+@cctv.route('/latency_stats')
+def get_latency_stats():
+    # Frame age percentiles (ms) per camera: source lag, detection and delivery to viewers
+    return jsonify(latency_tracker.get_stats())
     
 @cctv.route('/delete/<int:id>', methods=['POST'])
 def delete_camera(id):
@@ -167,7 +240,9 @@ def delete_camera(id):
     from app import db
     db.session.delete(camera)
     db.session.commit()
+    camera_changed.send(id)
     camera_stream_manager.stop_inactive_streams()
+    latency_tracker.discard(camera.ip_address)
     flash('Camera deleted successfully!', 'success')
     return redirect(url_for('cctv.main_cctv'))
 
@@ -180,6 +255,7 @@ def delete_all_cameras():
         else:
             Camera.query.delete()
             db.session.commit()
+            camera_changed.send(None)
             camera_stream_manager.stop_all()
             flash('All cameras have been deleted successfully!', 'success')
     except Exception as e:
@@ -1,12 +1,17 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, jsonify
 from app.models import Camera, Model, Detector
 from app.forms import DetectorForm
-import cv2
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import logging
+import threading
 import time
-from app.utils.detector import annotated_frames, detector_fps_info  
+from app.utils.detector import get_annotated_channel, get_detection_channel, detector_fps_info  
+from app.utils.streaming import (frame_cache, mjpeg_part, latency_headers, tier_interval, STREAM_TIERS,
+                                 DEFAULT_STREAM_TIER, SNAPSHOT_LINGER, SNAPSHOT_TIMEOUT)
+from app.utils.latency import latency_tracker
+from app.utils.metrics import stage_seconds, stream_clients
+from app.utils.state_cache import state_cache, detector_changed
 
 logger = logging.getLogger(__name__)
 detector = Blueprint('detector', __name__, url_prefix="/detector")
@@ -29,12 +34,18 @@ def main_detector():
             camera_id=form.camera_id.data,
             model_id=form.model_id.data,
             running=form.running.data,
+            min_fps=form.min_fps.data,
+            max_fps=form.max_fps.data,
+            weight=form.weight.data,
+            model_variant=form.model_variant.data,
+            overlay=form.overlay.data,
             created_at=datetime.now(wib),
             updated_at=datetime.now(wib)
         )
         try:
             db.session.add(new_detector)
             db.session.commit()
+            detector_changed.send(new_detector.id)
             logger.info(f"Detector added: ID={new_detector.id}, Camera ID={new_detector.camera_id}")
             flash('Detector added successfully!', 'success')
             from app import detector_manager
@@ -60,11 +71,17 @@ def edit_detector(id):
             detector.camera_id = form.camera_id.data
             detector.model_id = form.model_id.data
             detector.running = form.running.data
+            detector.min_fps = form.min_fps.data
+            detector.max_fps = form.max_fps.data
+            detector.weight = form.weight.data
+            detector.model_variant = form.model_variant.data
+            detector.overlay = form.overlay.data
             detector.updated_at = datetime.now(wib)
 
             try:
                 from app import db
                 db.session.commit()
+                detector_changed.send(id)
                 logger.info(f"Detector updated: ID={id}, Running={detector.running}")
                 flash('Detector updated successfully!', 'success')
                 from app import detector_manager
@@ -80,6 +97,11 @@ def edit_detector(id):
     form.camera_id.data = detector.camera_id
     form.model_id.data = detector.model_id
     form.running.data = detector.running
+    form.min_fps.data = detector.min_fps
+    form.max_fps.data = detector.max_fps
+    form.weight.data = detector.weight
+    form.model_variant.data = detector.model_variant or 'float'
+    form.overlay.data = detector.overlay or 'server'
 
     return render_template('detector/edit_detector.html', form=form, detector=detector)
 
@@ -99,7 +121,7 @@ def view_detector(id):
         flash('Camera is not active. Please turn it on first.', 'warning')
         return redirect(url_for('detector.main_detector'))
 
-    if not model or not model.model_file:
+    if not model or not model.model_digest:
         flash('Model file is missing. Please upload the model file again.', 'danger')
         return redirect(url_for('detector.main_detector'))
 
@@ -109,7 +131,9 @@ def view_detector(id):
 def get_fps_info(id):
     fps_info = detector_fps_info.get(id, {
         'fps': 0.0,
+        'target_fps': 0.0,
         'inference_time': 0.0,
+        'queue_delay': 0.0,
         'detections': 0,
         'last_update': 0
     })
@@ -119,85 +143,172 @@ def get_fps_info(id):
     if current_time - fps_info.get('last_update', 0) > 5:
         fps_info = {
             'fps': 0.0,
+            'target_fps': 0.0,
             'inference_time': 0.0,
+            'queue_delay': 0.0,
             'detections': 0,
             'last_update': current_time
         }
 
     return jsonify(fps_info)
 
+@detector.route('/inference_stats')
+def get_inference_stats():
+    from app import detector_manager
+    return jsonify(detector_manager.get_inference_stats())
+
+@detector.route('/scheduler_stats')
+def get_scheduler_stats():
+    from app.utils.scheduler import frame_rate_scheduler
+    return jsonify(frame_rate_scheduler.get_stats())
+
+@detector.route('/persistence_stats')
+def get_persistence_stats():
+    from app.utils.detection_writer import detection_writer
+    return jsonify(detection_writer.get_stats())
+
+@detector.route('/analytics')
+def detection_analytics():
+    """Detection counts per detector and class, e.g.
+    /detector/analytics?granularity=hour&start=2024-01-01T00:00:00&end=2024-01-02T00:00:00&detector_id=1&class_name=person
+
+    count is the number of objects seen in the detector's sampled frames, one frame stored
+    per DETECTION_RECORD_INTERVAL, so an object that stays in view adds to it on every
+    sampled frame. frames is the number of sampled frames in the bucket and per_frame is
+    count / frames, the average number of objects in view, which stays comparable when the
+    record interval changes. per_frame is null for buckets without sampled frames.
+
+    Naive times are taken as UTC. Without start/end the last 24 hours are returned.
+    """
+    from app.utils.analytics import GRANULARITIES, MAX_BUCKETS, parse_timestamp, query_rollups
+
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+    try:
+        end = parse_timestamp(request.args['end']) if 'end' in request.args else datetime.utcnow()
+        start = parse_timestamp(request.args['start']) if 'start' in request.args else end - timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO 8601 timestamps'}), 400
+
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+    if (end - start) / GRANULARITIES[granularity] > MAX_BUCKETS:
+        return jsonify({'error': f'Range too large for {granularity} buckets, use a coarser granularity'}), 400
+
+    series = query_rollups(
+        granularity, start, end,
+        detector_ids=request.args.getlist('detector_id', type=int),
+        class_names=request.args.getlist('class_name'),
+        fill=request.args.get('fill', '1') != '0'
+    )
+    return jsonify({
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': series
+    })
+
 @detector.route('/stream_detector/<int:id>')
 def stream_detector(id):
     from flask import current_app
     from app import detector_manager
 
     tracking = request.args.get('tracking', 'false').lower() == 'true'
+    tier = request.args.get('tier', DEFAULT_STREAM_TIER)
+    if tier not in STREAM_TIERS:
+        return "Unknown stream tier", 400
 
     detector_obj = Detector.query.get(id)
     if not detector_obj or not detector_obj.running:
         logger.warning(f"Attempted to stream inactive or non-existent detector {id}")
         return "Detector is off or does not exist", 400
 
-    detector_manager.update_detectors(tracking_status={id: tracking})
+    # Listing page thumbnails leave out tracking so they don't switch the detector's mode
+    if 'tracking' in request.args:
+        detector_manager.update_detectors(tracking_status={id: tracking})
 
 
-    def generate_frames(detector_id, app):
+    def generate_frames(detector_id, app, tier):
+        channel = get_annotated_channel(detector_id)
         frame_count = 0
         max_empty_frames = 150  # ~5 detik pada 30fps
         empty_frame_count = 0
         last_check_time = time.time()
+        last_seq = None
+        min_interval = tier_interval(tier)
+        last_sent_at = 0.0
 
-        logger.info(f"Starting detector frame generation for detector {detector_id}")
+        logger.info(f"Starting detector frame generation for detector {detector_id}, tier: {tier}")
+        metrics_source = f"detector:{detector_id}"
+        stream_clients.inc(source=metrics_source)
+        # The detector only draws annotated frames while someone is watching
+        channel.add_viewer()
 
-        while True:
-            try:
-                current_time = time.time()
+        try:
+            while True:
+                try:
+                    current_time = time.time()
 
-                if current_time - last_check_time >= 1.0:
-                    with app.app_context():
-                        current_detector = Detector.query.get(detector_id)
-                        if not current_detector or not current_detector.running:
+                    if current_time - last_check_time >= 1.0:
+                        current_detector = state_cache.get_detector(detector_id)
+                        if not current_detector or not current_detector['running']:
                             logger.info(f"Detector {detector_id} became inactive during streaming")
                             break
 
-                        current_camera = Camera.query.get(current_detector.camera_id)
-                        if not current_camera or not current_camera.status:
+                        if not state_cache.is_camera_active(current_detector['camera_id']):
                             logger.info(f"Camera for detector {detector_id} became inactive during streaming")
                             break
 
-                    last_check_time = current_time
-
-                frame = annotated_frames.get(detector_id)
-                if frame is not None:
-                    empty_frame_count = 0 
-
-                    encode_params = [cv2.IMWRITE_JPEG_QUALITY, 85]
-                    ret, buffer = cv2.imencode('.jpg', frame, encode_params)
-
-                    if ret:
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-                        frame_count += 1
+                        last_check_time = current_time
+
+                    # Block until the detector publishes a newer annotated frame
+                    seq, frame, meta = channel.wait_for_frame_meta(last_seq, timeout=0.033)
+                    if frame is not None:
+                        empty_frame_count = 0 
+                        last_seq = seq
+
+                        if time.time() - last_sent_at < min_interval:
+                            # Over the tier's frame rate, skip without encoding
+                            continue
+
+                        # Encoded once per annotated frame and tier and shared with every viewer of that tier
+                        jpeg = frame_cache.get_jpeg(('detector', detector_id), seq, frame, tier)
+
+                        if jpeg is not None:
+                            headers = latency_headers(meta['capture_seq'], meta['captured_at'], meta['detected_at']) if meta else None
+                            # Returns once the server has written the part to the client
+                            send_start = time.time()
+                            last_sent_at = send_start
+                            yield mjpeg_part(jpeg, headers)
+                            sent_at = time.time()
+                            stage_seconds.observe(sent_at - send_start, stage='send', source=metrics_source)
+                            if meta:
+                                latency_tracker.record(meta['camera'], 'delivered_detector', sent_at - meta['captured_at'])
+                            frame_count += 1
+                        else:
+                            logger.warning(f"Failed to encode frame for detector {detector_id}")
                     else:
-                        logger.warning(f"Failed to encode frame for detector {detector_id}")
-                else:
-                    empty_frame_count += 1
-                    if empty_frame_count >= max_empty_frames:
-                        logger.warning(f"No annotated frames available for detector {detector_id} for too long, stopping stream")
-                        break
-                    time.sleep(0.033) 
+                        empty_frame_count += 1
+                        if empty_frame_count >= max_empty_frames:
+                            logger.warning(f"No annotated frames available for detector {detector_id} for too long, stopping stream")
+                            break
 
-            except GeneratorExit:
-                logger.info(f"Client disconnected from detector {detector_id} stream")
-                break
-            except Exception as e:
-                logger.error(f"Error in frame generation for detector {detector_id}: {e}")
-                break
+                except GeneratorExit:
+                    logger.info(f"Client disconnected from detector {detector_id} stream")
+                    break
+                except Exception as e:
+                    logger.error(f"Error in frame generation for detector {detector_id}: {e}")
+                    break
+        finally:
+            channel.remove_viewer()
+            stream_clients.dec(source=metrics_source)
 
         logger.info(f"Detector frame generation stopped for detector {detector_id}. Total frames: {frame_count}")
 
     return Response(
-        generate_frames(id, current_app._get_current_object()),
+        generate_frames(id, current_app._get_current_object(), tier),
         mimetype='multipart/x-mixed-replace; boundary=frame',
         headers={
             'Cache-Control': 'no-cache, no-store, must-revalidate',
@@ -206,12 +317,97 @@ def stream_detector(id):
         }
     )
 
+@detector.route('/snapshot_detector/<int:id>')
+def snapshot_detector(id):
+    """Latest annotated frame as a single JPEG, polled by the listing page previews when streams go over MJPEG."""
+    tier = request.args.get('tier', DEFAULT_STREAM_TIER)
+    if tier not in STREAM_TIERS:
+        return "Unknown stream tier", 400
+
+    current_detector = state_cache.get_detector(id)
+    if not current_detector or not current_detector['running']:
+        return "Detector is off or does not exist", 400
+
+    # Counts as a viewer for a while, the detector only annotates frames someone watches
+    channel = get_annotated_channel(id)
+    channel.add_viewer()
+    timer = threading.Timer(SNAPSHOT_LINGER, channel.remove_viewer)
+    timer.daemon = True
+    timer.start()
+
+    seq, frame = channel.wait_for_frame(None, timeout=SNAPSHOT_TIMEOUT)
+    if frame is None:
+        return "No frame available", 503
+    jpeg = frame_cache.get_jpeg(('detector', id), seq, frame, tier)
+    if jpeg is None:
+        return "Failed to encode frame", 500
+
+    return Response(jpeg, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache, no-store, must-revalidate'})
+
+@detector.route('/detections/<int:id>')
+def stream_detections(id):
+    """Server-sent events with each frame's detections as JSON, drawn over the camera stream by the browser."""
+    from app import detector_manager
+
+    current_detector = state_cache.get_detector(id)
+    if not current_detector or not current_detector['running']:
+        return "Detector is off or does not exist", 400
+
+    # Only a client that asks for a tracking mode changes it, other viewers leave it alone
+    if 'tracking' in request.args:
+        tracking = request.args.get('tracking').lower() == 'true'
+        detector_manager.update_detectors(tracking_status={id: tracking})
+
+    def generate_events(detector_id):
+        channel = get_detection_channel(detector_id)
+        metrics_source = f"detections:{detector_id}"
+        last_seq = None
+        last_check_time = time.time()
+        stream_clients.inc(source=metrics_source)
+
+        try:
+            # Tells EventSource how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while True:
+                if time.time() - last_check_time >= 1.0:
+                    last_check_time = time.time()
+                    current_detector = state_cache.get_detector(detector_id)
+                    if not current_detector or not current_detector['running']:
+                        break
+                    if not state_cache.is_camera_active(current_detector['camera_id']):
+                        break
+
+                seq, payload, meta = channel.wait_for_frame_meta(last_seq, timeout=1.0)
+                if payload is None:
+                    # Keeps proxies from closing an idle connection and notices disconnects
+                    yield ": keepalive\n\n"
+                    continue
+
+                last_seq = seq
+                yield f"data: {payload}\n\n"
+                if meta:
+                    latency_tracker.record(meta['camera'], 'delivered_detections', time.time() - meta['captured_at'])
+        except GeneratorExit:
+            logger.info(f"Client disconnected from detector {detector_id} detections")
+        finally:
+            stream_clients.dec(source=metrics_source)
+
+    return Response(
+        generate_events(id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @detector.route('/delete_detector/<int:id>', methods=['POST'])
 def delete_detector(id):
     detector = Detector.query.get_or_404(id)
     from app import db
     db.session.delete(detector)
     db.session.commit()
+    detector_changed.send(id)
     logger.info(f"Detector deleted: ID={id}")
     flash('Detector deleted successfully!', 'success')
     from app import detector_manager
@@ -223,6 +419,7 @@ def delete_all_detectors():
     from app import db
     Detector.query.delete()
     db.session.commit()
+    detector_changed.send(None)
     logger.info("All detectors deleted")
     flash('All detectors deleted successfully!', 'success')
     from app import detector_manager
@@ -1,10 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from app.models import db, Model
+from app.models import db, Model, ModelArtifact
 from app.forms import ModelForm
 from datetime import datetime 
 import pytz
 from flask import jsonify
 import logging
+from app.utils.model_registry import model_registry
+from app.utils.model_store import model_store
+from app.utils.model_export import model_exporter, discard_artifacts
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +21,12 @@ ALLOWED_MODEL_EXTENSIONS = {'pt'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_MODEL_EXTENSIONS
 
+def discard_unused_weights(digest):
+    # Identical uploads share one stored file, only remove it once no model refers to it
+    if digest and not db.session.query(Model.id).filter_by(model_digest=digest).first():
+        model_store.delete(digest)
+        discard_artifacts(digest)
+
 @model.route('/setting', methods=['GET', 'POST'])
 def setting_model():
     form = ModelForm()
@@ -26,12 +35,14 @@ def setting_model():
         original_filename = file.filename
         
         if file and allowed_file(file.filename):
-            file_data = file.read()
+            # Streamed to the model store in chunks instead of buffering the whole file
+            digest, size = model_store.save_stream(file.stream)
             now = datetime.now(wib)
 
             new_model = Model(
                 model_name=form.model_name.data,
-                model_file=file_data, 
+                model_digest=digest,
+                file_size=size,
                 original_filename=original_filename,  
                 created_at=now,      
                 updated_at=now      
@@ -39,26 +50,37 @@ def setting_model():
 
             db.session.add(new_model)
             db.session.commit()
+            if form.export_onnx.data:
+                # Detectors switch to the export once it is built, until then they use the .pt file
+                model_exporter.submit(digest, 'onnx')
             flash('Model added successfully!', 'success')
             return redirect(url_for('model.setting_model'))
         else:
             flash('Invalid file format! Please upload a .pt file.', 'danger')
 
     models = Model.query.all()
-    return render_template('detection/model.html', form=form, models=models)
+    artifacts = {(artifact.model_digest, artifact.variant): artifact for artifact in ModelArtifact.query.all()}
+    return render_template('detection/model.html', form=form, models=models, artifacts=artifacts)
 
 @model.route('/delete_model/<int:id>', methods=['POST'])
 def delete_model(id):
     model = Model.query.get_or_404(id)
+    digest = model.model_digest
     db.session.delete(model)
     db.session.commit()
+    model_registry.invalidate(id)
+    discard_unused_weights(digest)
     flash('Model deleted successfully!', 'success')
     return redirect(url_for('model.setting_model'))
 
 @model.route('/delete_all_models', methods=['POST'])
 def delete_all_models():
+    models = db.session.query(Model.id, Model.model_digest).all()
     Model.query.delete()
     db.session.commit()
+    for model_id, digest in models:
+        model_registry.invalidate(model_id)
+        discard_unused_weights(digest)
     flash('All models deleted successfully!', 'success')
     return redirect(url_for('model.setting_model'))
 
@@ -74,18 +96,76 @@ def edit_model(id):
     if form.validate_on_submit():
         model.model_name = form.model_name.data
 
+        old_digest = model.model_digest
         if form.model_file.data:
             file = form.model_file.data
             if allowed_file(file.filename):
-                model.model_file = file.read()  
+                model.model_digest, model.file_size = model_store.save_stream(file.stream)
                 model.original_filename = file.filename 
+        weights_changed = model.model_digest != old_digest
 
         model.updated_at = datetime.now(wib)
 
         db.session.commit()
+        # Running detectors notice the stale entry and reload (cheap when only the name changed)
+        model_registry.invalidate(model.id)
+        if weights_changed:
+            discard_unused_weights(old_digest)
+            if form.export_onnx.data:
+                model_exporter.submit(model.model_digest, 'onnx')
         flash('Model updated successfully!', 'success')
         return redirect(url_for('model.setting_model'))
     else:
         flash('Failed to update the model. Please check the form and try again.', 'danger')
 
     return redirect(url_for('model.setting_model'))
+
+@model.route('/export_model/<int:id>', methods=['POST'])
+def export_model(id):
+    model = Model.query.get_or_404(id)
+    if not model.model_digest:
+        flash('Model has no weights to export.', 'danger')
+        return redirect(url_for('model.setting_model'))
+
+    # Rebuilds failed exports, ready ones are kept
+    artifact = ModelArtifact.query.filter_by(model_digest=model.model_digest, variant='onnx').first()
+    model_exporter.submit(model.model_digest, 'onnx', force=artifact is not None and artifact.status == 'failed')
+    flash('ONNX export queued, detectors switch to it once it is ready.', 'success')
+    return redirect(url_for('model.setting_model'))
+
+@model.route('/quantize_model/<int:id>', methods=['POST'])
+def quantize_model(id):
+    model = Model.query.get_or_404(id)
+    if not model.model_digest:
+        flash('Model has no weights to quantise.', 'danger')
+        return redirect(url_for('model.setting_model'))
+
+    # Calibration frames are sampled from the cameras whose detectors use this model
+    artifact = ModelArtifact.query.filter_by(model_digest=model.model_digest, variant='int8').first()
+    model_exporter.submit(model.model_digest, 'int8', force=artifact is not None and artifact.status != 'pending')
+    flash('INT8 quantisation queued, select the INT8 precision on a detector to use it.', 'success')
+    return redirect(url_for('model.setting_model'))
+
+@model.route('/artifacts/<int:id>')
+def model_artifacts(id):
+    model = Model.query.get_or_404(id)
+    artifacts = ModelArtifact.query.filter_by(model_digest=model.model_digest).all()
+    return jsonify({
+        'model_id': model.id,
+        'digest': model.model_digest,
+        'exporter': model_exporter.get_stats(),
+        'artifacts': [
+            {
+                'variant': artifact.variant,
+                'status': artifact.status,
+                'file_size': artifact.file_size,
+                'baseline_latency_ms': artifact.baseline_latency_ms,
+                'latency_ms': artifact.latency_ms,
+                'speedup': round(artifact.speedup, 2) if artifact.speedup else None,
+                'metrics': artifact.metrics_dict,
+                'error': artifact.error,
+                'updated_at': artifact.updated_at.isoformat() if artifact.updated_at else None
+            }
+            for artifact in artifacts
+        ]
+    })
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, BooleanField, SubmitField
+from wtforms import StringField, SelectField, BooleanField, SubmitField, FloatField, TextAreaField
 from flask_wtf.file import FileField, FileAllowed
-from wtforms.validators import DataRequired, ValidationError
+from wtforms.validators import DataRequired, ValidationError, Optional, NumberRange
 import re
 
 from flask_wtf import FlaskForm
@@ -23,6 +23,29 @@ class CameraForm(FlaskForm):
         choices=[('Parking Area', 'Parking Area'), ('Main Room', 'Main Room'), ('Entrance', 'Entrance'), ('Droid Cam', 'Droid Cam')],
         validators=[DataRequired()]
     )
+    motion_gate = BooleanField('Motion Gate', default=False)
+    motion_threshold = FloatField('Motion Threshold (% of pixels)', default=0.5, validators=[Optional(), NumberRange(min=0.01, max=100)])
+    motion_refresh = FloatField('Forced Refresh (seconds)', default=10.0, validators=[Optional(), NumberRange(min=1, max=3600)])
+    roi = TextAreaField('Region of Interest', validators=[Optional()])
+    capture_width = SelectField(
+        'Processing Width',
+        choices=[(0, 'Default'), (640, '640 px'), (960, '960 px'), (1280, '1280 px'), (1920, '1920 px'), (3840, '3840 px')],
+        coerce=int,
+        default=0
+    )
+    inference_size = SelectField(
+        'Inference Size',
+        choices=[(0, 'Default'), (320, '320'), (416, '416'), (480, '480'), (640, '640'), (960, '960'), (1280, '1280')],
+        coerce=int,
+        default=0
+    )
+
+    def validate_roi(form, field):
+        from app.utils.roi import parse_roi
+        try:
+            parse_roi(field.data)
+        except ValueError as e:
+            raise ValidationError(str(e))
 
     def validate_ip_address(form, field):
         http_pattern = r"^http:\/\/(?:(?:\d{1,3}\.){3}\d{1,3}|[\w\-\.]+)(?::\d{1,5})?(?:\/video)?$"
@@ -69,10 +92,28 @@ class ModelForm(FlaskForm):
     model_file = FileField('Model File', validators=[
         FileAllowed(['pt'], 'Invalid file format!')
     ])
+    export_onnx = BooleanField('Build ONNX export for CPU inference', default=True)
     submit = SubmitField('Add Model')
 
 class DetectorForm(FlaskForm):
     camera_id = SelectField('Camera', choices=[], validators=[DataRequired()], coerce=int)
     model_id = SelectField('Model', choices=[], validators=[DataRequired()], coerce=int)
     running = BooleanField('Running', default=False)
-    submit = SubmitField('Add Detector')
\ No newline at end of file
+    min_fps = FloatField('Min FPS', default=1.0, validators=[Optional(), NumberRange(min=0.1, max=60)])
+    max_fps = FloatField('Max FPS', default=15.0, validators=[Optional(), NumberRange(min=0.1, max=60)])
+    weight = FloatField('Priority Weight', default=1.0, validators=[Optional(), NumberRange(min=0.1, max=100)])
+    model_variant = SelectField(
+        'Precision',
+        choices=[('float', 'Float'), ('int8', 'INT8 (quantised, when available)')],
+        default='float'
+    )
+    overlay = SelectField(
+        'Overlay',
+        choices=[('server', 'Server (annotated stream)'), ('client', 'Browser (detections only)')],
+        default='server'
+    )
+    submit = SubmitField('Add Detector')
+
+    def validate_max_fps(form, field):
+        if field.data is not None and form.min_fps.data is not None and field.data < form.min_fps.data:
+            raise ValidationError('Max FPS must not be lower than Min FPS.')
\ No newline at end of file
@@ -1,5 +1,6 @@
 from app.extensions import db
 from datetime import datetime
+import json
 
 
 class Camera(db.Model):
@@ -8,6 +9,15 @@ class Camera(db.Model):
     ip_address = db.Column(db.String(100), nullable=False)
     status = db.Column(db.Boolean, default=False)
     type = db.Column(db.String(50), nullable=False)
+    # Motion gate: skip inference unless this percent of pixels changed, but re-run every motion_refresh seconds
+    motion_gate = db.Column(db.Boolean, default=False)
+    motion_threshold = db.Column(db.Float, default=0.5)
+    motion_refresh = db.Column(db.Float, default=10.0)
+    # Region of interest, JSON list of [x, y] points as fractions of the frame size, empty for the full frame
+    roi = db.Column(db.Text)
+    # Processing width applied on the capture thread and model input size, empty for the global defaults
+    capture_width = db.Column(db.Integer)
+    inference_size = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
@@ -19,7 +29,10 @@ class Model(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     model_name = db.Column(db.String(120), index=True)
     original_filename = db.Column(db.String(120)) 
-    model_file = db.Column(db.LargeBinary)
+    # Weights live in the content-addressed model store, the blob is only read by the legacy migration
+    model_file = db.deferred(db.Column(db.LargeBinary))
+    model_digest = db.Column(db.String(64), index=True)
+    file_size = db.Column(db.BigInteger)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
@@ -27,11 +40,54 @@ class Model(db.Model):
         return f'<Model {self.model_name}>'
 
 
+class ModelArtifact(db.Model):
+    """A CPU-optimised build of a model's weights, stored in the model store next to the .pt file."""
+    id = db.Column(db.Integer, primary_key=True)
+    # Derived from the weights, so identical uploads share their exports
+    model_digest = db.Column(db.String(64), nullable=False, index=True)
+    variant = db.Column(db.String(20), nullable=False)  # onnx or int8
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, ready or failed
+    file_size = db.Column(db.BigInteger)
+    # Latency of the source .pt model and of this artifact, measured on the same input at export time
+    baseline_latency_ms = db.Column(db.Float)
+    latency_ms = db.Column(db.Float)
+    # JSON, e.g. accuracy drift of a quantised variant against the float model
+    metrics = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('model_digest', 'variant', name='uq_model_artifact_variant'),
+    )
+
+    @property
+    def metrics_dict(self):
+        return json.loads(self.metrics) if self.metrics else {}
+
+    @property
+    def speedup(self):
+        if self.latency_ms and self.baseline_latency_ms:
+            return self.baseline_latency_ms / self.latency_ms
+        return None
+
+    def __repr__(self):
+        return f'<ModelArtifact {self.variant} {self.model_digest[:12]} {self.status}>'
+
+
 class Detector(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False) 
     model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False) 
     running = db.Column(db.Boolean, default=False)
+    # Frame rate scheduler limits, the weight sets this detector's share of spare capacity
+    min_fps = db.Column(db.Float, default=1.0)
+    max_fps = db.Column(db.Float, default=15.0)
+    weight = db.Column(db.Float, default=1.0)
+    # float runs the .pt weights or their ONNX export, int8 the quantised export when it exists
+    model_variant = db.Column(db.String(10), default='float')
+    # 'server' streams annotated JPEGs, 'client' only publishes detections for the browser to draw
+    overlay = db.Column(db.String(10), default='server')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
@@ -43,12 +99,49 @@ class Detector(db.Model):
 
 
 class ObjectDetected(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    detector_id = db.Column(db.Integer, db.ForeignKey('detector.id'), nullable=False)  
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    detector_id = db.Column(db.Integer, db.ForeignKey('detector.id', ondelete='CASCADE'), nullable=False)  
+    class_id = db.Column(db.Integer, nullable=False)
+    class_name = db.Column(db.String(64))
+    confidence = db.Column(db.Float, nullable=False)
+    x1 = db.Column(db.Float, nullable=False)
+    y1 = db.Column(db.Float, nullable=False)
+    x2 = db.Column(db.Float, nullable=False)
+    y2 = db.Column(db.Float, nullable=False)
+    track_id = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
     
-    detector = db.relationship('Detector', backref='objects_detected')  
+    detector = db.relationship('Detector', backref=db.backref('objects_detected', lazy='dynamic', passive_deletes=True))  
+
+    __table_args__ = (
+        db.Index('ix_object_detected_detector_created', 'detector_id', 'created_at'),
+    )
 
     def __repr__(self):
         return f'<ObjectDetected Detector ID {self.detector_id}>'
+
+
+class DetectionRollup(db.Model):
+    """Detection counts per detector, class and time bucket, maintained by the detection writer.
+
+    Counts come from sampled frames (one per DETECTION_RECORD_INTERVAL), so a static object
+    adds to every bucket it is seen in. The detector-wide row (empty class_name) also counts
+    the sampled frames, the denominator for objects per frame.
+    """
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    detector_id = db.Column(db.Integer, db.ForeignKey('detector.id', ondelete='CASCADE'), nullable=False)
+    class_name = db.Column(db.String(64), nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)  # minute, hour or day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    frames = db.Column(db.BigInteger, nullable=False, default=0)  # Sampled frames, detector-wide rows only
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('detector_id', 'class_name', 'granularity', 'bucket_start', name='uq_detection_rollup_bucket'),
+        db.Index('ix_detection_rollup_range', 'granularity', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f'<DetectionRollup Detector ID {self.detector_id} {self.class_name} {self.granularity} {self.bucket_start}>'
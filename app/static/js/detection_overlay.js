@@ -0,0 +1,90 @@
+// Draws a detector's boxes, received as server-sent events, on a canvas laid over
+// the raw camera stream. The server sends detections only, no annotated frames.
+class DetectionOverlay {
+  constructor(img, canvas) {
+    this.img = img;
+    this.canvas = canvas;
+    this.source = null;
+    this.latest = null;
+    this.onupdate = null;
+    this._redraw = () => this.draw();
+    window.addEventListener("resize", this._redraw);
+    img.addEventListener("load", this._redraw);
+  }
+
+  start(url) {
+    this.stop();
+    this.source = new EventSource(url);
+    this.source.onmessage = (event) => {
+      this.latest = JSON.parse(event.data);
+      this.draw();
+      if (this.onupdate) this.onupdate(this.latest);
+    };
+  }
+
+  stop() {
+    if (this.source) {
+      this.source.close();
+      this.source = null;
+    }
+    this.latest = null;
+    this.draw();
+  }
+
+  static color(classId) {
+    return `hsl(${(classId * 47) % 360}, 90%, 50%)`;
+  }
+
+  draw() {
+    const ratio = window.devicePixelRatio || 1;
+    const width = this.canvas.clientWidth;
+    const height = this.canvas.clientHeight;
+    this.canvas.width = Math.round(width * ratio);
+    this.canvas.height = Math.round(height * ratio);
+
+    const ctx = this.canvas.getContext("2d");
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.clearRect(0, 0, width, height);
+
+    const data = this.latest;
+    if (!data || !data.width || !data.height) return;
+
+    // The img uses object-contain, find where the frame actually sits
+    const scale = Math.min(width / data.width, height / data.height);
+    const offsetX = (width - data.width * scale) / 2;
+    const offsetY = (height - data.height * scale) / 2;
+    const x = (value) => offsetX + value * scale;
+    const y = (value) => offsetY + value * scale;
+
+    if (data.roi) {
+      ctx.strokeStyle = "rgb(255, 255, 0)";
+      ctx.lineWidth = 2;
+      ctx.beginPath();
+      data.roi.forEach(([px, py], index) => {
+        const method = index === 0 ? "moveTo" : "lineTo";
+        ctx[method](x(px * data.width), y(py * data.height));
+      });
+      ctx.closePath();
+      ctx.stroke();
+    }
+
+    ctx.font = "12px sans-serif";
+    ctx.textBaseline = "bottom";
+    for (const [x1, y1, x2, y2, confidence, classId, trackId] of data.detections) {
+      const color = DetectionOverlay.color(classId);
+      let label = `${data.names[classId] ?? classId} ${confidence.toFixed(2)}`;
+      if (trackId >= 0) label = `id:${trackId} ${label}`;
+
+      ctx.strokeStyle = color;
+      ctx.lineWidth = 2;
+      ctx.strokeRect(x(x1), y(y1), (x2 - x1) * scale, (y2 - y1) * scale);
+
+      const textWidth = ctx.measureText(label).width + 6;
+      const top = Math.max(y(y1), 16);
+      ctx.fillStyle = color;
+      ctx.fillRect(x(x1), top - 16, textWidth, 16);
+      ctx.fillStyle = "#fff";
+      ctx.fillText(label, x(x1) + 3, top - 2);
+    }
+  }
+}
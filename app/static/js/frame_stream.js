@@ -0,0 +1,88 @@
+// Shows a camera or detector stream in an <img>, pushed over a WebSocket when the
+// server supports it (ASGI) and through the MJPEG endpoint otherwise.
+//
+// WebSocket messages are binary: 4-byte big-endian header length, JSON header, JPEG.
+// The img keeps firing load/error events in both modes, so page handlers work unchanged.
+class FrameStream {
+  constructor(img, transport = "auto") {
+    this.img = img;
+    this.transport = transport;
+    this.socket = null;
+    this.objectUrl = null;
+    this.mode = null;
+    this.stats = null;
+    this.onframe = null;
+    // Called instead of opening the MJPEG stream when set, e.g. to poll snapshots
+    this.fallback = null;
+  }
+
+  start(wsPath, mjpegUrl) {
+    this.stop();
+    this.mjpegUrl = mjpegUrl;
+    if (this.transport === "mjpeg" || !("WebSocket" in window)) {
+      this._useMjpeg();
+      return;
+    }
+
+    const scheme = location.protocol === "https:" ? "wss:" : "ws:";
+    const socket = new WebSocket(`${scheme}//${location.host}${wsPath}`);
+    socket.binaryType = "arraybuffer";
+    let opened = false;
+
+    socket.onopen = () => {
+      opened = true;
+      this.mode = "websocket";
+    };
+    socket.onmessage = (event) => this._show(event.data);
+    socket.onclose = () => {
+      if (this.socket !== socket) return; // Replaced by a newer start()
+      this.socket = null;
+      if (!opened && this.transport === "auto") {
+        // No WebSocket endpoint on this server (e.g. the Flask dev server)
+        this._useMjpeg();
+        return;
+      }
+      this.img.dispatchEvent(new Event("error"));
+    };
+    this.socket = socket;
+  }
+
+  stop() {
+    if (this.socket) {
+      const socket = this.socket;
+      this.socket = null;
+      socket.close();
+    }
+    if (this.objectUrl) {
+      URL.revokeObjectURL(this.objectUrl);
+      this.objectUrl = null;
+    }
+    this.mode = null;
+  }
+
+  _useMjpeg() {
+    this.mode = "mjpeg";
+    if (this.fallback) {
+      this.fallback();
+      return;
+    }
+    const separator = this.mjpegUrl.includes("?") ? "&" : "?";
+    this.img.src = `${this.mjpegUrl}${separator}t=${Date.now()}`;
+  }
+
+  _show(buffer) {
+    const headerLength = new DataView(buffer).getUint32(0);
+    const header = JSON.parse(
+      new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength))
+    );
+    const jpeg = new Uint8Array(buffer, 4 + headerLength);
+
+    const previousUrl = this.objectUrl;
+    this.objectUrl = URL.createObjectURL(new Blob([jpeg], { type: "image/jpeg" }));
+    this.img.src = this.objectUrl;
+    if (previousUrl) URL.revokeObjectURL(previousUrl);
+
+    this.stats = header;
+    if (this.onframe) this.onframe(header);
+  }
+}
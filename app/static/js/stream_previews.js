@@ -0,0 +1,39 @@
+// Thumbnail previews on the listing pages. Each preview is live over a WebSocket;
+// without one it would hold an HTTP/1.1 connection for good, and a handful of rows
+// would use up the browser's per-host limit, so snapshots are polled instead.
+const SNAPSHOT_INTERVAL = 2000;
+
+function startPreviews(transport) {
+  const previews = [];
+
+  document.querySelectorAll("img[data-preview-ws]").forEach((img) => {
+    const stream = new FrameStream(img, transport);
+    const snapshotUrl = img.dataset.previewSnapshot;
+    const separator = snapshotUrl.includes("?") ? "&" : "?";
+    let timer = null;
+
+    const poll = () => {
+      img.src = `${snapshotUrl}${separator}t=${Date.now()}`;
+    };
+    const start = () => stream.start(img.dataset.previewWs, snapshotUrl);
+
+    stream.fallback = () => {
+      if (timer) return;
+      poll();
+      timer = setInterval(poll, SNAPSHOT_INTERVAL);
+    };
+    img.onerror = () => {
+      if (timer) return; // The next poll retries
+      stream.stop();
+      setTimeout(start, 5000); // Retry after 5s
+    };
+
+    previews.push(() => {
+      clearInterval(timer);
+      stream.stop();
+    });
+    start();
+  });
+
+  window.addEventListener("pagehide", () => previews.forEach((stop) => stop()));
+}
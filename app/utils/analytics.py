@@ -0,0 +1,156 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Rollup granularities and the bucket width used to fill gaps in a series
+GRANULARITIES = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1)
+}
+
+# Largest number of buckets a single analytics request may span
+MAX_BUCKETS = 5000
+
+# class_name of a detector's detector-wide rollup rows: every object, and every sampled frame
+ALL_CLASSES = ''
+
+
+def bucket_start(timestamp, granularity):
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 string into a naive UTC datetime, the way detections are stored."""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def rollup_counts(rows, frames=()):
+    """Count ObjectDetected rows and sampled frames per (detector_id, class_name, granularity, bucket_start).
+
+    frames holds a (detector_id, timestamp) pair per sampled frame, including frames
+    without detections. Returns {key: (objects, frames)}; only ALL_CLASSES keys count frames.
+    """
+    objects = Counter()
+    sampled = Counter()
+    for row in rows:
+        class_name = row['class_name'] or str(row['class_id'])
+        for granularity in GRANULARITIES:
+            start = bucket_start(row['created_at'], granularity)
+            objects[(row['detector_id'], class_name, granularity, start)] += 1
+            objects[(row['detector_id'], ALL_CLASSES, granularity, start)] += 1
+    for detector_id, timestamp in frames:
+        for granularity in GRANULARITIES:
+            sampled[(detector_id, ALL_CLASSES, granularity, bucket_start(timestamp, granularity))] += 1
+    return {key: (objects[key], sampled[key]) for key in set(objects) | set(sampled)}
+
+
+def apply_rollups(session, counts):
+    """Add counts to the rollup table inside the caller's transaction.
+
+    Only the detection writer thread calls this, so update-then-insert cannot race
+    with another writer of the same bucket.
+    """
+    from app.models import DetectionRollup
+
+    new_buckets = []
+    for (detector_id, class_name, granularity, start), (count, frames) in counts.items():
+        updated = session.query(DetectionRollup).filter_by(
+            detector_id=detector_id,
+            class_name=class_name,
+            granularity=granularity,
+            bucket_start=start
+        ).update({
+            DetectionRollup.count: DetectionRollup.count + count,
+            DetectionRollup.frames: DetectionRollup.frames + frames
+        }, synchronize_session=False)
+        if not updated:
+            new_buckets.append({
+                'detector_id': detector_id,
+                'class_name': class_name,
+                'granularity': granularity,
+                'bucket_start': start,
+                'count': count,
+                'frames': frames,
+                'updated_at': datetime.utcnow()
+            })
+
+    if new_buckets:
+        session.bulk_insert_mappings(DetectionRollup, new_buckets)
+
+
+def query_rollups(granularity, start, end, detector_ids=None, class_names=None, fill=True):
+    """Read a time series from the rollup table.
+
+    Returns one series per (detector_id, class_name) with buckets in [start, end).
+    Every point carries the detector's sampled frames in that bucket and the average
+    objects per sampled frame (None for buckets written before frames were counted).
+    With fill=True, buckets without detections are returned with a count of 0.
+    """
+    from app.models import DetectionRollup
+
+    start = bucket_start(start, granularity)
+    query = DetectionRollup.query.filter(
+        DetectionRollup.granularity == granularity,
+        DetectionRollup.bucket_start >= start,
+        DetectionRollup.bucket_start < end
+    )
+    if detector_ids:
+        query = query.filter(DetectionRollup.detector_id.in_(detector_ids))
+    if class_names:
+        query = query.filter(DetectionRollup.class_name.in_(list(class_names) + [ALL_CLASSES]))
+
+    series = {}
+    frames = {}
+    for rollup in query.order_by(DetectionRollup.bucket_start.asc()):
+        if rollup.class_name == ALL_CLASSES:
+            frames.setdefault(rollup.detector_id, {})[rollup.bucket_start] = rollup.frames
+            continue
+        key = (rollup.detector_id, rollup.class_name)
+        series.setdefault(key, {})[rollup.bucket_start] = rollup.count
+
+    step = GRANULARITIES[granularity]
+    buckets = []
+    current = start
+    while fill and current < end:
+        buckets.append(current)
+        current += step
+
+    response = []
+    for (detector_id, class_name), points in sorted(series.items()):
+        timeline = buckets if fill else sorted(points)
+        sampled = frames.get(detector_id, {})
+        total = sum(points.values())
+        total_frames = sum(sampled.values())
+        response.append({
+            'detector_id': detector_id,
+            'class_name': class_name,
+            'total': total,
+            'frames': total_frames,
+            'per_frame': per_frame(total, total_frames),
+            'points': [
+                {
+                    'bucket_start': b.isoformat(),
+                    'count': points.get(b, 0),
+                    'frames': sampled.get(b, 0),
+                    'per_frame': per_frame(points.get(b, 0), sampled.get(b, 0))
+                }
+                for b in timeline
+            ]
+        })
+    return response
+
+
+def per_frame(count, frames):
+    return round(count / frames, 3) if frames else None
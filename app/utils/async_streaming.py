@@ -0,0 +1,369 @@
+import asyncio
+import threading
+import time
+import logging
+import itertools
+from .cctv import camera_stream_manager
+from .detector import get_annotated_channel, get_detection_channel
+from .state_cache import state_cache
+from .streaming import frame_cache, tier_interval
+from .metrics import metrics, source_label
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+client_frames_dropped = metrics.counter(
+    'detectorcam_client_frames_dropped_total',
+    'Encoded frames discarded because an async viewer had not taken the previous ones.',
+    ('source',)
+)
+
+
+class EncodedFrame:
+    """A frame as handed to async viewers: JPEG bytes plus its tracing metadata."""
+
+    __slots__ = ('seq', 'jpeg', 'camera', 'capture_seq', 'captured_at', 'detected_at')
+
+    def __init__(self, seq, jpeg, camera, capture_seq, captured_at, detected_at=None):
+        self.seq = seq
+        self.jpeg = jpeg
+        self.camera = camera
+        self.capture_seq = capture_seq
+        self.captured_at = captured_at
+        self.detected_at = detected_at
+
+
+class DetectionEvent:
+    """One frame's detection metadata (a JSON string) as handed to async viewers."""
+
+    __slots__ = ('seq', 'data', 'camera', 'capture_seq', 'captured_at', 'detected_at')
+
+    def __init__(self, seq, data, camera, capture_seq, captured_at, detected_at=None):
+        self.seq = seq
+        self.data = data
+        self.camera = camera
+        self.capture_seq = capture_seq
+        self.captured_at = captured_at
+        self.detected_at = detected_at
+
+
+class StreamSubscriber:
+    """One async viewer. Holds at most queue_size frames, a slow viewer loses the oldest.
+
+    tier is the stream tier it is sent, None for sources without tiers (detections).
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, loop, source_key, queue_size=2, transport='mjpeg', tier=None):
+        self.id = next(self.ids)
+        self.loop = loop
+        self.source_key = source_key
+        self.transport = transport
+        self.tier = tier
+        # Pump the viewer joined, set by the hub; it may have finished by the time the viewer leaves
+        self.pump = None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.time()
+        self.delivered = 0
+        self.dropped = 0
+
+    def offer(self, frame):
+        # Runs on the subscriber's event loop
+        if frame is not None and self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            client_frames_dropped.inc(source=source_label(self.source_key))
+        elif frame is None and self.queue.full():
+            # End of stream always gets through
+            self.queue.get_nowait()
+        self.queue.put_nowait(frame)
+
+    async def next_frame(self):
+        """The next frame to send, or None once the source has ended."""
+        return await self.queue.get()
+
+    def get_stats(self):
+        return {
+            'id': self.id,
+            'transport': self.transport,
+            'tier': self.tier,
+            'connected_for': round(time.time() - self.connected_at, 1),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'queued': self.queue.qsize()
+        }
+
+
+class SourcePump(threading.Thread):
+    """Reads one camera or detector source and fans each encoded frame out to its async viewers.
+
+    One thread per source regardless of the number of viewers. Each frame is encoded
+    once per tier its viewers asked for, through the shared frame cache, so the sync
+    and async paths share the same JPEG bytes.
+    """
+
+    def __init__(self, hub, source_key, idle_timeout=5.0):
+        kind, ident = source_key
+        super().__init__(name=f"SourcePump-{kind}-{ident}", daemon=True)
+        self.hub = hub
+        self.source_key = source_key
+        self.idle_timeout = idle_timeout
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.running = True
+        self.tier_sent_at = {}
+
+    def add(self, subscriber):
+        with self.lock:
+            self.subscribers.add(subscriber)
+
+    def remove(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _broadcast(self, frames):
+        """Offer each subscriber the entry for its tier; frames=None ends every stream."""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if frames is None:
+                frame = None
+            elif subscriber.tier in frames:
+                frame = frames[subscriber.tier]
+            else:
+                continue
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, frame)
+            except RuntimeError:
+                # The viewer's event loop already closed
+                self.remove(subscriber)
+
+    def _is_active(self):
+        raise NotImplementedError
+
+    def _next_frame(self, last_seq):
+        """Return (seq, {tier: frame}) for the next frame newer than last_seq, or (None, None) on timeout."""
+        raise NotImplementedError
+
+    def _due_tiers(self):
+        # Tiers with a viewer whose frame rate cap allows another frame now
+        with self.lock:
+            tiers = {subscriber.tier for subscriber in self.subscribers}
+        now = time.time()
+        return [tier for tier in tiers if now - self.tier_sent_at.get(tier, 0.0) >= tier_interval(tier)]
+
+    def _encode_tiers(self, seq, frame, tiers):
+        jpegs = {}
+        for tier in tiers:
+            jpeg = frame_cache.get_jpeg(self.source_key, seq, frame, tier)
+            if jpeg is not None:
+                self.tier_sent_at[tier] = time.time()
+                jpegs[tier] = jpeg
+        return jpegs
+
+    def _close(self):
+        pass
+
+    def run(self):
+        logger.info(f"Source pump started for {self.source_key}")
+        last_seq = None
+        last_check_time = 0.0
+        idle_since = None
+
+        try:
+            while self.running:
+                now = time.time()
+                if now - last_check_time >= 1.0:
+                    last_check_time = now
+                    if not self._is_active():
+                        logger.info(f"Source {self.source_key} became inactive, ending its async streams")
+                        break
+
+                    with self.lock:
+                        has_subscribers = bool(self.subscribers)
+                    if has_subscribers:
+                        idle_since = None
+                    elif idle_since is None:
+                        idle_since = now
+                    elif now - idle_since >= self.idle_timeout:
+                        break
+
+                seq, frames = self._next_frame(last_seq)
+                if seq is not None:
+                    last_seq = seq
+                    if frames:
+                        self._broadcast(frames)
+
+        except Exception as e:
+            logger.error(f"Error in source pump for {self.source_key}: {e}", exc_info=True)
+        finally:
+            self.hub._pump_finished(self)
+            self._close()
+            self._broadcast(None)
+            logger.info(f"Source pump stopped for {self.source_key}")
+
+    def stop(self):
+        self.running = False
+
+
+class CameraPump(SourcePump):
+    def __init__(self, hub, source_key, idle_timeout=5.0):
+        super().__init__(hub, source_key, idle_timeout)
+        self.camera_ip = source_key[1]
+        self.consumer_id = f"async_{self.camera_ip}"
+        self.camera_stream = None
+
+    def _is_active(self):
+        camera = state_cache.get_camera_by_ip(self.camera_ip)
+        if not camera or not camera['status']:
+            return False
+        if self.camera_stream is None or not self.camera_stream.is_alive():
+            self.camera_stream = camera_stream_manager.get_camera_stream(self.camera_ip, self.consumer_id)
+        return self.camera_stream is not None
+
+    def _next_frame(self, last_seq):
+        if self.camera_stream is None:
+            time.sleep(0.5)
+            return None, None
+
+        frame_ref = self.camera_stream.acquire_frame(last_seq, timeout=0.5)
+        if frame_ref is None:
+            return None, None
+        with frame_ref:
+            jpegs = self._encode_tiers(frame_ref.seq, frame_ref.frame, self._due_tiers())
+        return frame_ref.seq, {
+            tier: EncodedFrame(frame_ref.seq, jpeg, self.camera_ip, frame_ref.seq, frame_ref.captured_at)
+            for tier, jpeg in jpegs.items()
+        }
+
+    def _close(self):
+        camera_stream_manager.release_stream(self.camera_ip, self.consumer_id)
+
+
+class DetectorPump(SourcePump):
+    def __init__(self, hub, source_key, idle_timeout=5.0):
+        super().__init__(hub, source_key, idle_timeout)
+        self.detector_id = source_key[1]
+        self.channel = get_annotated_channel(self.detector_id)
+
+    def add(self, subscriber):
+        # Viewers are counted per subscriber, an idle pump does not keep the detector annotating
+        with self.lock:
+            if subscriber not in self.subscribers:
+                self.subscribers.add(subscriber)
+                self.channel.add_viewer()
+
+    def remove(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.discard(subscriber)
+                self.channel.remove_viewer()
+
+    def _is_active(self):
+        detector = state_cache.get_detector(self.detector_id)
+        return bool(detector and detector['running'] and state_cache.is_camera_active(detector['camera_id']))
+
+    def _next_frame(self, last_seq):
+        seq, frame, meta = self.channel.wait_for_frame_meta(last_seq, timeout=0.5)
+        if frame is None:
+            return None, None
+        jpegs = self._encode_tiers(seq, frame, self._due_tiers())
+        meta = meta or {}
+        return seq, {
+            tier: EncodedFrame(seq, jpeg, meta.get('camera'), meta.get('capture_seq'), meta.get('captured_at'), meta.get('detected_at'))
+            for tier, jpeg in jpegs.items()
+        }
+
+
+class DetectionPump(DetectorPump):
+    def __init__(self, hub, source_key, idle_timeout=5.0):
+        super().__init__(hub, source_key, idle_timeout)
+        self.channel = get_detection_channel(self.detector_id)
+
+    def _next_frame(self, last_seq):
+        seq, payload, meta = self.channel.wait_for_frame_meta(last_seq, timeout=0.5)
+        if payload is None:
+            return None, None
+        meta = meta or {}
+        # Detections have no tiers, every viewer gets the same event
+        return seq, {None: DetectionEvent(seq, payload, meta.get('camera'), meta.get('capture_seq'), meta.get('captured_at'), meta.get('detected_at'))}
+
+
+class AsyncStreamHub:
+    """Shares one pump thread per source between any number of asyncio viewers."""
+
+    pump_classes = {
+        'camera': CameraPump,
+        'detector': DetectorPump,
+        'detections': DetectionPump
+    }
+
+    def __init__(self):
+        self.pumps = {}
+        self.lock = threading.Lock()
+        self.queue_size = 2
+        self.websocket_queue_size = 1
+        self.idle_timeout = 5.0
+
+    def init_app(self, app):
+        self.queue_size = app.config.get('ASYNC_STREAM_QUEUE_SIZE', self.queue_size)
+        self.websocket_queue_size = app.config.get('WEBSOCKET_QUEUE_SIZE', self.websocket_queue_size)
+        self.idle_timeout = app.config.get('ASYNC_STREAM_IDLE_TIMEOUT', self.idle_timeout)
+
+    def subscribe(self, source_key, transport='mjpeg', queue_size=None, tier=None):
+        """Register a viewer of a stream tier on the running event loop and return its StreamSubscriber."""
+        subscriber = StreamSubscriber(asyncio.get_running_loop(), source_key, queue_size or self.queue_size, transport, tier)
+        with self.lock:
+            pump = self.pumps.get(source_key)
+            if pump is None or not pump.running:
+                pump = self.pump_classes[source_key[0]](self, source_key, self.idle_timeout)
+                self.pumps[source_key] = pump
+                pump.start()
+            pump.add(subscriber)
+            subscriber.pump = pump
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        # The pump that counted this viewer, even when it already left the hub after its source went away
+        if subscriber.pump is not None:
+            subscriber.pump.remove(subscriber)
+
+    def _pump_finished(self, pump):
+        # Under the hub lock so a concurrent subscribe starts a fresh pump instead of joining this one
+        with self.lock:
+            pump.running = False
+            if self.pumps.get(pump.source_key) is pump:
+                del self.pumps[pump.source_key]
+
+    def stop_all(self):
+        with self.lock:
+            pumps = list(self.pumps.values())
+        for pump in pumps:
+            pump.stop()
+
+    def get_stats(self):
+        with self.lock:
+            pumps = list(self.pumps.values())
+
+        stats = {}
+        for pump in pumps:
+            with pump.lock:
+                subscribers = list(pump.subscribers)
+            stats[source_label(pump.source_key)] = {
+                'clients': len(subscribers),
+                'tiers': sorted({s.tier for s in subscribers if s.tier}),
+                'delivered': sum(s.delivered for s in subscribers),
+                'dropped': sum(s.dropped for s in subscribers),
+                'subscribers': [s.get_stats() for s in subscribers]
+            }
+        return stats
+
+
+# Shared by the ASGI streaming endpoints
+async_stream_hub = AsyncStreamHub()
@@ -4,6 +4,11 @@ import time
 import logging
 import queue
 import sys
+import numpy as np
+from .streaming import FrameRingBuffer, frame_cache
+from .state_cache import state_cache
+from .metrics import stage_seconds, frames_dropped, camera_reconnects, camera_label
+from .latency import latency_tracker, SourceClock
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -19,23 +24,37 @@ stream_handler = logging.StreamHandler(sys.stdout)
 stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 
+# URL scheme -> callable(url) returning a cv2.VideoCapture-like object, for sources OpenCV cannot open itself
+capture_factories = {}
+
+
+def register_capture_factory(scheme, factory):
+    capture_factories[scheme] = factory
+
+
 class CameraStreamManager:
     def __init__(self):
         self.camera_streams = {}
-        self.lock = threading.Lock()
+        # Re-entrant: force_restart_stream calls get_camera_stream while holding the lock
+        self.lock = threading.RLock()
+        # Processing width for cameras without their own, 0 keeps the native resolution
+        self.default_capture_width = 0
+
+    def configure(self, default_capture_width=None):
+        if default_capture_width is not None:
+            self.default_capture_width = default_capture_width
 
     def get_camera_stream(self, ip_address, consumer_id=None):
-        from app.models import Camera
         with self.lock:
-            # Check if camera is active in database
-            camera = Camera.query.filter_by(ip_address=ip_address).first()
-            if not camera or not camera.status:
+            # Check if camera is active
+            camera = state_cache.get_camera_by_ip(ip_address)
+            if not camera or not camera['status']:
                 logger.warning(f"Camera with IP {ip_address} is not active or does not exist.")
                 return None
                 
             if ip_address not in self.camera_streams:
                 logger.info(f"Starting new camera stream for IP: {ip_address}")
-                camera_stream = CameraStream(ip_address)
+                camera_stream = CameraStream(ip_address, self.default_capture_width)
                 if consumer_id:
                     camera_stream.add_consumer(consumer_id)
                 camera_stream.start()
@@ -54,8 +73,10 @@ class CameraStreamManager:
                     except Exception as e:
                         logger.error(f"Error stopping old stream: {e}")
                     
-                    # Create new stream
-                    camera_stream = CameraStream(ip_address)
+                    # Create new stream, keeping the consumers attached to the old one
+                    camera_stream = CameraStream(ip_address, self.default_capture_width)
+                    for existing_consumer in list(existing_stream.active_consumers):
+                        camera_stream.add_consumer(existing_consumer)
                     if consumer_id:
                         camera_stream.add_consumer(consumer_id)
                     camera_stream.start()
@@ -85,6 +106,12 @@ class CameraStreamManager:
                     finally:
                         del self.camera_streams[ip_address]
 
+    def release_stream_later(self, ip_address, consumer_id, delay):
+        """Release a consumer after delay seconds."""
+        timer = threading.Timer(delay, self.release_stream, (ip_address, consumer_id))
+        timer.daemon = True
+        timer.start()
+
     def force_restart_stream(self, ip_address, consumer_id=None):
         with self.lock:
             logger.info(f"Force restarting camera stream for IP: {ip_address}")
@@ -108,14 +135,13 @@ class CameraStreamManager:
             return self.get_camera_stream(ip_address, consumer_id)
 
     def stop_inactive_streams(self):
-        from app.models import Camera
         with self.lock:
             logger.info("Checking for inactive camera streams.")
             streams_to_remove = []
             
             for ip_address in list(self.camera_streams.keys()):
-                camera = Camera.query.filter_by(ip_address=ip_address).first()
-                if not camera or not camera.status:
+                camera = state_cache.get_camera_by_ip(ip_address)
+                if not camera or not camera['status']:
                     logger.info(f"Stopping inactive camera stream for IP: {ip_address}")
                     stream = self.camera_streams[ip_address]
                     
@@ -166,16 +192,28 @@ class CameraStreamManager:
                     del self.camera_streams[ip_address]
                     
 class CameraStream(threading.Thread):
-    def __init__(self, ip_address):
+    def __init__(self, ip_address, default_capture_width=0):
         super().__init__(name=f"CameraStream-{ip_address}")
         self.ip_address = ip_address
         self.capture = None
-        self.frame = None
+        self.frames = FrameRingBuffer()
+        self.dropped_frames = 0
+        self.metrics_label = camera_label(ip_address)
+        # Frames are downscaled to this width once here, every consumer gets the small frame
+        self.default_capture_width = default_capture_width
+        self.capture_width = None
+        self.source_size = None
+        self.decode_buffer = None
+        # Compares read times with the stream's timestamps to expose decoder buffering
+        self.source_clock = SourceClock()
+        self._refresh_settings()
         self.running = True
         self.lock = threading.Lock()
         self.connection_failed = False
         self.last_frame_time = time.time()
         self.active_consumers = set()  # Track who is using this stream
+        # Sequence numbers restart with the stream, drop any frames encoded for the previous one
+        frame_cache.discard(('camera', ip_address))
         self._initialize_capture()
         logger.info(f"Initialized CameraStream for IP: {self.ip_address}")
 
@@ -189,7 +227,10 @@ class CameraStream(threading.Thread):
                 except:
                     pass
             
-            if self.ip_address == 'http://1.1.1.1':
+            scheme = self.ip_address.split('://', 1)[0]
+            if scheme in capture_factories:
+                self.capture = capture_factories[scheme](self.ip_address)
+            elif self.ip_address == 'http://1.1.1.1':
                 # For webcam, try different backends
                 for backend in [cv2.CAP_DSHOW, cv2.CAP_V4L2, cv2.CAP_ANY]:
                     try:
@@ -216,7 +257,12 @@ class CameraStream(threading.Thread):
                 # Test read one frame to ensure it's working
                 ret, test_frame = self.capture.read()
                 if ret and test_frame is not None:
-                    logger.info(f"Successfully initialized camera stream for IP: {self.ip_address}")
+                    # Many RTSP sources ignore the size hints above, the decoded size is what counts
+                    self.source_size = (test_frame.shape[1], test_frame.shape[0])
+                    self.decode_buffer = None
+                    self.source_clock.reset()
+                    logger.info(f"Successfully initialized camera stream for IP: {self.ip_address} "
+                                f"(source {self.source_size[0]}x{self.source_size[1]}, processing width {self.capture_width or 'native'})")
                     self.connection_failed = False
                 else:
                     logger.error(f"Failed to read test frame for IP: {self.ip_address}")
@@ -229,6 +275,43 @@ class CameraStream(threading.Thread):
             logger.error(f"Exception while initializing camera {self.ip_address}: {e}")
             self.connection_failed = True
 
+    def _refresh_settings(self):
+        camera = state_cache.get_camera_by_ip(self.ip_address) or {}
+        width = camera.get('capture_width') or self.default_capture_width
+        if width != self.capture_width:
+            self.capture_width = width or None
+            logger.info(f"Processing width for {self.ip_address}: {self.capture_width or 'native'}")
+
+    def _read_into(self, slot):
+        """Decode the next frame, downscaled to the processing width, into slot when possible."""
+        source_width = self.source_size[0] if self.source_size else None
+        if not self.capture_width or (source_width is not None and source_width <= self.capture_width):
+            return self.capture.read(slot) if slot is not None else self.capture.read()
+
+        # Decode into a private buffer and resize straight into the ring slot
+        if self.decode_buffer is not None:
+            ret, raw = self.capture.read(self.decode_buffer)
+        else:
+            ret, raw = self.capture.read()
+        if not ret or raw is None:
+            return ret, raw
+        self.decode_buffer = raw
+
+        height, width = raw.shape[:2]
+        self.source_size = (width, height)
+        target_width = self.capture_width
+        target_height = max(2, int(round(height * target_width / width)) // 2 * 2)
+        if slot is None or slot.shape != (target_height, target_width, raw.shape[2]):
+            slot = np.empty((target_height, target_width, raw.shape[2]), dtype=raw.dtype)
+        cv2.resize(raw, (target_width, target_height), dst=slot, interpolation=cv2.INTER_AREA)
+        return True, slot
+
+    def _record_source_lag(self):
+        get = getattr(self.capture, 'get', None)
+        lag = self.source_clock.update(self.last_frame_time, get(cv2.CAP_PROP_POS_MSEC) if get else None)
+        if lag is not None:
+            latency_tracker.record(self.ip_address, 'source_lag', lag)
+
     def add_consumer(self, consumer_id):
         with self.lock:
             self.active_consumers.add(consumer_id)
@@ -248,8 +331,13 @@ class CameraStream(threading.Thread):
         logger.info(f"Camera stream started for IP: {self.ip_address}")
         consecutive_failures = 0
         max_consecutive_failures = 10
+        last_settings_check = time.time()
         
         while self.running:
+            if time.time() - last_settings_check >= 2.0:
+                last_settings_check = time.time()
+                self._refresh_settings()
+
             # Check if we have active consumers
             with self.lock:
                 if len(self.active_consumers) == 0 and consecutive_failures > 3:
@@ -268,12 +356,22 @@ class CameraStream(threading.Thread):
                     break
             
             try:
-                ret, frame = self.capture.read()
+                # Decode straight into a free ring slot, no per-frame allocation or copy
+                index, slot = self.frames.acquire_write_slot()
+                if index is None:
+                    # Every slot is pinned by a slow consumer, discard this frame but keep the source drained
+                    self.capture.grab()
+                    self.dropped_frames += 1
+                    frames_dropped.inc(camera=self.metrics_label)
+                    continue
+
+                read_start = time.time()
+                ret, frame = self._read_into(slot)
+                stage_seconds.observe(time.time() - read_start, stage='capture_read', source=f"camera:{self.metrics_label}")
                 if ret and frame is not None:
-                    with self.lock:
-                        # Make sure to store a copy to avoid threading issues
-                        self.frame = frame.copy()
-                        self.last_frame_time = time.time()
+                    self.frames.commit(index, frame)
+                    self.last_frame_time = time.time()
+                    self._record_source_lag()
                     consecutive_failures = 0  # Reset failure count on success
                 else:
                     consecutive_failures += 1
@@ -299,6 +397,7 @@ class CameraStream(threading.Thread):
             return
             
         logger.info(f"Reconnecting to camera stream for IP: {self.ip_address}")
+        camera_reconnects.inc(camera=self.metrics_label)
         
         # Safely release the current capture
         if self.capture is not None:
@@ -321,10 +420,19 @@ class CameraStream(threading.Thread):
             logger.info(f"Successfully reconnected to IP: {self.ip_address}")
 
     def get_frame(self):
-        with self.lock:
-            if self.frame is not None:
-                return self.frame.copy()
+        frame_ref = self.frames.acquire(timeout=0)
+        if frame_ref is None:
             return None
+        with frame_ref:
+            return frame_ref.frame.copy()
+
+    def acquire_frame(self, last_seq=None, timeout=1.0):
+        """Block until a frame newer than last_seq is captured.
+
+        Returns a pinned, read-only FrameRef (release it or use it as a context
+        manager) or None on timeout.
+        """
+        return self.frames.acquire(last_seq, timeout)
 
     def _cleanup(self):
         if self.capture is not None:
@@ -339,6 +447,7 @@ class CameraStream(threading.Thread):
     def stop(self):
         logger.info(f"Stopping camera stream for IP: {self.ip_address}")
         self.running = False
+        self.frames.close()
         
         # Give the thread a moment to finish current operations
         time.sleep(0.1)
@@ -357,4 +466,8 @@ class CameraStream(threading.Thread):
             logger.warning(f"Frame too old for {self.ip_address}: {frame_age:.2f}s")
             return False
             
-        return True
\ No newline at end of file
+        return True
+
+
+# Process-wide registry so every source is opened and decoded once for viewers and detectors
+camera_stream_manager = CameraStreamManager()
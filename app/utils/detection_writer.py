@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import insert
+from .analytics import apply_rollups, rollup_counts
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class DetectionWriter(threading.Thread):
+    """Buffers detections from the detector threads and bulk-inserts them into ObjectDetected,
+    adding each batch to the DetectionRollup counts along with the number of sampled frames.
+
+    record() never blocks: when the bounded queue is full, frames are dropped
+    according to the configured policy and counted.
+    """
+
+    def __init__(self, max_queue=2000, batch_size=500, flush_interval=1.0, policy=DROP_OLDEST):
+        super().__init__(name="DetectionWriter", daemon=True)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.app = None
+        self.running = True
+
+        # Stats
+        self.written_rows = 0
+        self.dropped_frames = 0
+        self.failed_rows = 0
+        self.batches = 0
+        self.last_flush = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['DETECTION_WRITER_QUEUE_SIZE'])
+        self.batch_size = app.config['DETECTION_WRITER_BATCH_SIZE']
+        self.flush_interval = app.config['DETECTION_WRITER_FLUSH_INTERVAL']
+        self.policy = app.config['DETECTION_WRITER_POLICY']
+        self.start()
+
+    def record(self, detector_id, detections, names, timestamp=None):
+        """Queue one sampled frame worth of detections (an (N, 7) array from the inference step).
+
+        Frames without detections are queued too, they count as sampled frames in the rollups.
+        """
+        if self.app is None:
+            return
+
+        item = (detector_id, timestamp or datetime.utcnow(), detections, names)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_frames += 1
+            if self.policy == DROP_OLDEST:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait(item)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def _rows(self, item):
+        detector_id, timestamp, detections, names = item
+        for x1, y1, x2, y2, confidence, class_id, track_id in detections.tolist():
+            yield {
+                'detector_id': detector_id,
+                'class_id': int(class_id),
+                'class_name': names.get(int(class_id)),
+                'confidence': confidence,
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2,
+                'track_id': int(track_id) if track_id >= 0 else None,
+                'created_at': timestamp
+            }
+
+    def run(self):
+        logger.info("Detection writer started")
+        rows = []
+        frames = []
+        deadline = time.time() + self.flush_interval
+
+        while self.running or not self.queue.empty():
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                if item is not None:
+                    rows.extend(self._rows(item))
+                    frames.append(item[:2])
+            except queue.Empty:
+                pass
+
+            if len(rows) >= self.batch_size or len(frames) >= self.batch_size or time.time() >= deadline:
+                if frames:
+                    self._flush(rows, frames)
+                    rows = []
+                    frames = []
+                deadline = time.time() + self.flush_interval
+
+        if frames:
+            self._flush(rows, frames)
+        logger.info("Detection writer stopped")
+
+    def _flush(self, rows, frames):
+        from app.extensions import db
+        from app.models import ObjectDetected
+
+        with self.app.app_context():
+            try:
+                if rows:
+                    db.session.execute(insert(ObjectDetected), rows)
+                # Rollups move in the same transaction, so they never disagree with the raw rows
+                apply_rollups(db.session, rollup_counts(rows, frames))
+                db.session.commit()
+                self.written_rows += len(rows)
+                self.batches += 1
+                self.last_flush = time.time()
+            except Exception as e:
+                db.session.rollback()
+                self.failed_rows += len(rows)
+                logger.error(f"Failed to write {len(rows)} detections: {e}")
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.join(timeout=10)
+
+    def get_stats(self):
+        return {
+            'queued_frames': self.queue.qsize(),
+            'max_queue': self.queue.maxsize,
+            'policy': self.policy,
+            'written_rows': self.written_rows,
+            'failed_rows': self.failed_rows,
+            'dropped_frames': self.dropped_frames,
+            'batches': self.batches,
+            'last_flush': self.last_flush
+        }
+
+
+# Process-wide writer fed by every detector thread
+detection_writer = DetectionWriter()
@@ -1,11 +1,22 @@
-import os
 import threading
 import time
 import logging
-import tempfile
+import numpy as np
 from collections import deque
-from ultralytics import YOLO
-from .cctv import CameraStreamManager
+from .cctv import camera_stream_manager
+from .model_registry import model_registry
+from .tracker import DetectorTracker
+from .streaming import FrameChannel, frame_cache
+from .inference import ANNOTATION_STYLE, filter_pretrained, detections_array, draw_detections, detection_payload
+from .inference_workers import InferenceWorkerPool
+from .state_cache import state_cache, detector_changed
+from .detection_writer import detection_writer
+from .scheduler import frame_rate_scheduler
+from .motion import MotionGate
+from .roi import RegionOfInterest, parse_roi
+from .latency import latency_tracker
+from .metrics import (metrics, stage_seconds, frames_processed, frames_skipped, detector_fps, detector_target_fps,
+                      result_timings)
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -15,9 +26,36 @@ file_handler = logging.FileHandler('detector.log')
 file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 
-# Store annotated frames and FPS info for detector streaming
+# Store annotated frame channels and FPS info for detector streaming
 annotated_frames = {}
 detector_fps_info = {}
+annotated_frames_lock = threading.Lock()
+# Detection metadata (JSON) per detector, for browsers drawing the overlay themselves
+detection_channels = {}
+
+def get_annotated_channel(detector_id):
+    # Channels outlive detector threads so viewers keep waiting across restarts
+    with annotated_frames_lock:
+        if detector_id not in annotated_frames:
+            annotated_frames[detector_id] = FrameChannel()
+        return annotated_frames[detector_id]
+
+def get_detection_channel(detector_id):
+    with annotated_frames_lock:
+        if detector_id not in detection_channels:
+            detection_channels[detector_id] = FrameChannel()
+        return detection_channels[detector_id]
+
+def discard_detector_channels(detector_ids):
+    """Close and forget the channels, last frames and encoded JPEGs of deleted detectors."""
+    with annotated_frames_lock:
+        channels = [registry.pop(detector_id) for registry in (annotated_frames, detection_channels)
+                    for detector_id in detector_ids if detector_id in registry]
+    for channel in channels:
+        channel.close()
+    for detector_id in detector_ids:
+        frame_cache.discard(('detector', detector_id))
+        detector_fps_info.pop(detector_id, None)
 
 class FPSCalculator:
     def __init__(self, window_size=30):
@@ -37,7 +75,7 @@ class FPSCalculator:
         return self.last_fps
 
 class DetectorThread(threading.Thread):
-    def __init__(self, app, detector_id, camera_stream, camera_ip, camera_stream_manager, tracking=False):
+    def __init__(self, app, detector_id, camera_stream, camera_ip, camera_stream_manager, tracking=False, inference_pool=None):
         super().__init__(name=f"DetectorThread-{detector_id}")
         self.app = app
         self.detector_id = detector_id
@@ -47,9 +85,22 @@ class DetectorThread(threading.Thread):
         self.consumer_id = f"detector_{detector_id}"
         self.running = True
         self.lock = threading.Lock()
-        self.yolo_model = None
-        self.temp_model_file = None
+        self.model_entry = None
+        self.model_id = None
+        self.model_variant = 'float'
+        self.inference_pool = inference_pool
+        # In process mode the tracker lives in the worker the detector is pinned to
+        self.tracker = DetectorTracker() if tracking and inference_pool is None else None
         self.tracking = tracking
+        self.annotated_channel = get_annotated_channel(detector_id)
+        self.detection_channel = get_detection_channel(detector_id)
+        # In client overlay mode nothing is drawn or encoded server side
+        self.client_overlay = (state_cache.get_detector(detector_id) or {}).get('overlay') == 'client'
+        # Annotated frames are only drawn while the stream has viewers
+        self.annotating = False
+        self.metrics_source = f"detector:{detector_id}"
+        self.record_interval = app.config.get('DETECTION_RECORD_INTERVAL', 1.0)
+        self.last_record_time = 0.0
         
         # --- Custom pretrained tracking ---
         self.model_name = None
@@ -57,6 +108,24 @@ class DetectorThread(threading.Thread):
         # FPS calculation
         self.fps_calculator = FPSCalculator()
         self.inference_times = deque(maxlen=30)
+        self.queue_delays = deque(maxlen=30)
+        # Per-frame (frame age at inference start, inference, annotate + publish) seconds for benchmarks
+        self.stage_samples = deque(maxlen=2000)
+        # Inference seconds the last frame cost, reported to the frame rate scheduler
+        self.frame_cost = 0.0
+        self.frame_wait = None
+
+        # Optional motion gate, static frames reuse the last detections
+        self.motion_gate = MotionGate()
+        self.motion_enabled = False
+        self.last_detections = None
+        self.last_names = None
+
+        # Optional camera region of interest, only its bounding rectangle is inferred on
+        self.roi = None
+        self.roi_text = None
+        # Model input size, the letterbox target
+        self.imgsz = app.config.get('INFERENCE_IMGSZ') or None
 
         # Register this detector as a consumer
         if self.camera_stream:
@@ -66,35 +135,103 @@ class DetectorThread(threading.Thread):
 
     def _load_model_from_database(self):
         try:
-            from app.models import Detector, Model
+            from app.models import Detector
             with self.app.app_context():
                 detector = Detector.query.get(self.detector_id)
                 if not detector:
                     logger.error(f"Detector not found for ID: {self.detector_id}")
                     return False
-                
-                model = Model.query.get(detector.model_id)
-                if not model or not model.model_file:
-                    logger.error(f"Model not found or model file is empty for detector ID: {self.detector_id}")
-                    return False
-                
-                # --- Custom pretrained tracking ---
-                self.model_name = model.model_name
-                
-                # Create temporary file for the model
-                self.temp_model_file = tempfile.NamedTemporaryFile(suffix='.pt', delete=False)
-                self.temp_model_file.write(model.model_file)
-                self.temp_model_file.close()
-                
-                # Load YOLO model from temporary file
-                self.yolo_model = YOLO(self.temp_model_file.name)
-                logger.info(f"Successfully loaded model {self.model_name} for detector ID: {self.detector_id}")
-                return True
-                
+                model_id = detector.model_id
+                model_variant = detector.model_variant or 'float'
+
+            # Weights are loaded once per process and shared with other detectors
+            model_entry = model_registry.acquire(self.app, model_id, model_variant)
+            if model_entry is None:
+                logger.error(f"Model not found or model file is empty for detector ID: {self.detector_id}")
+                return False
+
+            old_entry = self.model_entry
+            self.model_entry = model_entry
+            self.model_id = model_id
+            self.model_variant = model_variant
+
+            # --- Custom pretrained tracking ---
+            self.model_name = model_entry.model_name
+
+            if old_entry is not None:
+                model_registry.release(old_entry)
+                if self.tracker:
+                    self.tracker.reset()
+            # Boxes from the previous model must not be reused by the motion gate
+            self.last_detections = None
+
+            logger.info(f"Successfully loaded model {self.model_name} ({model_entry.variant}) for detector ID: {self.detector_id}")
+            return True
+
         except Exception as e:
             logger.error(f"Error loading model for detector ID: {self.detector_id}: {e}")
             return False
 
+    def _infer_in_thread(self, frame, annotate=True):
+        # Frames from all detectors on this model are batched by its engine
+        request = self.model_entry.engine.submit(self.detector_id, frame, self.imgsz)
+        result = request.wait(timeout=5.0)
+        if result is None and not self.model_entry.engine.cancel(request):
+            # Already part of a running batch, keep the frame pinned until it finishes
+            result = request.wait()
+        if result is None:
+            if request.error is not None:
+                logger.error(f"Inference failed for detector ID: {self.detector_id}: {request.error}")
+                frames_skipped.inc(detector=self.detector_id, reason='failed')
+            else:
+                frames_skipped.inc(detector=self.detector_id, reason='superseded')
+            return None
+
+        self.queue_delays.append(request.queue_delay)
+        self.frame_cost = request.frame_cost
+        self.frame_wait = request.queue_delay
+        timings = dict(result_timings(result), queue_wait=request.queue_delay)
+        if self.tracking:
+            stage_start = time.time()
+            result = self.tracker.update(result, frame)
+            timings['track'] = time.time() - stage_start
+        stage_start = time.time()
+        result = filter_pretrained(result, self.model_name)
+        detections = detections_array(result)
+        timings['filter'] = time.time() - stage_start
+
+        annotated_frame = None
+        if annotate:
+            stage_start = time.time()
+            annotated_frame = result.plot(**ANNOTATION_STYLE)
+            timings['plot'] = time.time() - stage_start
+        self._observe_stages(timings)
+        return detections, annotated_frame, result.names
+
+    def _infer_in_worker(self, frame, annotate=True):
+        # Inference, tracking and plotting run in a worker process, frames travel through shared memory
+        output = self.inference_pool.infer(
+            self.detector_id,
+            frame,
+            self.model_entry.weights_path,
+            self.model_name,
+            tracking=self.tracking,
+            annotate=annotate,
+            imgsz=self.imgsz,
+            variant=self.model_entry.variant
+        )
+        if output is None:
+            frames_skipped.inc(detector=self.detector_id, reason='failed')
+            return None
+        self.frame_cost = output.inference_time
+        self.frame_wait = output.timings.get('queue_wait')
+        self._observe_stages(output.timings)
+        return output.detections, output.annotated_frame, output.names
+
+    def _observe_stages(self, timings):
+        for stage, seconds in timings.items():
+            stage_seconds.observe(seconds, stage=stage, source=self.metrics_source)
+
     def _calculate_average_inference_time(self):
         if len(self.inference_times) > 0:
             return sum(self.inference_times) / len(self.inference_times)
@@ -108,100 +245,178 @@ class DetectorThread(threading.Thread):
             return
         
         frame_count = 0 
-            
-        # --- 1. Frame skipping logic ---
-        TARGET_FPS = 15.0
-        TIME_BUDGET = 1.0 / TARGET_FPS
-        skip_next_frame = False
+        last_seq = None
+        last_check_time = time.time()
+        # Frame rate is set by the shared scheduler, not per thread
+        next_frame_time = 0.0
+        self._register_with_scheduler()
+        self._apply_camera_settings()
         
         try:
             while self.running:
                 try:
-                    if frame_count > 0 and frame_count % 30 == 0:
-                        with self.app.app_context():
-                            from app.models import Detector, Camera
-                            current_detector = Detector.query.get(self.detector_id)
-                            if not current_detector or not current_detector.running:
-                                logger.info(f"Detector {self.detector_id} became inactive, stopping thread")
-                                break
-                            
-                            current_camera = Camera.query.get(current_detector.camera_id)
-                            if not current_camera or not current_camera.status:
-                                logger.info(f"Camera for detector {self.detector_id} became inactive, stopping thread")
-                                break
+                    if time.time() - last_check_time >= 1.0:
+                        last_check_time = time.time()
+                        # Served from the in-memory state cache, no DB round trip
+                        current_detector = state_cache.get_detector(self.detector_id)
+                        if not current_detector or not current_detector['running']:
+                            logger.info(f"Detector {self.detector_id} became inactive, stopping thread")
+                            break
+
+                        if not state_cache.is_camera_active(current_detector['camera_id']):
+                            logger.info(f"Camera for detector {self.detector_id} became inactive, stopping thread")
+                            break
+
+                        # Picks up edited min/max fps and weight, and camera motion/ROI settings
+                        self._register_with_scheduler(current_detector)
+                        self._apply_camera_settings(current_detector)
+                        self.client_overlay = current_detector.get('overlay') == 'client'
+
+                        model_changed = (
+                            current_detector['model_id'] != self.model_id
+                            or current_detector['model_variant'] != self.model_variant
+                        )
+
+                        # Pick up new weights uploaded through edit_model or a different model on the detector
+                        if model_changed or self.model_entry.needs_reload(self.model_variant):
+                            logger.info(f"Model for detector {self.detector_id} changed, reloading")
+                            self._load_model_from_database()
                     
-                    if self.camera_stream is None or not self.camera_stream.is_healthy():
+                    if self.camera_stream is None or not self.camera_stream.is_alive():
+                        # The shared stream may have been restarted by another consumer
+                        with self.app.app_context():
+                            self.camera_stream = self.camera_stream_manager.get_camera_stream(self.camera_ip, self.consumer_id)
+                        last_seq = None
+                        if self.camera_stream is None:
+                            time.sleep(1)
+                            continue
+
+                    if not self.camera_stream.is_healthy():
                         logger.debug(f"Camera stream unhealthy for detector ID: {self.detector_id}")
                         time.sleep(1)
                         continue
                     
-                    frame = self.camera_stream.get_frame()
-                    if frame is not None:
+                    # Wait out the interval granted by the scheduler, then take the newest frame
+                    wait = next_frame_time - time.time()
+                    if wait > 0:
+                        time.sleep(min(wait, 0.5))
+                        continue
+
+                    # Wake up as soon as the camera has a frame we have not processed yet
+                    frame_ref = self.camera_stream.acquire_frame(last_seq, timeout=1.0)
+                    if frame_ref is not None:
+                        # Read-only view of the capture slot, pinned until released below
+                        last_seq = frame_ref.seq
+                        frame = frame_ref.frame
                         frame_count += 1
-                        
-                        # --- 2. Frame skipping logic ---
-                        if skip_next_frame:
-                            skip_next_frame = False
-                            continue 
 
                         try:
                             with self.lock:
                                 inference_start = time.time()
-                                
-                                if self.tracking:
-                                    results = self.yolo_model.track(frame, persist=True, tracker="bytetrack.yaml", verbose=False)
+                                next_frame_time = inference_start + frame_rate_scheduler.interval_for(self.detector_id)
+
+                                roi = self.roi
+                                if roi is not None:
+                                    region, offset = roi.crop(frame)
+                                    region = np.ascontiguousarray(region)
                                 else:
-                                    results = self.yolo_model(frame, verbose=False)
-                                    if results[0].boxes.id is not None:
-                                        results[0].boxes.id = None
-                                
-                                # --- Custom pretrained tracking ---
-                                # logger.info(f"Checking filter condition for model: '{self.model_name}'")
-                                if self.model_name and self.model_name.strip().lower() == 'pretrained':
-                                    person_class_id = 0
-                                    mask = results[0].boxes.cls == person_class_id
-                                    results[0] = results[0][mask]
-                                    
-                                inference_time = time.time() - inference_start
-                                self.inference_times.append(inference_time)
-                                
-                                # --- 2. Frame skipping logic ---
-                                if inference_time > TIME_BUDGET:
-                                    skip_next_frame = True
-                                    logger.warning(f"BOTTLENECK: Processing time {inference_time*1000:.0f}ms > Budget {TIME_BUDGET*1000:.0f}ms. Skipping next frame.")
-                                
-                                annotated_frame = results[0].plot(
-                                    conf=True,
-                                    labels=True,
-                                    boxes=True,
-                                    line_width=2,
-                                    font_size=12
+                                    region, offset = frame, (0, 0)
+
+                                run_model = (
+                                    self.last_detections is None
+                                    or not self.motion_enabled
+                                    or self.motion_gate.check(region)
                                 )
+
+                                annotating = not self.client_overlay and self.annotated_channel.viewers > 0
+                                if annotating != self.annotating:
+                                    self.annotating = annotating
+                                    logger.info(f"Detector {self.detector_id} {'has viewers, annotating' if annotating else 'has no viewers, running headless'}")
+                                    if not annotating:
+                                        # Do not hold on to the last full-size annotated frame or its JPEG
+                                        self.annotated_channel.clear()
+                                        frame_cache.discard(('detector', self.detector_id))
+
+                                if run_model:
+                                    # With an ROI the model only sees the crop, boxes are drawn on the full frame below
+                                    annotate = roi is None and annotating
+                                    if self.inference_pool is not None:
+                                        output = self._infer_in_worker(region, annotate=annotate)
+                                    else:
+                                        output = self._infer_in_thread(region, annotate=annotate)
+                                    if output is None:
+                                        continue
+                                    detections, annotated_frame, names = output
+                                    if roi is not None:
+                                        detections = roi.to_frame(detections, offset, frame.shape)
+                                    self.last_detections, self.last_names = detections, names
+
+                                    inference_time = model_time = time.time() - inference_start
+                                    self.inference_times.append(inference_time)
+                                    frame_rate_scheduler.report(self.detector_id, self.frame_cost, self.frame_wait)
+                                else:
+                                    # Static scene, keep the previous boxes on the live frame
+                                    detections, names = self.last_detections, self.last_names
+                                    annotated_frame = None
+                                    model_time = 0.0
+                                    frames_skipped.inc(detector=self.detector_id, reason='motion_gated')
+
+                                if annotated_frame is None and annotating:
+                                    plot_start = time.time()
+                                    annotated_frame = draw_detections(frame, detections, names)
+                                    if roi is not None:
+                                        roi.draw(annotated_frame)
+                                    stage_seconds.observe(time.time() - plot_start, stage='plot', source=self.metrics_source)
                                 
                                 current_fps = self.fps_calculator.update()
                                 avg_inference_time = self._calculate_average_inference_time()
                                 
-                                annotated_frames[self.detector_id] = annotated_frame
+                                frame_meta = {
+                                    'camera': self.camera_ip,
+                                    'capture_seq': frame_ref.seq,
+                                    'captured_at': frame_ref.captured_at,
+                                    'detected_at': time.time()
+                                }
+                                if annotating:
+                                    self.annotated_channel.publish(annotated_frame, frame_meta)
+                                self.detection_channel.publish(detection_payload(
+                                    detections, names, frame_ref.seq, frame_ref.captured_at, frame.shape,
+                                    roi.points.tolist() if roi is not None else None, not run_model
+                                ), frame_meta)
+                                published_at = time.time()
+                                latency_tracker.record(self.camera_ip, 'detected', published_at - frame_ref.captured_at)
+                                frames_processed.inc(detector=self.detector_id)
+                                self.stage_samples.append((
+                                    inference_start - frame_ref.captured_at,
+                                    model_time,
+                                    published_at - inference_start - model_time
+                                ))
+
+                                # Handed to the background writer, never waits on the database
+                                if time.time() - self.last_record_time >= self.record_interval:
+                                    self.last_record_time = time.time()
+                                    detection_writer.record(self.detector_id, detections, names)
                                 
                                 detector_fps_info[self.detector_id] = {
                                     'fps': round(current_fps, 1),
+                                    'target_fps': round(1.0 / frame_rate_scheduler.interval_for(self.detector_id), 1),
                                     'inference_time': round(avg_inference_time * 1000, 1),
-                                    'detections': len(results[0].boxes),
+                                    'queue_delay': round(sum(self.queue_delays) / len(self.queue_delays) * 1000, 1) if self.queue_delays else 0.0,
+                                    'detections': len(detections),
+                                    'motion_gated': not run_model,
+                                    'viewers': self.annotated_channel.viewers,
+                                    'annotating': annotating,
+                                    'gated_ratio': self.motion_gate.get_stats()['gated_ratio'] if self.motion_enabled else 0.0,
                                     'last_update': time.time()
                                 }
                                 
-                                if len(results[0].boxes) > 0 and frame_count % 60 == 0:
-                                    detections = len(results[0].boxes)
-                                    logger.info(f"Detector {self.detector_id}: {detections} objects, FPS: {current_fps:.1f}, Inference: {avg_inference_time*1000:.1f}ms")
+                                if len(detections) > 0 and frame_count % 60 == 0:
+                                    logger.info(f"Detector {self.detector_id}: {len(detections)} objects, FPS: {current_fps:.1f}, Inference: {avg_inference_time*1000:.1f}ms")
                                     
                         except Exception as e:
                             logger.error(f"Error processing frame for detector ID: {self.detector_id}: {e}", exc_info=True)
-                            
-                    else:
-                        time.sleep(0.1)
-                    
-                    frame_count += 1
-                    time.sleep(0.033)
+                        finally:
+                            frame_ref.release()
                     
                 except Exception as e:
                     logger.error(f"Unexpected error in detector thread {self.detector_id}: {e}", exc_info=True)
@@ -214,24 +429,65 @@ class DetectorThread(threading.Thread):
         
         logger.info(f"DetectorThread for detector ID: {self.detector_id} finished")
     
+    def _register_with_scheduler(self, state=None):
+        state = state or state_cache.get_detector(self.detector_id) or {}
+        frame_rate_scheduler.register(
+            self.detector_id,
+            min_fps=state.get('min_fps'),
+            max_fps=state.get('max_fps'),
+            weight=state.get('weight')
+        )
+
+    def _apply_camera_settings(self, state=None):
+        state = state or state_cache.get_detector(self.detector_id) or {}
+        camera = state_cache.get_camera(state.get('camera_id')) or {}
+
+        enabled = bool(camera.get('motion_gate'))
+        if enabled != self.motion_enabled:
+            logger.info(f"Motion gate {'enabled' if enabled else 'disabled'} for detector {self.detector_id}")
+            self.motion_gate.reset()
+        self.motion_enabled = enabled
+        self.motion_gate.configure(camera.get('motion_threshold'), camera.get('motion_refresh'))
+
+        self.imgsz = camera.get('inference_size') or self.app.config.get('INFERENCE_IMGSZ') or None
+
+        roi_text = camera.get('roi')
+        if roi_text != self.roi_text:
+            self.roi_text = roi_text
+            try:
+                points = parse_roi(roi_text)
+            except ValueError as e:
+                logger.error(f"Ignoring invalid ROI for detector {self.detector_id}: {e}")
+                points = None
+            self.roi = RegionOfInterest(points) if points else None
+            # Track ids and cached boxes are relative to the old crop
+            if self.tracker:
+                self.tracker.reset()
+            self.last_detections = None
+            self.motion_gate.reset()
+            logger.info(f"ROI for detector {self.detector_id}: {points or 'full frame'}")
+
     def _cleanup(self):
         """Cleanup resources"""
         try:
+            frame_rate_scheduler.unregister(self.detector_id)
+
             if self.camera_stream and hasattr(self.camera_stream, 'remove_consumer'):
                 self.camera_stream.remove_consumer(self.consumer_id)
             
             if self.camera_stream_manager and self.camera_ip:
                 self.camera_stream_manager.release_stream(self.camera_ip, self.consumer_id)
             
-            if self.temp_model_file and os.path.exists(self.temp_model_file.name):
-                try:
-                    os.unlink(self.temp_model_file.name)
-                    logger.info(f"Cleaned up temporary model file for detector ID: {self.detector_id}")
-                except Exception as e:
-                    logger.warning(f"Failed to clean up temporary model file: {e}")
+            if self.model_entry is not None:
+                model_registry.release(self.model_entry)
+                self.model_entry = None
+
+            if self.inference_pool is not None:
+                self.inference_pool.release(self.detector_id)
             
-            if self.detector_id in annotated_frames:
-                del annotated_frames[self.detector_id]
+            self.annotated_channel.clear()
+            self.detection_channel.clear()
+            frame_cache.discard(('detector', self.detector_id))
             
             if self.detector_id in detector_fps_info:
                 del detector_fps_info[self.detector_id]
@@ -248,17 +504,69 @@ class DetectorThread(threading.Thread):
         if self.is_alive():
             logger.warning(f"DetectorThread {self.detector_id} did not stop gracefully")
 
+def _collect_detector_metrics():
+    # Rebuilt on every scrape so stopped detectors disappear
+    detector_fps.clear()
+    detector_target_fps.clear()
+    for detector_id, info in list(detector_fps_info.items()):
+        detector_fps.set(info.get('fps', 0.0), detector=detector_id)
+        detector_target_fps.set(info.get('target_fps', 0.0), detector=detector_id)
+
+
+metrics.add_collector(_collect_detector_metrics)
+
 class DetectorManager:
     def __init__(self):
         self.detectors = {}
-        self.camera_manager = CameraStreamManager()
+        self.camera_manager = camera_stream_manager
         self.lock = threading.Lock()
         self.app = None
+        self.inference_pool = None
     
     def initialize_detectors(self, app):
         self.app = app
+
+        # Optional pool of inference processes so pre/post-processing is not bound by one GIL
+        if app.config.get('INFERENCE_MODE') == 'process':
+            self.inference_pool = InferenceWorkerPool(app.config.get('INFERENCE_WORKERS') or None)
+            self.inference_pool.start()
+            model_registry.configure(load_models=False)
+            model_registry.add_unload_listener(self.inference_pool.unload)
+            logger.info(f"Using {self.inference_pool.num_workers} inference worker processes")
+
+        # At most one busy second per second for each worker process, or for the in-process engines;
+        # the scheduler plans with what the probe measures below that
+        capacity = app.config.get('SCHEDULER_CAPACITY') or (self.inference_pool.num_workers if self.inference_pool else 1.0)
+        frame_rate_scheduler.configure(
+            capacity=capacity,
+            headroom=app.config.get('SCHEDULER_HEADROOM', 0.9),
+            interval=app.config.get('SCHEDULER_INTERVAL', 1.0),
+            probe=self._measure_busy
+        )
+        if not frame_rate_scheduler.is_alive():
+            frame_rate_scheduler.start()
+
+        detector_changed.connect(self._on_detector_changed)
         self.update_detectors()
 
+    def _measure_busy(self):
+        # Busy inference seconds per second over the utilisation window
+        if self.inference_pool is not None:
+            return sum(worker['utilisation'] for worker in self.inference_pool.get_stats() if worker['alive'])
+        return sum(engine['utilisation'] for engine in model_registry.get_inference_stats())
+
+    def _on_detector_changed(self, detector_id):
+        # Channels are created on demand, drop the ones whose detector was deleted
+        from app.models import Detector
+
+        with self.app.app_context():
+            existing = {row.id for row in Detector.query.with_entities(Detector.id)}
+        with annotated_frames_lock:
+            deleted = (set(annotated_frames) | set(detection_channels)) - existing
+        if deleted:
+            discard_detector_channels(deleted)
+            logger.info(f"Discarded stream channels of deleted detectors: {sorted(deleted)}")
+
     def update_detectors(self, tracking_status={}):
         if not self.app:
             logger.error("DetectorManager not initialized with app context")
@@ -298,6 +606,7 @@ class DetectorManager:
                     logger.error(f"Error during detector update: {e}", exc_info=True)
 
     def _start_detector_thread(self, detector, is_tracking):
+        from app.extensions import db
         from app.models import Camera, Model
         
         try:
@@ -306,8 +615,10 @@ class DetectorManager:
                 logger.warning(f"Camera {detector.camera_id} is not active. Cannot start detector {detector.id}")
                 return
 
-            model = Model.query.get(detector.model_id)
-            if not model or not model.model_file:
+            model = db.session.query(Model.id).filter(
+                Model.id == detector.model_id, Model.model_digest.isnot(None)
+            ).first()
+            if not model:
                 logger.warning(f"Model {detector.model_id} is not valid. Cannot start detector {detector.id}")
                 return
 
@@ -323,7 +634,8 @@ class DetectorManager:
                 camera_stream,
                 camera.ip_address,
                 self.camera_manager,
-                tracking=is_tracking
+                tracking=is_tracking,
+                inference_pool=self.inference_pool
             )
             detector_thread.start()
             self.detectors[detector.id] = detector_thread
@@ -360,9 +672,18 @@ class DetectorManager:
                 self.camera_manager.stop_all()
             except Exception as e:
                 logger.error(f"Error stopping camera streams: {e}")
+
+            model_registry.clear()
+            frame_rate_scheduler.stop()
+
+            if self.inference_pool is not None:
+                self.inference_pool.stop()
             
             global annotated_frames, detector_fps_info
+            for channel in list(annotated_frames.values()) + list(detection_channels.values()):
+                channel.close()
             annotated_frames.clear()
+            detection_channels.clear()
             detector_fps_info.clear()
             
             logger.info("All detectors and camera streams stopped.")
@@ -375,9 +696,18 @@ class DetectorManager:
                 status[detector_id] = {
                     'running': detector_thread.running,
                     'alive': detector_thread.is_alive(),
-                    'has_frames': detector_id in annotated_frames,
+                    'has_frames': get_annotated_channel(detector_id).latest()[1] is not None,
                     'fps': fps_info.get('fps', 0.0),
+                    'target_fps': fps_info.get('target_fps', 0.0),
                     'inference_time': fps_info.get('inference_time', 0.0),
                     'detections': fps_info.get('detections', 0)
                 }
-            return status
\ No newline at end of file
+            return status
+
+    def get_inference_stats(self):
+        stats = {'mode': 'process' if self.inference_pool else 'thread'}
+        if self.inference_pool is not None:
+            stats['workers'] = self.inference_pool.get_stats()
+        else:
+            stats['models'] = model_registry.get_inference_stats()
+        return stats
\ No newline at end of file
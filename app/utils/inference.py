@@ -0,0 +1,273 @@
+import threading
+import time
+import json
+import logging
+import numpy as np
+from collections import deque
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+# Styling shared by every place that draws detections
+ANNOTATION_STYLE = dict(conf=True, labels=True, boxes=True, line_width=2, font_size=12)
+
+# Columns of a detections array: x1, y1, x2, y2, confidence, class id, track id (-1 when untracked)
+DETECTION_COLUMNS = 7
+PERSON_CLASS_ID = 0
+
+# Seconds of busy time behind the utilisation reported by engines and worker processes
+UTILISATION_WINDOW = 10.0
+
+
+def filter_pretrained(result, model_name):
+    # --- Custom pretrained tracking ---
+    # The stock COCO model is only used to find people
+    if model_name and model_name.strip().lower() == 'pretrained':
+        mask = result.boxes.cls == PERSON_CLASS_ID
+        result = result[mask]
+    return result
+
+
+def detections_array(result):
+    """Flatten a Results object into an (N, DETECTION_COLUMNS) float32 array."""
+    boxes = result.boxes
+    detections = np.full((len(boxes), DETECTION_COLUMNS), -1, dtype=np.float32)
+    if len(boxes):
+        detections[:, 0:4] = boxes.xyxy.cpu().numpy()
+        detections[:, 4] = boxes.conf.cpu().numpy()
+        detections[:, 5] = boxes.cls.cpu().numpy()
+        if boxes.id is not None:
+            detections[:, 6] = boxes.id.cpu().numpy()
+    return detections
+
+
+def detection_payload(detections, names, capture_seq, captured_at, shape, roi_points=None, motion_gated=False):
+    """Compact JSON of one frame's detections for browsers drawing their own overlay."""
+    rows = [
+        [round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1), round(confidence, 3), int(class_id), int(track_id)]
+        for x1, y1, x2, y2, confidence, class_id, track_id in detections.tolist()
+    ]
+    present = {row[5] for row in rows}
+    return json.dumps({
+        'seq': capture_seq,
+        'captured_at': captured_at,
+        'detected_at': time.time(),
+        'width': shape[1],
+        'height': shape[0],
+        'columns': ['x1', 'y1', 'x2', 'y2', 'confidence', 'class_id', 'track_id'],
+        'detections': rows,
+        'names': {class_id: names.get(class_id, str(class_id)) for class_id in present},
+        'roi': roi_points,
+        'motion_gated': motion_gated
+    }, separators=(',', ':'))
+
+
+def draw_detections(frame, detections, names):
+    """Draw a detections array on a copy of frame, matching Results.plot(**ANNOTATION_STYLE)."""
+    from ultralytics.utils.plotting import Annotator, colors
+
+    annotator = Annotator(frame.copy(), line_width=ANNOTATION_STYLE['line_width'], font_size=ANNOTATION_STYLE['font_size'])
+    for x1, y1, x2, y2, confidence, class_id, track_id in detections.tolist():
+        class_id = int(class_id)
+        label = f"{names.get(class_id, class_id)} {confidence:.2f}"
+        if track_id >= 0:
+            label = f"id:{int(track_id)} {label}"
+        annotator.box_label((x1, y1, x2, y2), label, color=colors(class_id, True))
+    return annotator.result()
+
+
+class InferenceRequest:
+    def __init__(self, detector_id, frame, imgsz=None):
+        self.detector_id = detector_id
+        self.frame = frame
+        self.imgsz = imgsz
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.result = None
+        self.error = None
+        self.superseded = False
+        self.batch_size = 0
+        self.batch_time = 0.0
+        self.done = threading.Event()
+
+    @property
+    def frame_cost(self):
+        # This frame's share of the forward pass it was batched into
+        return self.batch_time / self.batch_size if self.batch_size else 0.0
+
+    @property
+    def queue_delay(self):
+        if self.started_at is None:
+            return 0.0
+        return self.started_at - self.submitted_at
+
+    def wait(self, timeout=None):
+        """Block until the batch containing this frame ran. Returns a Results or None."""
+        if not self.done.wait(timeout):
+            return None
+        return self.result
+
+
+class BatchInferenceEngine(threading.Thread):
+    """Runs the latest frame of every detector sharing a model as one batched forward pass."""
+
+    def __init__(self, model_entry, max_batch_size=8, max_wait=0.01):
+        super().__init__(name=f"InferenceEngine-{model_entry.digest[:12]}", daemon=True)
+        self.model_entry = model_entry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.running = True
+        self.condition = threading.Condition()
+        # detector_id -> newest InferenceRequest, older frames are superseded
+        self.pending = {}
+
+        # Stats
+        self.batch_sizes = deque(maxlen=100)
+        self.queue_delays = deque(maxlen=100)
+        self.batch_times = deque(maxlen=100)
+        self.total_batches = 0
+        self.total_frames = 0
+        self.superseded_frames = 0
+        self.busy_samples = deque()
+        self.started_at = time.time()
+
+    def submit(self, detector_id, frame, imgsz=None):
+        request = InferenceRequest(detector_id, frame, imgsz)
+        with self.condition:
+            previous = self.pending.get(detector_id)
+            if previous is not None:
+                previous.superseded = True
+                previous.done.set()
+                self.superseded_frames += 1
+            self.pending[detector_id] = request
+            self.condition.notify_all()
+        return request
+
+    def cancel(self, request):
+        """Withdraw a request that has not been batched yet. Returns False if it is already running."""
+        with self.condition:
+            if self.pending.get(request.detector_id) is request:
+                del self.pending[request.detector_id]
+                request.superseded = True
+                request.done.set()
+            return request.done.is_set() or request.started_at is None
+
+    def _expected_batch_size(self):
+        # Every detector holding the model is expected to contribute a frame
+        return max(1, min(self.max_batch_size, self.model_entry.refcount))
+
+    def _collect_batch(self):
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait(timeout=0.5)
+            if not self.running:
+                return []
+
+            oldest = min(r.submitted_at for r in self.pending.values())
+            deadline = oldest + self.max_wait
+            while self.running and len(self.pending) < self._expected_batch_size():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(timeout=remaining)
+
+            batch = sorted(self.pending.values(), key=lambda r: r.submitted_at)[:self.max_batch_size]
+            started_at = time.time()
+            for request in batch:
+                del self.pending[request.detector_id]
+                request.started_at = started_at
+            return batch
+
+    def run(self):
+        logger.info(f"Inference engine started for model {self.model_entry.model_name}")
+
+        while self.running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            started_at = batch[0].started_at
+            # Detectors asking for different input sizes cannot share a forward pass
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.imgsz, []).append(request)
+            try:
+                for imgsz, group in groups.items():
+                    # A failing group only fails its own requests, the others keep their results
+                    try:
+                        kwargs = {'imgsz': imgsz} if imgsz else {}
+                        results = self.model_entry.predict([request.frame for request in group], **kwargs)
+                        for request, result in zip(group, results):
+                            request.result = result
+                    except Exception as e:
+                        logger.error(f"Batched inference failed for model {self.model_entry.model_name} "
+                                     f"(imgsz {imgsz}): {e}", exc_info=True)
+                        for request in group:
+                            request.error = e
+            finally:
+                batch_time = time.time() - started_at
+                for request in batch:
+                    request.frame = None
+                    request.batch_size = len(batch)
+                    request.batch_time = batch_time
+                    request.done.set()
+
+            self.total_batches += 1
+            self.total_frames += len(batch)
+            self.batch_sizes.append(len(batch))
+            self.batch_times.append(batch_time)
+            self.queue_delays.extend(request.queue_delay for request in batch)
+            self._record_busy(batch_time)
+
+        # Release anyone still waiting
+        with self.condition:
+            for request in self.pending.values():
+                request.superseded = True
+                request.done.set()
+            self.pending.clear()
+
+        logger.info(f"Inference engine stopped for model {self.model_entry.model_name}")
+
+    def _record_busy(self, busy):
+        now = time.time()
+        self.busy_samples.append((now, busy))
+        while self.busy_samples and now - self.busy_samples[0][0] > UTILISATION_WINDOW:
+            self.busy_samples.popleft()
+
+    def utilisation(self):
+        """Fraction of the last UTILISATION_WINDOW seconds spent running batches."""
+        now = time.time()
+        window = min(UTILISATION_WINDOW, max(now - self.started_at, 1e-6))
+        busy = sum(b for t, b in list(self.busy_samples) if now - t <= UTILISATION_WINDOW)
+        return min(1.0, busy / window)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def get_stats(self):
+        def average(values):
+            values = list(values)
+            return sum(values) / len(values) if values else 0.0
+
+        return {
+            'model_name': self.model_entry.model_name,
+            'digest': self.model_entry.digest,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+            'total_batches': self.total_batches,
+            'total_frames': self.total_frames,
+            'superseded_frames': self.superseded_frames,
+            'avg_batch_size': round(average(self.batch_sizes), 2),
+            'max_batch_size_seen': max(self.batch_sizes, default=0),
+            'avg_queue_delay': round(average(self.queue_delays) * 1000, 1),
+            'max_queue_delay': round(max(self.queue_delays, default=0.0) * 1000, 1),
+            'avg_batch_time': round(average(self.batch_times) * 1000, 1),
+            'utilisation': round(self.utilisation(), 3)
+        }
@@ -0,0 +1,414 @@
+import os
+import queue
+import threading
+import time
+import logging
+import itertools
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from .inference import ANNOTATION_STYLE, DETECTION_COLUMNS, UTILISATION_WINDOW, filter_pretrained, detections_array
+from .metrics import result_timings
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+MAX_DETECTIONS = 300
+
+
+def lane_views(buffer, shape, max_detections=MAX_DETECTIONS):
+    """Split a lane's shared memory into input frame, annotated frame and detections views."""
+    frame_bytes = int(np.prod(shape))
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=buffer, offset=0)
+    annotated = np.ndarray(shape, dtype=np.uint8, buffer=buffer, offset=frame_bytes)
+    detections = np.ndarray((max_detections, DETECTION_COLUMNS), dtype=np.float32, buffer=buffer, offset=2 * frame_bytes)
+    return frame, annotated, detections
+
+
+def lane_size(shape, max_detections=MAX_DETECTIONS):
+    return 2 * int(np.prod(shape)) + max_detections * DETECTION_COLUMNS * np.dtype(np.float32).itemsize
+
+
+class SharedFrameLane:
+    """Shared memory owned by the parent for one detector's frames and results."""
+
+    def __init__(self, shape):
+        self.capacity = lane_size(shape)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.capacity)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def fits(self, shape):
+        return lane_size(shape) <= self.capacity
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # The parent owns the segment, keep this process' resource tracker from unlinking it on exit
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def _detach(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # Views of the previous frame are still alive, the mapping goes once they are collected
+        pass
+
+
+def _worker_main(worker_index, threads, request_queue, response_queue):
+    import torch
+    from ultralytics import YOLO
+    from .tracker import DetectorTracker
+
+    torch.set_num_threads(threads)
+
+    models = {}
+    trackers = {}
+    lanes = {}
+
+    while True:
+        message = request_queue.get()
+        if message is None:
+            break
+
+        kind = message['kind']
+        if kind == 'release':
+            trackers.pop(message['detector_id'], None)
+            lane = lanes.pop(message['detector_id'], None)
+            if lane is not None:
+                _detach(lane)
+            continue
+
+        if kind == 'unload':
+            models.pop(message['weights_path'], None)
+            continue
+
+        detector_id = message['detector_id']
+        started = time.time()
+        try:
+            lane = lanes.get(detector_id)
+            if lane is None or lane.name != message['lane']:
+                if lane is not None:
+                    _detach(lane)
+                lane = lanes[detector_id] = _attach(message['lane'])
+            frame, annotated, detections = lane_views(lane.buf, message['shape'])
+
+            weights_path = message['weights_path']
+            if weights_path not in models:
+                # Same construction as the model registry, exported artifacts need the task
+                if message['variant'] == 'pt':
+                    models[weights_path] = YOLO(weights_path)
+                else:
+                    models[weights_path] = YOLO(weights_path, task='detect')
+            model = models[weights_path]
+
+            kwargs = {'imgsz': message['imgsz']} if message['imgsz'] else {}
+            result = model.predict(frame, verbose=False, **kwargs)[0]
+            timings = result_timings(result)
+            if message['tracking']:
+                if detector_id not in trackers:
+                    trackers[detector_id] = DetectorTracker()
+                stage_start = time.time()
+                result = trackers[detector_id].update(result, frame)
+                timings['track'] = time.time() - stage_start
+            stage_start = time.time()
+            result = filter_pretrained(result, message['model_name'])
+
+            rows = detections_array(result)[:MAX_DETECTIONS]
+            detections[:len(rows)] = rows
+            timings['filter'] = time.time() - stage_start
+            if message['annotate']:
+                stage_start = time.time()
+                annotated[:] = result.plot(**ANNOTATION_STYLE)
+                timings['plot'] = time.time() - stage_start
+
+            response_queue.put({
+                'call_id': message['call_id'],
+                'count': len(rows),
+                # Only sent until the parent has them
+                'names': model.names if message['want_names'] else None,
+                'timings': timings,
+                'busy': time.time() - started
+            })
+        except Exception as e:
+            response_queue.put({
+                'call_id': message['call_id'],
+                'error': f"{type(e).__name__}: {e}",
+                'busy': time.time() - started
+            })
+
+    for lane in lanes.values():
+        _detach(lane)
+
+
+class WorkerResult:
+    def __init__(self, detections, annotated_frame, names, inference_time, timings=None):
+        self.detections = detections
+        self.annotated_frame = annotated_frame
+        self.names = names
+        self.inference_time = inference_time
+        # Stage name -> seconds, measured in the worker
+        self.timings = timings or {}
+
+
+class InferenceWorker:
+    def __init__(self, index, context, threads):
+        self.index = index
+        self.context = context
+        self.threads = threads
+        self.process = None
+        self.request_queue = None
+        self.response_queue = None
+        self.dispatcher = None
+        self.busy_samples = deque()
+        self.total_requests = 0
+        self.total_busy = 0.0
+        self.errors = 0
+        self.started_at = time.time()
+
+    def start(self, on_response):
+        self.request_queue = self.context.Queue()
+        self.response_queue = self.context.Queue()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(self.index, self.threads, self.request_queue, self.response_queue),
+            name=f"InferenceWorker-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+        self.started_at = time.time()
+        self.dispatcher = threading.Thread(
+            target=self._dispatch, args=(on_response,),
+            name=f"InferenceWorkerDispatch-{self.index}", daemon=True
+        )
+        self.dispatcher.start()
+        logger.info(f"Started inference worker {self.index} (pid {self.process.pid}, {self.threads} threads)")
+
+    def _dispatch(self, on_response):
+        while True:
+            try:
+                response = self.response_queue.get(timeout=1.0)
+            except queue.Empty:
+                if self.process is None or not self.process.is_alive():
+                    break
+                continue
+            except (EOFError, OSError):
+                break
+
+            self.record_busy(response.get('busy', 0.0))
+            on_response(response)
+
+    def record_busy(self, busy):
+        now = time.time()
+        self.total_requests += 1
+        self.total_busy += busy
+        self.busy_samples.append((now, busy))
+        while self.busy_samples and now - self.busy_samples[0][0] > UTILISATION_WINDOW:
+            self.busy_samples.popleft()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def send(self, message):
+        self.request_queue.put(message)
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.request_queue.put(None)
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        except Exception as e:
+            logger.warning(f"Error stopping inference worker {self.index}: {e}")
+
+    def get_stats(self, assigned):
+        window = min(UTILISATION_WINDOW, max(time.time() - self.started_at, 1e-6))
+        busy = sum(b for _, b in self.busy_samples)
+        return {
+            'worker': self.index,
+            'pid': self.process.pid if self.process else None,
+            'alive': self.is_alive(),
+            'threads': self.threads,
+            'assigned_detectors': assigned,
+            'total_requests': self.total_requests,
+            'errors': self.errors,
+            'utilisation': round(min(1.0, busy / window), 3),
+            'avg_busy_time': round(self.total_busy / self.total_requests * 1000, 1) if self.total_requests else 0.0
+        }
+
+
+class _PendingCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+
+
+class InferenceWorkerPool:
+    """Runs detector inference, tracking and plotting in worker processes.
+
+    Every detector is pinned to one worker (its tracker lives there) and owns a
+    shared memory lane, so frames and results never get pickled.
+    """
+
+    def __init__(self, num_workers=None):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context('spawn')
+        threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.workers = [InferenceWorker(i, self.context, threads) for i in range(self.num_workers)]
+        self.assignments = {}
+        self.lanes = {}
+        self.names = {}
+        self.pending = {}
+        self.call_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            for worker in self.workers:
+                worker.start(self._on_response)
+            self.started = True
+
+    def _on_response(self, response):
+        with self.lock:
+            call = self.pending.pop(response['call_id'], None)
+        if call is not None:
+            call.response = response
+            call.done.set()
+
+    def _worker_for(self, detector_id):
+        with self.lock:
+            index = self.assignments.get(detector_id)
+            if index is None:
+                load = [0] * self.num_workers
+                for assigned in self.assignments.values():
+                    load[assigned] += 1
+                index = load.index(min(load))
+                self.assignments[detector_id] = index
+                logger.info(f"Detector {detector_id} assigned to inference worker {index}")
+
+            worker = self.workers[index]
+            if not worker.is_alive():
+                logger.warning(f"Inference worker {index} is not running, restarting")
+                worker.start(self._on_response)
+            return worker
+
+    def _lane_for(self, detector_id, shape):
+        lane = self.lanes.get(detector_id)
+        if lane is None or not lane.fits(shape):
+            if lane is not None:
+                lane.close()
+            lane = self.lanes[detector_id] = SharedFrameLane(shape)
+        return lane
+
+    def infer(self, detector_id, frame, weights_path, model_name, tracking=False, annotate=True, imgsz=None,
+              variant='pt', timeout=10.0):
+        """Run one frame for a detector. Returns a WorkerResult or None on failure."""
+        if not self.started:
+            self.start()
+
+        worker = self._worker_for(detector_id)
+        lane = self._lane_for(detector_id, frame.shape)
+        frame_view, annotated_view, detections_view = lane_views(lane.shm.buf, frame.shape)
+        frame_view[:] = frame
+
+        call_id = next(self.call_ids)
+        call = _PendingCall()
+        with self.lock:
+            self.pending[call_id] = call
+
+        started = time.time()
+        worker.send({
+            'kind': 'infer',
+            'call_id': call_id,
+            'detector_id': detector_id,
+            'lane': lane.name,
+            'shape': frame.shape,
+            'weights_path': weights_path,
+            'variant': variant,
+            'want_names': weights_path not in self.names,
+            'model_name': model_name,
+            'tracking': tracking,
+            'annotate': annotate,
+            'imgsz': imgsz
+        })
+
+        if not call.done.wait(timeout):
+            with self.lock:
+                self.pending.pop(call_id, None)
+            # The worker may still be using the lane, the next call gets a fresh one and the
+            # late response is dropped since its call_id is no longer pending
+            del frame_view, annotated_view, detections_view
+            if self.lanes.get(detector_id) is lane:
+                del self.lanes[detector_id]
+            lane.close()
+            logger.warning(f"Inference worker {worker.index} timed out for detector {detector_id}, lane retired")
+            return None
+
+        response = call.response
+        if 'error' in response:
+            worker.errors += 1
+            logger.error(f"Inference worker {worker.index} failed for detector {detector_id}: {response['error']}")
+            return None
+
+        if response['names'] is not None:
+            self.names[weights_path] = response['names']
+
+        # Copy out of the lane, the next call for this detector overwrites it
+        detections = detections_view[:response['count']].copy()
+        annotated_frame = annotated_view.copy() if annotate else None
+        elapsed = time.time() - started
+        timings = dict(response.get('timings', {}), queue_wait=max(0.0, elapsed - response['busy']))
+        return WorkerResult(detections, annotated_frame, self.names.get(weights_path, {}), elapsed, timings)
+
+    def release(self, detector_id):
+        with self.lock:
+            index = self.assignments.pop(detector_id, None)
+        if index is not None and self.workers[index].is_alive():
+            self.workers[index].send({'kind': 'release', 'detector_id': detector_id})
+        lane = self.lanes.pop(detector_id, None)
+        if lane is not None:
+            lane.close()
+
+    def unload(self, weights_path):
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.send({'kind': 'unload', 'weights_path': weights_path})
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        for lane in self.lanes.values():
+            lane.close()
+        self.lanes.clear()
+        self.assignments.clear()
+        self.started = False
+
+    def get_stats(self):
+        with self.lock:
+            assigned = [[d for d, i in self.assignments.items() if i == worker.index] for worker in self.workers]
+        return [worker.get_stats(assigned[worker.index]) for worker in self.workers]
@@ -0,0 +1,92 @@
+import threading
+from collections import deque
+import numpy as np
+from .metrics import metrics, camera_label
+
+# Capture-relative stages, in pipeline order:
+#   source_lag - how far capture reads trail the camera's own clock (RTSP buffering)
+#   detected   - capture to annotated frame published by a detector
+#   delivered_camera, delivered_detector - capture to MJPEG part written to a viewer of that stream
+LATENCY_WINDOW = 1000
+
+frame_age_seconds = metrics.histogram(
+    'detectorcam_frame_age_seconds',
+    'Age of a frame since capture when it reaches each pipeline stage.',
+    ('camera', 'stage'),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 2.0, 5.0, 10.0)
+)
+
+
+class LatencyTracker:
+    """Rolling per-camera frame age samples, summarised as percentiles."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, camera_ip, stage, seconds):
+        label = camera_label(camera_ip)
+        frame_age_seconds.observe(seconds, camera=label, stage=stage)
+        with self.lock:
+            key = (label, stage)
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.window)
+            self.samples[key].append(seconds)
+
+    def discard(self, camera_ip):
+        label = camera_label(camera_ip)
+        with self.lock:
+            for key in [k for k in self.samples if k[0] == label]:
+                del self.samples[key]
+
+    def get_stats(self):
+        with self.lock:
+            snapshot = {key: list(values) for key, values in self.samples.items()}
+
+        stats = {}
+        for (label, stage), values in snapshot.items():
+            if not values:
+                continue
+            values = np.asarray(values) * 1000
+            stats.setdefault(label, {})[stage] = {
+                'p50': round(float(np.percentile(values, 50)), 1),
+                'p90': round(float(np.percentile(values, 90)), 1),
+                'p99': round(float(np.percentile(values, 99)), 1),
+                'max': round(float(values.max()), 1),
+                'samples': len(values)
+            }
+        return stats
+
+
+class SourceClock:
+    """Estimates how far reads trail a camera's own timestamps.
+
+    The smallest wall-minus-stream offset seen is taken as zero lag, so a decoder
+    queue building up behind a live RTSP source shows as a growing lag.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.min_offset = None
+        self.last_pts = None
+
+    def update(self, read_at, pts_ms):
+        """Lag in seconds for a frame read at read_at with stream position pts_ms, or None."""
+        if not pts_ms or pts_ms <= 0:
+            return None
+        if self.last_pts is not None and pts_ms < self.last_pts:
+            # Stream restarted or a file looped
+            self.min_offset = None
+        self.last_pts = pts_ms
+
+        offset = read_at - pts_ms / 1000.0
+        if self.min_offset is None or offset < self.min_offset:
+            self.min_offset = offset
+        return offset - self.min_offset
+
+
+# Shared by the camera streams, detector threads and stream endpoints
+latency_tracker = LatencyTracker()
@@ -0,0 +1,223 @@
+import bisect
+import threading
+
+# Seconds, spanning a sub-millisecond JPEG encode up to a stalled RTSP read
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def camera_label(ip_address):
+    """Camera source without credentials, RTSP URLs often carry user:password@."""
+    scheme, sep, rest = str(ip_address).partition('://')
+    if not sep:
+        scheme, rest = '', scheme
+    host, slash, path = rest.partition('/')
+    host = host.rpartition('@')[2]
+    return f"{scheme}{sep}{host}{slash}{path}"
+
+
+def source_label(source_key):
+    """Label for an EncodedFrameCache source key such as ('camera', ip) or ('detector', id)."""
+    kind, ident = source_key
+    return f"camera:{camera_label(ident)}" if kind == 'camera' else f"{kind}:{ident}"
+
+
+def result_timings(result):
+    """Per-image preprocess, inference and postprocess seconds of an ultralytics Results."""
+    speed = getattr(result, 'speed', None) or {}
+    return {stage: speed[stage] / 1000.0 for stage in ('preprocess', 'inference', 'postprocess') if speed.get(stage) is not None}
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def remove(self, **labels):
+        """Drop one label set, e.g. when a detector or camera is deleted."""
+        with self.lock:
+            self.values.pop(self._key(labels), None)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Per-bucket counts (last one is +Inf), sum
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        with self.lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+
+        lines = self.header()
+        bounds = self.buckets + (float('inf'),)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Hot paths only touch a dict under a lock. Values that already live elsewhere
+    (detector FPS, scheduler targets) are copied in by collectors at scrape time.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """Register a callable run before every scrape to refresh gauges."""
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+# Pipeline stages: capture_read, queue_wait, preprocess, inference, postprocess,
+# track, filter, plot, encode (encode_<tier> for scaled stream tiers) and send.
+# Source is camera:<ip> or detector:<id>.
+stage_seconds = metrics.histogram(
+    'detectorcam_stage_seconds',
+    'Time spent in each stage of the capture, detection and streaming pipeline.',
+    ('stage', 'source')
+)
+frames_processed = metrics.counter(
+    'detectorcam_frames_processed_total',
+    'Frames a detector published.',
+    ('detector',)
+)
+frames_skipped = metrics.counter(
+    'detectorcam_frames_skipped_total',
+    'Frames a detector did not run the model on, by reason (motion_gated, superseded, failed).',
+    ('detector', 'reason')
+)
+frames_dropped = metrics.counter(
+    'detectorcam_frames_dropped_total',
+    'Captured frames discarded because every ring slot was pinned by a consumer.',
+    ('camera',)
+)
+camera_reconnects = metrics.counter(
+    'detectorcam_camera_reconnects_total',
+    'Reconnect attempts to a camera source.',
+    ('camera',)
+)
+stream_clients = metrics.gauge(
+    'detectorcam_stream_clients',
+    'Connected MJPEG viewers.',
+    ('source',)
+)
+detector_fps = metrics.gauge(
+    'detectorcam_detector_fps',
+    'Rolling published frames per second of a detector.',
+    ('detector',)
+)
+detector_target_fps = metrics.gauge(
+    'detectorcam_detector_target_fps',
+    'Frame rate granted to a detector by the scheduler.',
+    ('detector',)
+)
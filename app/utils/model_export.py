@@ -0,0 +1,269 @@
+import os
+import json
+import queue
+import threading
+import time
+import logging
+import numpy as np
+from .model_store import model_store
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+# Artifact variants and the file suffix they are stored under
+VARIANT_SUFFIXES = {
+    'onnx': '.onnx',
+    'int8': '.int8.onnx'
+}
+
+# Float ONNX built only to calibrate an int8 export, never registered as an artifact
+CALIBRATION_SUFFIX = '.calibration.onnx'
+
+WARMUP_RUNS = 3
+
+
+def measure_latency(yolo_model, imgsz, runs=20):
+    """Median single-frame predict time in milliseconds on a fixed synthetic frame."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(imgsz, imgsz, 3), dtype=np.uint8)
+
+    for _ in range(WARMUP_RUNS):
+        yolo_model.predict(frame, imgsz=imgsz, verbose=False)
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        yolo_model.predict(frame, imgsz=imgsz, verbose=False)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings) * 1000)
+
+
+def artifact_path(digest, variant):
+    return model_store.path_for(digest, VARIANT_SUFFIXES[variant])
+
+
+class ModelExporter(threading.Thread):
+    """Builds CPU-optimised artifacts of uploaded weights in the background.
+
+    One export runs at a time so the detectors keep most of the CPU. Finished
+    artifacts invalidate the cached model, and detectors reload onto them.
+    """
+
+    def __init__(self):
+        super().__init__(name="ModelExporter", daemon=True)
+        self.queue = queue.Queue()
+        self.app = None
+        self.imgsz = 640
+        self.benchmark_runs = 20
+        self.calibration_frames = 32
+        self.calibration_interval = 0.5
+        self.running = True
+        self.current = None
+
+    def init_app(self, app):
+        from app.models import ModelArtifact
+
+        self.app = app
+        self.imgsz = app.config.get('INFERENCE_IMGSZ') or self.imgsz
+        self.benchmark_runs = app.config.get('MODEL_BENCHMARK_RUNS', self.benchmark_runs)
+        self.calibration_frames = app.config.get('QUANT_CALIBRATION_FRAMES', self.calibration_frames)
+        self.calibration_interval = app.config.get('QUANT_SAMPLE_INTERVAL', self.calibration_interval)
+        self.start()
+
+        # Exports interrupted by a restart are picked up again
+        with app.app_context():
+            for artifact in ModelArtifact.query.filter_by(status='pending').all():
+                self.queue.put((artifact.model_digest, artifact.variant))
+
+    def submit(self, digest, variant='onnx', force=False):
+        """Queue an export, call from a request. Returns the ModelArtifact row."""
+        from app.extensions import db
+        from app.models import ModelArtifact
+
+        artifact = ModelArtifact.query.filter_by(model_digest=digest, variant=variant).first()
+        if artifact is not None and artifact.status in ('pending', 'ready') and not force:
+            return artifact
+
+        if artifact is None:
+            artifact = ModelArtifact(model_digest=digest, variant=variant)
+            db.session.add(artifact)
+        artifact.status = 'pending'
+        artifact.error = None
+        db.session.commit()
+
+        self.queue.put((digest, variant))
+        logger.info(f"Queued {variant} export of model weights {digest[:12]}")
+        return artifact
+
+    def run(self):
+        logger.info("Model exporter started")
+        while self.running:
+            try:
+                job = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if job is None:
+                break
+
+            self.current = job
+            try:
+                self._export(*job)
+            finally:
+                self.current = None
+        logger.info("Model exporter stopped")
+
+    def _export(self, digest, variant):
+        from app.extensions import db
+        from app.models import ModelArtifact
+        from .model_registry import model_registry
+
+        with self.app.app_context():
+            artifact = ModelArtifact.query.filter_by(model_digest=digest, variant=variant).first()
+            if artifact is None or artifact.status != 'pending':
+                # Deleted or already handled while queued
+                return
+
+            source_path = model_store.path_for(digest)
+            started = time.time()
+            try:
+                if not os.path.exists(source_path):
+                    raise FileNotFoundError(f"Weights {digest[:12]} are missing from the model store")
+
+                if variant == 'onnx':
+                    self._export_onnx(artifact, source_path)
+                elif variant == 'int8':
+                    self._export_int8(artifact, source_path)
+                else:
+                    raise ValueError(f"Unknown artifact variant: {variant}")
+
+                artifact.file_size = os.path.getsize(artifact_path(digest, variant))
+                artifact.status = 'ready'
+                artifact.error = None
+                db.session.commit()
+                logger.info(
+                    f"Exported {variant} for {digest[:12]} in {time.time() - started:.0f}s: "
+                    f"{artifact.baseline_latency_ms:.1f}ms -> {artifact.latency_ms:.1f}ms"
+                )
+
+                # Detectors that would pick this artifact reload onto it
+                model_registry.invalidate_export(digest, variant)
+
+            except Exception as e:
+                db.session.rollback()
+                artifact = ModelArtifact.query.filter_by(model_digest=digest, variant=variant).first()
+                if artifact is not None:
+                    artifact.status = 'failed'
+                    artifact.error = f"{type(e).__name__}: {e}"
+                    db.session.commit()
+                logger.error(f"Export of {variant} for {digest[:12]} failed: {e}", exc_info=True)
+
+    def _export_onnx(self, artifact, source_path):
+        from ultralytics import YOLO
+
+        source_model = YOLO(source_path)
+        artifact.baseline_latency_ms = measure_latency(source_model, self.imgsz, self.benchmark_runs)
+
+        target = artifact_path(artifact.model_digest, 'onnx')
+        self._build_onnx(source_model, target)
+
+        onnx_model = YOLO(target, task='detect')
+        artifact.latency_ms = measure_latency(onnx_model, self.imgsz, self.benchmark_runs)
+
+    def _build_onnx(self, source_model, target):
+        # Dynamic axes keep per-camera input sizes and batched inference working
+        exported = source_model.export(format='onnx', imgsz=self.imgsz, dynamic=True, simplify=True)
+        if os.path.abspath(exported) != os.path.abspath(target):
+            os.replace(exported, target)
+        return target
+
+    def _float_onnx(self, digest, source_path):
+        """(path, baseline latency or None, temporary) of a float ONNX export to calibrate on.
+
+        Uses the onnx artifact when one is ready. Otherwise a temporary export is built
+        that detectors never load, only an explicit onnx export switches them to ONNX.
+        """
+        from ultralytics import YOLO
+        from app.models import ModelArtifact
+
+        artifact = ModelArtifact.query.filter_by(model_digest=digest, variant='onnx').first()
+        if artifact is not None and artifact.status == 'ready' and os.path.exists(artifact_path(digest, 'onnx')):
+            return artifact_path(digest, 'onnx'), artifact.baseline_latency_ms, False
+
+        target = model_store.path_for(digest, CALIBRATION_SUFFIX)
+        return self._build_onnx(YOLO(source_path), target), None, True
+
+    def _calibration_cameras(self, digest):
+        from app.models import Camera, Detector, Model
+
+        rows = Camera.query.join(Detector, Detector.camera_id == Camera.id).join(
+            Model, Model.id == Detector.model_id
+        ).filter(Model.model_digest == digest, Camera.status == True).all()
+        return [camera.ip_address for camera in rows]
+
+    def _export_int8(self, artifact, source_path):
+        from ultralytics import YOLO
+        from .quantization import sample_camera_frames, quantize_onnx, accuracy_drift
+
+        digest = artifact.model_digest
+        # Calibrate on the scenes the model will actually see
+        camera_ips = self._calibration_cameras(digest)
+        if not camera_ips:
+            raise RuntimeError("No active camera has a detector using this model, nothing to calibrate on")
+        frames = sample_camera_frames(self.app, camera_ips, self.calibration_frames, self.calibration_interval)
+        if not frames:
+            raise RuntimeError(f"Could not read calibration frames from {', '.join(camera_ips)}")
+
+        float_path, baseline_latency, temporary = self._float_onnx(digest, source_path)
+        try:
+            target = artifact_path(digest, 'int8')
+            quantize_onnx(float_path, target, frames, self.imgsz)
+
+            float_model = YOLO(float_path, task='detect')
+            int8_model = YOLO(target, task='detect')
+            drift = accuracy_drift(float_model, int8_model, frames, self.imgsz)
+
+            artifact.baseline_latency_ms = baseline_latency or measure_latency(YOLO(source_path), self.imgsz, self.benchmark_runs)
+            artifact.latency_ms = measure_latency(int8_model, self.imgsz, self.benchmark_runs)
+            artifact.metrics = json.dumps(dict(
+                drift,
+                float_onnx_latency_ms=round(measure_latency(float_model, self.imgsz, self.benchmark_runs), 1),
+                calibration_frames=len(frames),
+                cameras=camera_ips,
+                imgsz=self.imgsz
+            ))
+        finally:
+            if temporary:
+                model_store.delete(digest, CALIBRATION_SUFFIX)
+
+    def stop(self):
+        self.running = False
+        self.queue.put(None)
+
+    def get_stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'current': {'digest': self.current[0], 'variant': self.current[1]} if self.current else None
+        }
+
+
+def discard_artifacts(digest):
+    """Remove every artifact of weights that are no longer used by any model."""
+    from app.extensions import db
+    from app.models import ModelArtifact
+
+    for artifact in ModelArtifact.query.filter_by(model_digest=digest).all():
+        if artifact.variant in VARIANT_SUFFIXES:
+            model_store.delete(digest, VARIANT_SUFFIXES[artifact.variant])
+        db.session.delete(artifact)
+    # Left behind if an int8 export was interrupted
+    model_store.delete(digest, CALIBRATION_SUFFIX)
+    db.session.commit()
+
+
+# Background exporter shared by the model blueprint
+model_exporter = ModelExporter()
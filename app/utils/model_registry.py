@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+import logging
+from ultralytics import YOLO
+from .inference import BatchInferenceEngine
+from .model_store import model_store
+from .model_export import artifact_path
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+
+class ModelEntry:
+    """A loaded YOLO model shared by every detector that uses the same weights."""
+
+    def __init__(self, digest, model_id, model_name, weights_path, yolo_model, variant='pt'):
+        self.digest = digest
+        self.variant = variant
+        self.model_ids = {model_id}
+        self.model_name = model_name
+        self.weights_path = weights_path
+        self.yolo_model = yolo_model
+        self.refcount = 0
+        self.stale = False
+        # Precisions whose detectors should move to a newer variant, the others keep this entry
+        self.outdated = set()
+        self.last_used = time.time()
+        # YOLO predictors keep per-call state, so inference on a shared instance is serialized
+        self.lock = threading.Lock()
+        self.engine = None
+
+    @property
+    def key(self):
+        return (self.digest, self.variant)
+
+    def needs_reload(self, precision):
+        return self.stale or precision in self.outdated
+
+    def predict(self, frames, **kwargs):
+        with self.lock:
+            return self.yolo_model.predict(frames, verbose=False, **kwargs)
+
+    def __repr__(self):
+        return f'<ModelEntry {self.model_name} ({self.digest[:12]}, {self.variant}) refs={self.refcount}>'
+
+
+class ModelRegistry:
+    def __init__(self, max_idle_models=2, max_batch_size=8, max_batch_wait=0.01, load_models=True):
+        # (digest, variant) -> ModelEntry
+        self.entries = {}
+        self.max_idle_models = max_idle_models
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        # False when inference runs in worker processes, which load the weights file themselves
+        self.load_models = load_models
+        self.unload_listeners = []
+        # (digest, variant) -> Event set once the load in progress finished, loads run outside the lock
+        self.loading = {}
+        # (digest, variant) of exported artifacts that failed to load, skipped until re-exported
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def configure(self, max_idle_models=None, max_batch_size=None, max_batch_wait=None, load_models=None):
+        if max_idle_models is not None:
+            self.max_idle_models = max_idle_models
+        if max_batch_size is not None:
+            self.max_batch_size = max_batch_size
+        if max_batch_wait is not None:
+            self.max_batch_wait = max_batch_wait
+        if load_models is not None:
+            self.load_models = load_models
+
+    def add_unload_listener(self, listener):
+        """Call listener(weights_path) whenever a model leaves the cache."""
+        self.unload_listeners.append(listener)
+
+    def acquire(self, app, model_id, precision='float'):
+        from app.extensions import db
+        from app.models import Model, ModelArtifact
+
+        with app.app_context():
+            row = db.session.query(Model.model_name, Model.model_digest).filter(Model.id == model_id).first()
+            ready = {
+                artifact.variant for artifact in db.session.query(ModelArtifact.variant).filter(
+                    ModelArtifact.model_digest == (row.model_digest if row else None),
+                    ModelArtifact.status == 'ready'
+                )
+            }
+        if row is None or not row.model_digest:
+            logger.error(f"Model {model_id} does not exist or has no weights")
+            return None
+
+        digest = row.model_digest
+        while True:
+            variant = self._pick_variant(digest, ready, precision)
+            key = (digest, variant)
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    return self._hold(entry, model_id, row.model_name, precision)
+                loading = self.loading.get(key)
+                if loading is None:
+                    loading = self.loading[key] = threading.Event()
+                    break
+            # Another detector is loading the same weights, share its entry once it is done
+            loading.wait()
+
+        # Loading takes seconds, other detectors keep acquiring and releasing meanwhile
+        entry, error = None, None
+        try:
+            entry = self._load_variant(digest, model_id, row.model_name, variant)
+        except Exception as e:
+            error = e
+            logger.error(f"Error loading model ID: {model_id} ({variant}): {e}")
+        finally:
+            with self.lock:
+                del self.loading[key]
+                if entry is not None:
+                    self.entries[key] = entry
+                    entry = self._hold(entry, model_id, row.model_name, precision)
+                elif variant != 'pt':
+                    self.failed.add(key)
+            loading.set()
+
+        if entry is None and variant != 'pt':
+            # Fall back to the original weights, and keep later acquires from retrying the artifact
+            self._mark_failed(app, digest, variant, error)
+            return self.acquire(app, model_id, precision)
+        return entry
+
+    def _pick_variant(self, digest, ready, precision):
+        # Prefer the CPU-optimised export when one has been built and loads
+        usable = {variant for variant in ready if (digest, variant) not in self.failed}
+        if precision == 'int8' and 'int8' in usable:
+            return 'int8'
+        if 'onnx' in usable:
+            return 'onnx'
+        return 'pt'
+
+    def _hold(self, entry, model_id, model_name, precision):
+        # Same weights under another model row, after a name-only edit, or the .pt fallback
+        entry.model_ids.add(model_id)
+        entry.stale = False
+        entry.outdated.discard(precision)
+
+        entry.refcount += 1
+        entry.model_name = model_name
+        entry.last_used = time.time()
+        return entry
+
+    def _mark_failed(self, app, digest, variant, error):
+        from app.extensions import db
+        from app.models import ModelArtifact
+
+        try:
+            with app.app_context():
+                artifact = ModelArtifact.query.filter_by(model_digest=digest, variant=variant).first()
+                if artifact is not None and artifact.status == 'ready':
+                    artifact.status = 'failed'
+                    artifact.error = f"Could not be loaded: {error}"
+                    db.session.commit()
+                    logger.warning(f"Marked {variant} artifact of {digest[:12]} as failed, using the .pt weights")
+        except Exception as e:
+            logger.error(f"Could not mark {variant} artifact of {digest[:12]} as failed: {e}")
+
+    def release(self, entry):
+        if entry is None:
+            return
+
+        with self.lock:
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.time()
+            self._evict()
+
+    def invalidate(self, model_id):
+        """Mark every loaded version of a model as stale so detectors reload it."""
+        with self.lock:
+            for entry in self.entries.values():
+                if model_id in entry.model_ids:
+                    entry.stale = True
+                    logger.info(f"Invalidated cached model {entry}")
+
+            self._evict()
+
+    def invalidate_export(self, digest, variant):
+        """Move detectors onto a freshly exported variant of some weights, leaving the rest loaded."""
+        with self.lock:
+            # A fresh export gets another chance to load
+            self.failed.discard((digest, variant))
+            for entry in self.entries.values():
+                if entry.digest != digest:
+                    continue
+                if variant == 'int8' and entry.variant != 'int8':
+                    # Only int8 detectors pick the int8 export, float ones keep this entry
+                    entry.outdated.add('int8')
+                    logger.info(f"Cached model {entry} outdated for int8 detectors")
+                elif entry.variant in (variant, 'pt'):
+                    # Every detector on it prefers the new export
+                    entry.stale = True
+                    logger.info(f"Invalidated cached model {entry}")
+
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            for entry in list(self.entries.values()):
+                self._unload(entry)
+            self.entries.clear()
+
+    def get_status(self):
+        with self.lock:
+            return [
+                {
+                    'model_ids': sorted(entry.model_ids),
+                    'model_name': entry.model_name,
+                    'digest': entry.digest,
+                    'variant': entry.variant,
+                    'refcount': entry.refcount,
+                    'stale': entry.stale,
+                    'last_used': entry.last_used
+                }
+                for entry in self.entries.values()
+            ]
+
+    def get_inference_stats(self):
+        with self.lock:
+            return [entry.engine.get_stats() for entry in self.entries.values() if entry.engine]
+
+    def _load_variant(self, digest, model_id, model_name, variant):
+        """Build a ModelEntry for one variant of some weights, raises when they cannot be loaded."""
+        # Weights are read straight from the model store, no temporary copy
+        weights_path = model_store.path_for(digest) if variant == 'pt' else artifact_path(digest, variant)
+        if not os.path.exists(weights_path):
+            raise FileNotFoundError(f"weights {digest[:12]} ({variant}) are missing from the model store")
+
+        if not self.load_models:
+            return ModelEntry(digest, model_id, model_name, weights_path, None, variant)
+
+        yolo_model = YOLO(weights_path) if variant == 'pt' else YOLO(weights_path, task='detect')
+        logger.info(f"Loaded model {model_name} ({digest[:12]}, {variant}) for model ID: {model_id}")
+
+        entry = ModelEntry(digest, model_id, model_name, weights_path, yolo_model, variant)
+        entry.engine = BatchInferenceEngine(entry, self.max_batch_size, self.max_batch_wait)
+        entry.engine.start()
+        return entry
+
+    def _evict(self):
+        # Stale entries go as soon as nobody holds them, the rest are kept as an LRU of idle models
+        for entry in [e for e in self.entries.values() if e.stale and e.refcount == 0]:
+            self._unload(entry)
+
+        idle = sorted(
+            (e for e in self.entries.values() if e.refcount == 0),
+            key=lambda e: e.last_used
+        )
+        while len(idle) > self.max_idle_models:
+            self._unload(idle.pop(0))
+
+    def _unload(self, entry):
+        self.entries.pop(entry.key, None)
+        if entry.engine:
+            entry.engine.stop()
+
+        for listener in self.unload_listeners:
+            try:
+                listener(entry.weights_path)
+            except Exception as e:
+                logger.warning(f"Model unload listener failed: {e}")
+
+        logger.info(f"Evicted model {entry.model_name} ({entry.digest[:12]}) from cache")
+
+
+# Process-wide registry shared by all detectors
+model_registry = ModelRegistry()
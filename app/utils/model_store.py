@@ -0,0 +1,104 @@
+import os
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ModelStore:
+    """Content-addressed directory of model weights, one file per SHA-256 digest.
+
+    Identical uploads share a file, and the database only keeps the digest.
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def init_app(self, app):
+        self.root = app.config['MODEL_STORE_DIR']
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, digest, suffix='.pt'):
+        return os.path.join(self.root, digest[:2], f"{digest}{suffix}")
+
+    def exists(self, digest, suffix='.pt'):
+        return os.path.exists(self.path_for(digest, suffix))
+
+    def save_stream(self, stream, suffix='.pt'):
+        """Hash and write a file-like object chunk by chunk. Returns (digest, size)."""
+        sha256 = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, suffix='.part', delete=False) as temp_file:
+            try:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            except Exception:
+                temp_file.close()
+                os.unlink(temp_file.name)
+                raise
+
+        digest = sha256.hexdigest()
+        path = self.path_for(digest, suffix)
+        if os.path.exists(path):
+            # Same weights were uploaded before
+            os.unlink(temp_file.name)
+            logger.info(f"Model weights {digest[:12]} already stored, reusing")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_file.name, path)
+            logger.info(f"Stored model weights {digest[:12]} ({size} bytes)")
+        return digest, size
+
+    def save_file(self, source_path, suffix='.pt'):
+        with open(source_path, 'rb') as source:
+            return self.save_stream(source, suffix)
+
+    def save_bytes(self, data, suffix='.pt'):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, suffix)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.root, suffix='.part', delete=False) as temp_file:
+                temp_file.write(data)
+            os.replace(temp_file.name, path)
+        return digest, len(data)
+
+    def delete(self, digest, suffix='.pt'):
+        path = self.path_for(digest, suffix)
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+                logger.info(f"Removed model weights {digest[:12]}")
+        except Exception as e:
+            logger.warning(f"Failed to remove model weights {path}: {e}")
+
+
+def migrate_legacy_blobs(app):
+    """Move weights still stored in Model.model_file into the store, one row at a time."""
+    from app.extensions import db
+    from app.models import Model
+
+    with app.app_context():
+        legacy_ids = [row.id for row in db.session.query(Model.id).filter(
+            Model.model_digest.is_(None), Model.model_file.isnot(None)
+        )]
+        for model_id in legacy_ids:
+            model = Model.query.get(model_id)
+            digest, size = model_store.save_bytes(model.model_file)
+            model.model_digest = digest
+            model.file_size = size
+            model.model_file = None
+            db.session.commit()
+            logger.info(f"Migrated weights of model {model_id} to the model store ({digest[:12]})")
+
+
+# Shared by the model blueprint and the model registry
+model_store = ModelStore()
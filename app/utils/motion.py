@@ -0,0 +1,75 @@
+import time
+import cv2
+import numpy as np
+
+# Defaults for cameras without their own motion settings
+DEFAULT_MOTION_THRESHOLD = 0.5  # percent of pixels that must change
+DEFAULT_MOTION_REFRESH = 10.0  # seconds
+
+GATE_WIDTH = 160
+PIXEL_DELTA = 25
+BACKGROUND_RATE = 0.05
+
+
+class MotionGate:
+    """Cheap pre-stage that decides whether a frame is worth running the model on.
+
+    Frames are downscaled, blurred and compared against a running-average
+    background, so slow lighting changes are absorbed while objects moving
+    through the scene are not. A full inference is still forced every
+    refresh_interval seconds so objects that stopped moving are re-confirmed.
+    """
+
+    def __init__(self, threshold=DEFAULT_MOTION_THRESHOLD, refresh_interval=DEFAULT_MOTION_REFRESH):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.background = None
+        self.last_pass = 0.0
+        self.changed = 0.0
+
+        # Stats
+        self.checked_frames = 0
+        self.gated_frames = 0
+
+    def configure(self, threshold=None, refresh_interval=None):
+        self.threshold = threshold if threshold is not None else DEFAULT_MOTION_THRESHOLD
+        self.refresh_interval = refresh_interval if refresh_interval is not None else DEFAULT_MOTION_REFRESH
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (GATE_WIDTH, max(1, height * GATE_WIDTH // width)), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def check(self, frame):
+        """True when the frame changed enough (or the refresh is due) to run inference."""
+        self.checked_frames += 1
+        gray = self._prepare(frame)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.changed = 100.0
+        else:
+            diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+            self.changed = np.count_nonzero(diff > PIXEL_DELTA) * 100.0 / diff.size
+            cv2.accumulateWeighted(gray, self.background, BACKGROUND_RATE)
+
+        now = time.time()
+        if self.changed >= self.threshold or now - self.last_pass >= self.refresh_interval:
+            self.last_pass = now
+            return True
+
+        self.gated_frames += 1
+        return False
+
+    def reset(self):
+        self.background = None
+        self.last_pass = 0.0
+
+    def get_stats(self):
+        return {
+            'threshold': self.threshold,
+            'refresh_interval': self.refresh_interval,
+            'changed': round(self.changed, 3),
+            'gated_ratio': round(self.gated_frames / self.checked_frames, 3) if self.checked_frames else 0.0
+        }
@@ -0,0 +1,196 @@
+import re
+import time
+import logging
+import numpy as np
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+# Mean over these IoU thresholds gives the mAP50-95 figure
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+REFERENCE_CONFIDENCE = 0.25
+
+
+def sample_camera_frames(app, camera_ips, count=32, interval=0.5, timeout=60.0):
+    """Collect up to count frames spread over time from the given cameras' shared streams."""
+    from .cctv import camera_stream_manager
+
+    consumer_id = f"quantization_{int(time.time())}"
+    streams = {}
+    with app.app_context():
+        for ip_address in camera_ips:
+            stream = camera_stream_manager.get_camera_stream(ip_address, consumer_id)
+            if stream is not None:
+                streams[ip_address] = stream
+
+    frames = []
+    last_seqs = {ip_address: None for ip_address in streams}
+    deadline = time.time() + timeout
+    try:
+        while streams and len(frames) < count and time.time() < deadline:
+            # Round-robin over cameras so every scene is represented
+            for ip_address, stream in streams.items():
+                frame_ref = stream.acquire_frame(last_seqs[ip_address], timeout=1.0)
+                if frame_ref is None:
+                    continue
+                with frame_ref:
+                    last_seqs[ip_address] = frame_ref.seq
+                    frames.append(frame_ref.frame.copy())
+                if len(frames) >= count:
+                    break
+            time.sleep(interval)
+    finally:
+        for ip_address in streams:
+            camera_stream_manager.release_stream(ip_address, consumer_id)
+
+    logger.info(f"Sampled {len(frames)} calibration frames from {len(streams)} cameras")
+    return frames
+
+
+def letterbox_batch(frames, imgsz):
+    """Preprocess frames the way the YOLO predictor does: letterbox, BGR to RGB, CHW, 0..1."""
+    from ultralytics.data.augment import LetterBox
+
+    letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=False)
+    batch = []
+    for frame in frames:
+        image = letterbox(image=frame)
+        image = image[..., ::-1].transpose(2, 0, 1)
+        batch.append(np.ascontiguousarray(image, dtype=np.float32) / 255.0)
+    return batch
+
+
+class FrameCalibrationReader:
+    """onnxruntime CalibrationDataReader over preprocessed camera frames."""
+
+    def __init__(self, input_name, images):
+        self.input_name = input_name
+        self.images = iter(images)
+
+    def get_next(self):
+        image = next(self.images, None)
+        if image is None:
+            return None
+        return {self.input_name: image[np.newaxis]}
+
+
+def head_nodes(onnx_model):
+    """Nodes of the last YOLO module (the Detect head), kept in float for accuracy."""
+    indices = {}
+    for node in onnx_model.graph.node:
+        match = re.match(r'^/model\.(\d+)/', node.name)
+        if match:
+            indices.setdefault(int(match.group(1)), []).append(node.name)
+    return indices[max(indices)] if indices else []
+
+
+def quantize_onnx(float_path, output_path, frames, imgsz):
+    import onnx
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+
+    onnx_model = onnx.load(float_path)
+    input_name = onnx_model.graph.input[0].name
+    reader = FrameCalibrationReader(input_name, letterbox_batch(frames, imgsz))
+
+    quantize_static(
+        float_path,
+        output_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        nodes_to_exclude=head_nodes(onnx_model)
+    )
+
+
+def box_iou(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes."""
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def average_precision(recall, precision):
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    changes = np.where(mrec[1:] != mrec[:-1])[0]
+    return float(np.sum((mrec[changes + 1] - mrec[changes]) * mpre[changes + 1]))
+
+
+def agreement_map(references, candidates, iou_threshold):
+    """mAP of candidate predictions scored against reference predictions as ground truth.
+
+    Both are lists (one entry per frame) of (N, 6) arrays: x1, y1, x2, y2, confidence, class.
+    Returns None when the references contain no objects.
+    """
+    classes = np.unique(np.concatenate([r[:, 5] for r in references])) if references else []
+    aps = []
+    for cls in classes:
+        scores, hits = [], []
+        total = 0
+        for reference, candidate in zip(references, candidates):
+            truth = reference[reference[:, 5] == cls]
+            preds = candidate[candidate[:, 5] == cls]
+            total += len(truth)
+            preds = preds[np.argsort(-preds[:, 4])]
+            matched = np.zeros(len(truth), dtype=bool)
+            ious = box_iou(preds[:, :4], truth[:, :4]) if len(preds) and len(truth) else None
+            for i, pred in enumerate(preds):
+                scores.append(pred[4])
+                hit = False
+                if ious is not None:
+                    candidates_iou = np.where(matched, 0.0, ious[i])
+                    best = int(np.argmax(candidates_iou))
+                    if candidates_iou[best] >= iou_threshold:
+                        matched[best] = True
+                        hit = True
+                hits.append(hit)
+
+        if total == 0:
+            continue
+        order = np.argsort(-np.asarray(scores))
+        tp = np.cumsum(np.asarray(hits, dtype=float)[order])
+        fp = np.cumsum(1.0 - np.asarray(hits, dtype=float)[order])
+        recall = tp / total
+        precision = tp / np.maximum(tp + fp, 1e-9)
+        aps.append(average_precision(recall, precision))
+
+    return float(np.mean(aps)) if aps else None
+
+
+def predictions(yolo_model, frames, imgsz, conf):
+    output = []
+    for frame in frames:
+        boxes = yolo_model.predict(frame, imgsz=imgsz, conf=conf, verbose=False)[0].boxes
+        output.append(np.concatenate([
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy()[:, None],
+            boxes.cls.cpu().numpy()[:, None]
+        ], axis=1) if len(boxes) else np.zeros((0, 6), dtype=np.float32))
+    return output
+
+
+def accuracy_drift(reference_model, candidate_model, frames, imgsz):
+    """How closely the candidate reproduces the reference model on the sample frames."""
+    references = predictions(reference_model, frames, imgsz, REFERENCE_CONFIDENCE)
+    # Low threshold so the precision/recall curve covers the candidate's full range
+    candidates = predictions(candidate_model, frames, imgsz, 0.001)
+
+    per_threshold = [agreement_map(references, candidates, t) for t in IOU_THRESHOLDS]
+    if per_threshold[0] is None:
+        return {'map50': None, 'map50_95': None, 'reference_objects': 0}
+    return {
+        'map50': round(per_threshold[0], 4),
+        'map50_95': round(float(np.mean(per_threshold)), 4),
+        'reference_objects': int(sum(len(r) for r in references))
+    }
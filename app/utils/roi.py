@@ -0,0 +1,103 @@
+import json
+import cv2
+import numpy as np
+
+ROI_COLOR = (0, 255, 255)
+# Smallest ROI accepted, as fractions of the frame: polygon area and bounding box sides
+MIN_ROI_AREA = 0.001
+MIN_ROI_SIDE = 0.02
+# Crops smaller than this (px) fall back to the full frame
+MIN_CROP_PIXELS = 16
+
+
+def parse_roi(text):
+    """Parse a stored ROI, a JSON list of [x, y] points in 0..1 frame coordinates.
+
+    Returns a list of (x, y) tuples, or None when no ROI is set. Raises ValueError
+    for anything that is not a polygon of at least three points inside the frame,
+    or whose area or bounding box is too small to run inference on.
+    """
+    if text is None or not str(text).strip():
+        return None
+
+    try:
+        points = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"ROI is not valid JSON: {e}")
+
+    if not isinstance(points, list) or len(points) < 3:
+        raise ValueError("ROI must be a list of at least 3 [x, y] points")
+
+    parsed = []
+    for point in points:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            raise ValueError("Every ROI point must be an [x, y] pair")
+        x, y = float(point[0]), float(point[1])
+        if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+            raise ValueError("ROI coordinates must be between 0 and 1 (fractions of the frame size)")
+        parsed.append((x, y))
+
+    xs, ys = zip(*parsed)
+    # Shoelace formula, collinear or repeated points give (near) zero area
+    area = abs(sum(xs[i] * ys[i - 1] - xs[i - 1] * ys[i] for i in range(len(parsed)))) / 2
+    if area < MIN_ROI_AREA:
+        raise ValueError("ROI polygon is too small or its points are collinear")
+    if max(xs) - min(xs) < MIN_ROI_SIDE or max(ys) - min(ys) < MIN_ROI_SIDE:
+        raise ValueError("ROI is too narrow, it must span at least 2% of the frame in each direction")
+    return parsed
+
+
+class RegionOfInterest:
+    """Polygon region of a camera frame.
+
+    Inference runs on the polygon's bounding rectangle only; detections are mapped
+    back to frame coordinates and kept when their bottom-centre point (where an
+    object touches the ground) lies inside the polygon.
+    """
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float32)
+        self.shape = None
+        self.polygon = None
+        self.bounds = None
+
+    def _fit(self, shape):
+        # Pixel geometry is cached per frame size
+        if self.shape == shape[:2]:
+            return
+        height, width = shape[:2]
+        self.shape = shape[:2]
+        self.polygon = (self.points * [width, height]).astype(np.int32)
+        x, y, w, h = cv2.boundingRect(self.polygon)
+        self.bounds = (x, y, min(x + w, width), min(y + h, height))
+
+    def crop(self, frame):
+        """Bounding rectangle of the polygon as a view of frame, with its (x, y) offset.
+
+        Falls back to the whole frame when the rectangle is too small to run a model on
+        (e.g. a tiny stream resolution); detections are still filtered by the polygon.
+        """
+        self._fit(frame.shape)
+        x1, y1, x2, y2 = self.bounds
+        if x2 - x1 < MIN_CROP_PIXELS or y2 - y1 < MIN_CROP_PIXELS:
+            return frame, (0, 0)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def to_frame(self, detections, offset, shape):
+        """Shift crop detections back to frame coordinates and drop those outside the polygon."""
+        self._fit(shape)
+        if len(detections) == 0:
+            return detections
+
+        detections = detections.copy()
+        detections[:, [0, 2]] += offset[0]
+        detections[:, [1, 3]] += offset[1]
+
+        anchors = np.stack([(detections[:, 0] + detections[:, 2]) / 2, detections[:, 3]], axis=1)
+        inside = [cv2.pointPolygonTest(self.polygon, (float(x), float(y)), False) >= 0 for x, y in anchors]
+        return detections[np.asarray(inside, dtype=bool)]
+
+    def draw(self, image):
+        self._fit(image.shape)
+        cv2.polylines(image, [self.polygon], isClosed=True, color=ROI_COLOR, thickness=2)
+        return image
@@ -0,0 +1,243 @@
+import threading
+import time
+import logging
+
+# Setup logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('detector.log')
+file_handler.setFormatter(formatter)
+logger.addHandler(file_handler)
+
+# Used for detectors created before the scheduler settings existed
+DEFAULT_MIN_FPS = 1.0
+DEFAULT_MAX_FPS = 15.0
+DEFAULT_WEIGHT = 1.0
+
+# Assumed cost of a frame until a detector has reported its own
+DEFAULT_FRAME_COST = 0.05
+COST_SMOOTHING = 0.2
+
+# A detector whose frames wait longer than this for inference (s, or fraction of its
+# frame cost) shows the executors are saturated
+SATURATION_WAIT = 0.02
+SATURATION_WAIT_RATIO = 0.5
+CAPACITY_SMOOTHING = 0.3
+# The measured capacity never drops below this fraction of the configured maximum
+MIN_CAPACITY_FRACTION = 0.1
+
+
+class DetectorPolicy:
+    def __init__(self, min_fps, max_fps, weight):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.weight = weight
+        self.cost = None
+        self.wait = None
+        self.target_fps = max_fps
+
+
+class FrameRateScheduler(threading.Thread):
+    """Splits the box's inference capacity between detectors.
+
+    Capacity is measured in busy inference seconds per second. The probe reports
+    how busy the executors (worker processes or in-process engines) actually were;
+    while detectors' frames queue for inference that is all the box can deliver and
+    becomes the capacity, otherwise the estimate recovers toward the configured
+    maximum. Every detector reports what a frame costs it; the scheduler first
+    grants each detector its minimum frame rate, then hands out what is left in
+    proportion to the weights, capped at each detector's maximum. Allocations are
+    recomputed every interval, so adding a camera or a slower model lowers everyone
+    a little instead of starving whoever loses the race for the CPU.
+    """
+
+    def __init__(self, capacity=1.0, headroom=0.9, interval=1.0):
+        super().__init__(name="FrameRateScheduler", daemon=True)
+        self.max_capacity = capacity
+        self.capacity = capacity
+        self.headroom = headroom
+        self.interval = interval
+        self.probe = None
+        self.measured_busy = None
+        self.saturated = False
+        self.policies = {}
+        self.lock = threading.Lock()
+        self.running = True
+        self.overloaded = False
+
+    def configure(self, capacity=None, headroom=None, interval=None, probe=None):
+        """capacity is the most busy seconds per second the executors can give, probe() returns what they gave."""
+        with self.lock:
+            if capacity is not None:
+                self.max_capacity = capacity
+                self.capacity = capacity
+            if headroom is not None:
+                self.headroom = headroom
+            if interval is not None:
+                self.interval = interval
+            if probe is not None:
+                self.probe = probe
+
+    def register(self, detector_id, min_fps=None, max_fps=None, weight=None):
+        """Add a detector or update its limits. Missing values fall back to the defaults."""
+        min_fps = min_fps or DEFAULT_MIN_FPS
+        max_fps = max(max_fps or DEFAULT_MAX_FPS, min_fps)
+        weight = weight or DEFAULT_WEIGHT
+
+        with self.lock:
+            policy = self.policies.get(detector_id)
+            if policy is None:
+                self.policies[detector_id] = DetectorPolicy(min_fps, max_fps, weight)
+            elif (policy.min_fps, policy.max_fps, policy.weight) != (min_fps, max_fps, weight):
+                policy.min_fps, policy.max_fps, policy.weight = min_fps, max_fps, weight
+            else:
+                return
+            self._rebalance()
+
+    def unregister(self, detector_id):
+        with self.lock:
+            if self.policies.pop(detector_id, None) is not None:
+                self._rebalance()
+
+    def report(self, detector_id, cost, wait=None):
+        """Record the inference seconds one frame of this detector took, and how long it queued first."""
+        with self.lock:
+            policy = self.policies.get(detector_id)
+            if policy is None:
+                return
+            if policy.cost is None:
+                policy.cost = cost
+            else:
+                policy.cost += COST_SMOOTHING * (cost - policy.cost)
+            if wait is not None:
+                policy.wait = wait if policy.wait is None else policy.wait + COST_SMOOTHING * (wait - policy.wait)
+
+    def _is_saturated(self):
+        return any(
+            p.wait is not None and p.cost is not None and p.wait > max(SATURATION_WAIT, SATURATION_WAIT_RATIO * p.cost)
+            for p in self.policies.values()
+        )
+
+    def _measure(self):
+        """Update the capacity estimate from the executors' measured busy time."""
+        if self.probe is None:
+            return
+        try:
+            busy = self.probe()
+        except Exception as e:
+            logger.warning(f"Could not measure inference utilisation: {e}")
+            return
+
+        with self.lock:
+            self.measured_busy = busy
+            saturated = self._is_saturated()
+            # Frames are queueing, so what the executors managed is what they can do
+            sample = busy if saturated else self.max_capacity
+            self.capacity += CAPACITY_SMOOTHING * (sample - self.capacity)
+            self.capacity = min(self.max_capacity, max(self.capacity, self.max_capacity * MIN_CAPACITY_FRACTION))
+            if saturated and not self.saturated:
+                logger.info(f"Inference saturated at {busy:.2f} busy s/s, lowering capacity from {self.max_capacity:.2f}")
+            self.saturated = saturated
+
+    def interval_for(self, detector_id):
+        """Seconds a detector should wait between frames."""
+        with self.lock:
+            policy = self.policies.get(detector_id)
+            if policy is None or policy.target_fps <= 0:
+                return 1.0 / DEFAULT_MAX_FPS
+            return 1.0 / policy.target_fps
+
+    def _cost(self, policy, known_costs):
+        if policy.cost is not None:
+            return max(policy.cost, 1e-4)
+        # New detectors are assumed to cost what the others do on average
+        return sum(known_costs) / len(known_costs) if known_costs else DEFAULT_FRAME_COST
+
+    def _rebalance(self):
+        """Weighted water-filling of the capacity budget. Called with the lock held."""
+        if not self.policies:
+            return
+
+        budget = self.capacity * self.headroom
+        known_costs = [p.cost for p in self.policies.values() if p.cost is not None]
+        costs = {detector_id: self._cost(p, known_costs) for detector_id, p in self.policies.items()}
+
+        # Every detector gets its minimum first
+        allocation = {detector_id: p.min_fps for detector_id, p in self.policies.items()}
+        used = sum(costs[d] * fps for d, fps in allocation.items())
+
+        if used > budget:
+            # Not even the minimums fit, scale them down evenly
+            scale = budget / used
+            allocation = {d: fps * scale for d, fps in allocation.items()}
+            if not self.overloaded:
+                logger.warning(f"Inference capacity exhausted: minimum frame rates need {used:.2f}s/s of {budget:.2f}s/s, scaling down")
+            self.overloaded = True
+        else:
+            if self.overloaded:
+                logger.info("Inference capacity recovered, minimum frame rates restored")
+            self.overloaded = False
+
+            remaining = budget - used
+            open_ids = {d for d, p in self.policies.items() if allocation[d] < p.max_fps}
+            while open_ids and remaining > 1e-9:
+                # Extra fps handed out per unit of weight
+                demand = sum(costs[d] * self.policies[d].weight for d in open_ids)
+                step = remaining / demand
+                capped = set()
+                for d in open_ids:
+                    policy = self.policies[d]
+                    extra = min(step * policy.weight, policy.max_fps - allocation[d])
+                    allocation[d] += extra
+                    remaining -= extra * costs[d]
+                    if allocation[d] >= policy.max_fps - 1e-9:
+                        capped.add(d)
+                if not capped:
+                    break
+                open_ids -= capped
+
+        for detector_id, fps in allocation.items():
+            self.policies[detector_id].target_fps = fps
+
+    def run(self):
+        logger.info("Frame rate scheduler started")
+        while self.running:
+            time.sleep(self.interval)
+            # The probe reads engine and worker stats under their own locks, not ours
+            self._measure()
+            with self.lock:
+                self._rebalance()
+        logger.info("Frame rate scheduler stopped")
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        with self.lock:
+            known_costs = [p.cost for p in self.policies.values() if p.cost is not None]
+            load = sum(self._cost(p, known_costs) * p.target_fps for p in self.policies.values())
+            return {
+                'capacity': round(self.capacity, 3),
+                'max_capacity': self.max_capacity,
+                'measured_busy': round(self.measured_busy, 3) if self.measured_busy is not None else None,
+                'saturated': self.saturated,
+                'headroom': self.headroom,
+                'planned_load': round(load, 3),
+                'overloaded': self.overloaded,
+                'detectors': {
+                    detector_id: {
+                        'min_fps': policy.min_fps,
+                        'max_fps': policy.max_fps,
+                        'weight': policy.weight,
+                        'frame_cost': round(policy.cost * 1000, 1) if policy.cost is not None else None,
+                        'queue_wait': round(policy.wait * 1000, 1) if policy.wait is not None else None,
+                        'target_fps': round(policy.target_fps, 2)
+                    }
+                    for detector_id, policy in self.policies.items()
+                }
+            }
+
+
+# Shared by every detector thread
+frame_rate_scheduler = FrameRateScheduler()
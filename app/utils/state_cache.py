@@ -0,0 +1,155 @@
+import threading
+import time
+import logging
+from blinker import Namespace
+
+logger = logging.getLogger(__name__)
+
+# Sent by the write routes after commit with the changed row id, or None after bulk changes
+signals = Namespace()
+camera_changed = signals.signal('camera-changed')
+detector_changed = signals.signal('detector-changed')
+
+
+class StateCache:
+    """In-memory copy of camera and detector state consulted by the streaming loops.
+
+    Populated at startup and refreshed when the write routes send a change signal,
+    with a periodic full reload as a safety net for edits made outside the app.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.cameras = {}
+        self.detectors = {}
+        self.ttl = ttl
+        self.loaded_at = 0.0
+        self.app = None
+        self.lock = threading.RLock()
+
+    def init_app(self, app):
+        self.app = app
+        self.ttl = app.config.get('STATE_CACHE_TTL', self.ttl)
+        camera_changed.connect(self._on_camera_changed)
+        detector_changed.connect(self._on_detector_changed)
+        self.reload()
+
+    def reload(self):
+        from app.models import Camera, Detector
+
+        with self.app.app_context():
+            cameras = {camera.id: self._camera_state(camera) for camera in Camera.query.all()}
+            detectors = {detector.id: self._detector_state(detector) for detector in Detector.query.all()}
+
+        with self.lock:
+            self.cameras = cameras
+            self.detectors = detectors
+            self.loaded_at = time.time()
+        logger.debug(f"State cache loaded: {len(cameras)} cameras, {len(detectors)} detectors")
+
+    def _camera_state(self, camera):
+        return {
+            'id': camera.id,
+            'location': camera.location,
+            'ip_address': camera.ip_address,
+            'status': bool(camera.status),
+            'type': camera.type,
+            'motion_gate': bool(camera.motion_gate),
+            'motion_threshold': camera.motion_threshold,
+            'motion_refresh': camera.motion_refresh,
+            'roi': camera.roi,
+            'capture_width': camera.capture_width,
+            'inference_size': camera.inference_size
+        }
+
+    def _detector_state(self, detector):
+        return {
+            'id': detector.id,
+            'camera_id': detector.camera_id,
+            'model_id': detector.model_id,
+            'running': bool(detector.running),
+            'min_fps': detector.min_fps,
+            'max_fps': detector.max_fps,
+            'weight': detector.weight,
+            'model_variant': detector.model_variant or 'float',
+            'overlay': detector.overlay or 'server'
+        }
+
+    def _on_camera_changed(self, camera_id):
+        from app.models import Camera
+
+        if camera_id is None:
+            self.reload()
+            return
+
+        with self.app.app_context():
+            camera = Camera.query.get(camera_id)
+            state = self._camera_state(camera) if camera else None
+
+        with self.lock:
+            if state is None:
+                self.cameras.pop(camera_id, None)
+            else:
+                self.cameras[camera_id] = state
+
+    def _on_detector_changed(self, detector_id):
+        from app.models import Detector
+
+        if detector_id is None:
+            self.reload()
+            return
+
+        with self.app.app_context():
+            detector = Detector.query.get(detector_id)
+            state = self._detector_state(detector) if detector else None
+
+        with self.lock:
+            if state is None:
+                self.detectors.pop(detector_id, None)
+            else:
+                self.detectors[detector_id] = state
+
+    def _check_ttl(self):
+        if self.app is None:
+            return
+
+        with self.lock:
+            if time.time() - self.loaded_at <= self.ttl:
+                return
+            # Claim the reload so concurrent readers keep using the current state
+            self.loaded_at = time.time()
+
+        try:
+            self.reload()
+        except Exception as e:
+            logger.warning(f"State cache reload failed: {e}")
+
+    def get_camera(self, camera_id):
+        self._check_ttl()
+        with self.lock:
+            return self.cameras.get(camera_id)
+
+    def get_camera_by_ip(self, ip_address):
+        self._check_ttl()
+        with self.lock:
+            for camera in self.cameras.values():
+                if camera['ip_address'] == ip_address:
+                    return camera
+            return None
+
+    def get_detector(self, detector_id):
+        self._check_ttl()
+        with self.lock:
+            return self.detectors.get(detector_id)
+
+    def is_camera_active(self, camera_id):
+        camera = self.get_camera(camera_id)
+        return bool(camera and camera['status'])
+
+    def is_detector_active(self, detector_id):
+        """True when the detector is running and its camera is on."""
+        detector = self.get_detector(detector_id)
+        return bool(detector and detector['running'] and self.is_camera_active(detector['camera_id']))
+
+
+# Process-wide cache shared by blueprints, camera streams and detector threads
+state_cache = StateCache()
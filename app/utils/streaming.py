@@ -0,0 +1,269 @@
+import threading
+import time
+import cv2
+from .metrics import stage_seconds, source_label
+
+DEFAULT_JPEG_QUALITY = 85
+
+# Stream tiers a viewer picks with ?tier=: frames wider than max_width are scaled
+# down, max_fps caps how often a viewer of the tier is sent a frame (None = every frame)
+STREAM_TIERS = {
+    'thumbnail': {'max_width': 320, 'quality': 60, 'max_fps': 5},
+    'medium': {'max_width': 640, 'quality': 75, 'max_fps': 15},
+    'full': {'max_width': None, 'quality': DEFAULT_JPEG_QUALITY, 'max_fps': None}
+}
+DEFAULT_STREAM_TIER = 'full'
+
+# Snapshot endpoints keep their source running this long (s), longer than the previews'
+# polling interval so periodic snapshots don't reopen the camera or toggle annotation
+SNAPSHOT_LINGER = 5.0
+SNAPSHOT_TIMEOUT = 3.0
+
+
+def tier_interval(tier):
+    """Minimum seconds between two frames sent to a viewer of this tier."""
+    max_fps = STREAM_TIERS[tier]['max_fps']
+    return 1.0 / max_fps if max_fps else 0.0
+
+
+class FrameChannel:
+    """Holds the latest frame of a source and wakes consumers when a newer one is published.
+
+    Every published frame gets the next sequence number, so a consumer passes the
+    last sequence it handled and only returns once something newer is available.
+    Frames may carry a metadata dict (capture timestamp, capture sequence, camera).
+    Consumers register as viewers so a producer can skip work nobody will see.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.frame = None
+        self.meta = None
+        self.closed = False
+        self.viewers = 0
+
+    def add_viewer(self):
+        with self.condition:
+            self.viewers += 1
+            return self.viewers
+
+    def remove_viewer(self):
+        with self.condition:
+            self.viewers = max(0, self.viewers - 1)
+            return self.viewers
+
+    def publish(self, frame, meta=None):
+        with self.condition:
+            self.seq += 1
+            self.frame = frame
+            self.meta = meta
+            self.closed = False
+            self.condition.notify_all()
+            return self.seq
+
+    def latest(self):
+        with self.condition:
+            return self.seq, self.frame
+
+    def wait_for_frame(self, last_seq=None, timeout=None):
+        """Return (seq, frame) newer than last_seq, or (None, None) on timeout or close."""
+        seq, frame, _ = self.wait_for_frame_meta(last_seq, timeout)
+        return seq, frame
+
+    def wait_for_frame_meta(self, last_seq=None, timeout=None):
+        """Like wait_for_frame, also returning the metadata published with the frame."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or (self.frame is not None and self.seq != last_seq),
+                timeout
+            )
+            if self.frame is None or self.seq == last_seq:
+                return None, None, None
+            return self.seq, self.frame, self.meta
+
+    def clear(self):
+        # Sequence numbers keep increasing so consumers never mistake a new frame for an old one
+        with self.condition:
+            self.frame = None
+            self.meta = None
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.frame = None
+            self.meta = None
+            self.condition.notify_all()
+
+
+class FrameRef:
+    """A read-only view of a ring buffer slot, pinned until released."""
+
+    def __init__(self, ring, index, seq, frame, captured_at=None):
+        self.ring = ring
+        self.index = index
+        self.seq = seq
+        self.frame = frame
+        self.captured_at = captured_at
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.frame = None
+            self.ring.release(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FrameRingBuffer:
+    """Preallocated frame slots that the capture thread decodes into directly.
+
+    The writer only reuses slots that are neither the latest frame nor pinned by a
+    consumer, so consumers can read their view without copying it first.
+    """
+
+    def __init__(self, num_slots=4, max_slots=16):
+        self.slots = [None] * num_slots
+        self.pins = [0] * num_slots
+        self.timestamps = [0.0] * num_slots
+        self.max_slots = max_slots
+        self.latest = None
+        self.seq = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def acquire_write_slot(self):
+        """Return (index, array) for the next capture, array is None until first use.
+
+        Returns (None, None) when every slot is pinned and the ring cannot grow.
+        """
+        with self.condition:
+            for index, pins in enumerate(self.pins):
+                if pins == 0 and index != self.latest:
+                    return index, self.slots[index]
+
+            if len(self.slots) < self.max_slots:
+                self.slots.append(None)
+                self.pins.append(0)
+                self.timestamps.append(0.0)
+                return len(self.slots) - 1, None
+
+            return None, None
+
+    def commit(self, index, frame):
+        # The decoder may have allocated a new array (first frame or resolution change)
+        with self.condition:
+            self.slots[index] = frame
+            self.timestamps[index] = time.time()
+            self.latest = index
+            self.seq += 1
+            self.closed = False
+            self.condition.notify_all()
+            return self.seq
+
+    def acquire(self, last_seq=None, timeout=None):
+        """Pin and return a FrameRef newer than last_seq, or None on timeout or close."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or (self.latest is not None and self.seq != last_seq),
+                timeout
+            )
+            if self.latest is None or self.seq == last_seq:
+                return None
+
+            self.pins[self.latest] += 1
+            view = self.slots[self.latest].view()
+            view.flags.writeable = False
+            return FrameRef(self, self.latest, self.seq, view, self.timestamps[self.latest])
+
+    def release(self, index):
+        with self.condition:
+            self.pins[index] = max(0, self.pins[index] - 1)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.latest = None
+            self.condition.notify_all()
+
+
+class EncodedFrameCache:
+    """Encodes each new frame of a source once per tier and shares the bytes with all viewers of that tier.
+
+    Sources are identified by a hashable key, e.g. ('camera', ip_address) or
+    ('detector', detector_id), and every frame they publish carries a sequence number.
+    """
+
+    def __init__(self):
+        # (source_key, tier) -> (seq, jpeg bytes)
+        self.entries = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _lock_for(self, key):
+        with self.lock:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    def get_jpeg(self, source_key, seq, frame, tier=DEFAULT_STREAM_TIER):
+        key = (source_key, tier)
+        settings = STREAM_TIERS[tier]
+        # Concurrent viewers of the same frame wait for the first encode instead of repeating it
+        with self._lock_for(key):
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] == seq:
+                return cached[1]
+
+            encode_start = time.time()
+            max_width = settings['max_width']
+            if max_width and frame.shape[1] > max_width:
+                height = max(1, round(frame.shape[0] * max_width / frame.shape[1]))
+                frame = cv2.resize(frame, (max_width, height), interpolation=cv2.INTER_AREA)
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, settings['quality']])
+            stage = 'encode' if tier == DEFAULT_STREAM_TIER else f"encode_{tier}"
+            stage_seconds.observe(time.time() - encode_start, stage=stage, source=source_label(source_key))
+            if not ret:
+                return None
+
+            data = buffer.tobytes()
+            self.entries[key] = (seq, data)
+            return data
+
+    def discard(self, source_key):
+        """Forget a source, called when it restarts and its sequence numbers start over."""
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == source_key]:
+                del self.entries[key]
+            for key in [k for k in self.locks if k[0] == source_key]:
+                del self.locks[key]
+
+
+def mjpeg_part(jpeg, headers=None):
+    """One multipart section. Extra headers (e.g. X-Capture-Timestamp) are ignored by browsers."""
+    extra = b''.join(f"{name}: {value}\r\n".encode('latin-1') for name, value in (headers or {}).items())
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n' + extra + b'\r\n' + jpeg + b'\r\n')
+
+
+def latency_headers(capture_seq, captured_at, detected_at=None):
+    """Per-part tracing headers, timestamps are Unix seconds on the server clock."""
+    headers = {
+        'X-Frame-Seq': capture_seq,
+        'X-Capture-Timestamp': f"{captured_at:.6f}"
+    }
+    if detected_at is not None:
+        headers['X-Detect-Timestamp'] = f"{detected_at:.6f}"
+    headers['X-Send-Timestamp'] = f"{time.time():.6f}"
+    return headers
+
+
+# Shared by the cctv and detector stream endpoints
+frame_cache = EncodedFrameCache()
@@ -0,0 +1,35 @@
+import os
+import torch
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+
+TRACKER_CONFIG = os.path.join(os.path.dirname(__file__), 'bytetrack.yaml')
+
+
+class DetectorTracker:
+    """Per-detector tracker state, kept outside the shared YOLO model.
+
+    `YOLO.track(persist=True)` stores its tracker on the model's predictor, which
+    would mix tracks between cameras once a model is shared by several detectors.
+    """
+
+    def __init__(self, config_path=TRACKER_CONFIG, frame_rate=30):
+        cfg = IterableSimpleNamespace(**yaml_load(config_path))
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+    def update(self, result, frame):
+        det = result.boxes.cpu().numpy()
+        if len(det) == 0:
+            return result
+
+        tracks = self.tracker.update(det, frame)
+        if len(tracks) == 0:
+            return result
+
+        idx = tracks[:, -1].astype(int)
+        result = result[idx]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+
+    def reset(self):
+        self.tracker.reset()
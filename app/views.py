@@ -1,7 +1,19 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, Response, jsonify
+from app.utils.metrics import metrics
 
 main = Blueprint('main', __name__)
 
 @main.route('/')
 def index():
     return render_template('index.html')
+
+@main.route('/metrics')
+def prometheus_metrics():
+    # Prometheus text exposition format, scraped by the monitoring stack
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@main.route('/stream_stats')
+def stream_stats():
+    # Viewers of the async (ASGI) streaming path, with per-client delivered/dropped counts
+    from app.utils.async_streaming import async_stream_hub
+    return jsonify(async_stream_hub.get_stats())
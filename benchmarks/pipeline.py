@@ -0,0 +1,436 @@
+"""End-to-end pipeline benchmark.
+
+Runs the real capture -> detector -> MJPEG path of the app against synthetic or
+file-backed cameras, entirely offline, and writes the results as JSON.
+
+    python benchmarks/pipeline.py --model yolov8n.pt --cameras 4 --detectors 4 --clients 2 --duration 60
+    python benchmarks/pipeline.py --model yolov8n.pt --source clip1.mp4 --source clip2.mp4 --cameras 8
+    python benchmarks/pipeline.py --model yolov8n.pt --cameras 8 --compare results/baseline.json
+
+Cameras use the bench:// capture scheme: generated moving boxes at the given
+resolution, or local video files looped at their own frame rate. Detectors are
+spread round-robin over the cameras, MJPEG clients over the detectors. The app
+runs on a throwaway SQLite database and model store.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Metrics where a higher value is better, used by --compare
+HIGHER_IS_BETTER = {'detector_fps', 'client_fps', 'capture_fps', 'frames_processed'}
+
+
+class BenchCapture:
+    """cv2.VideoCapture stand-in serving a looped video file or generated frames at a fixed rate."""
+
+    def __init__(self, url, width, height, fps, sources):
+        index = int(url.split('://', 1)[1])
+        self.path = sources[index % len(sources)] if sources else None
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.video = None
+        self.opened = True
+        self.frame_index = 0
+        self.next_frame_at = time.time()
+
+        if self.path:
+            self.video = cv2.VideoCapture(self.path)
+            self.opened = self.video.isOpened()
+            self.fps = fps or self.video.get(cv2.CAP_PROP_FPS) or 25.0
+        else:
+            rng = np.random.default_rng(index)
+            self.background = rng.integers(0, 80, size=(height, width, 3), dtype=np.uint8)
+            self.boxes = [
+                (rng.integers(0, width), rng.integers(0, height), rng.integers(40, 160), rng.integers(-8, 8), rng.integers(-6, 6))
+                for _ in range(6)
+            ]
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        return False
+
+    def _pace(self):
+        delay = self.next_frame_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame_at = max(self.next_frame_at + 1.0 / self.fps, time.time() - 1.0)
+
+    def _generate(self, image):
+        np.copyto(image, self.background)
+        for x, y, size, dx, dy in self.boxes:
+            cx = int(x + dx * self.frame_index) % self.width
+            cy = int(y + dy * self.frame_index) % self.height
+            cv2.rectangle(image, (cx, cy), (cx + int(size), cy + int(size) * 2), (200, 180, 160), -1)
+        return image
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, None
+        self._pace()
+        self.frame_index += 1
+
+        if self.video is not None:
+            ret, frame = self.video.read(image) if image is not None else self.video.read()
+            if not ret:
+                # Loop the file
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self.video.read(image) if image is not None else self.video.read()
+            return ret, frame
+
+        if image is None or image.shape != (self.height, self.width, 3):
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        return True, self._generate(image)
+
+    def grab(self):
+        ret, _ = self.read()
+        return ret
+
+    def release(self):
+        self.opened = False
+        if self.video is not None:
+            self.video.release()
+
+
+class ResourceSampler(threading.Thread):
+    """Samples CPU utilisation and RSS of this process and its children (inference workers)."""
+
+    def __init__(self, interval=1.0):
+        super().__init__(name="ResourceSampler", daemon=True)
+        self.interval = interval
+        self.running = True
+        self.cpu = []
+        self.rss = []
+
+    def _psutil_sample(self, process):
+        processes = [process] + process.children(recursive=True)
+        cpu_seconds, rss = 0.0, 0
+        for p in processes:
+            try:
+                times = p.cpu_times()
+                cpu_seconds += times.user + times.system
+                rss += p.memory_info().rss
+            except Exception:
+                pass
+        return cpu_seconds, rss
+
+    def _proc_sample(self):
+        times = os.times()
+        rss = 0
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+        return times.user + times.system, rss
+
+    def run(self):
+        try:
+            import psutil
+            process = psutil.Process()
+            sample = lambda: self._psutil_sample(process)
+        except ImportError:
+            sample = self._proc_sample
+
+        last_cpu, _ = sample()
+        last_time = time.time()
+        while self.running:
+            time.sleep(self.interval)
+            cpu_seconds, rss = sample()
+            now = time.time()
+            self.cpu.append((cpu_seconds - last_cpu) / (now - last_time) * 100.0)
+            self.rss.append(rss)
+            last_cpu, last_time = cpu_seconds, now
+
+    def stop(self):
+        self.running = False
+
+
+class MjpegClient(threading.Thread):
+    """Reads a detector's MJPEG stream through the Flask test client, like a browser would."""
+
+    def __init__(self, app, detector_id, duration):
+        super().__init__(name=f"MjpegClient-{detector_id}", daemon=True)
+        self.app = app
+        self.detector_id = detector_id
+        self.duration = duration
+        self.frames = 0
+        self.bytes = 0
+        self.intervals = []
+        self.error = None
+
+    def run(self):
+        try:
+            client = self.app.test_client()
+            response = client.get(f'/detector/stream_detector/{self.detector_id}', buffered=False)
+            deadline = time.time() + self.duration
+            last_frame = None
+            for chunk in response.response:
+                now = time.time()
+                if chunk.startswith(b'--frame'):
+                    self.frames += 1
+                    self.bytes += len(chunk)
+                    if last_frame is not None:
+                        self.intervals.append(now - last_frame)
+                    last_frame = now
+                if now >= deadline:
+                    break
+            response.close()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+
+def percentiles(values, scale=1000.0):
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None, 'count': 0}
+    values = np.asarray(values) * scale
+    return {
+        'p50': round(float(np.percentile(values, 50)), 2),
+        'p90': round(float(np.percentile(values, 90)), 2),
+        'p99': round(float(np.percentile(values, 99)), 2),
+        'max': round(float(values.max()), 2),
+        'count': int(len(values))
+    }
+
+
+def configure_environment(args, workdir):
+    os.environ['DB_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['MODEL_STORE_DIR'] = os.path.join(workdir, 'model_store')
+    os.environ['INFERENCE_MODE'] = args.mode
+    if args.workers:
+        os.environ['INFERENCE_WORKERS'] = str(args.workers)
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+
+def seed_database(args):
+    """Create the schema and the benchmark cameras, model and detectors."""
+    from flask import Flask
+    from app.extensions import db
+    from app.models import Camera, Model, Detector
+    from app.utils.model_store import model_store
+
+    bootstrap = Flask('bootstrap')
+    bootstrap.config.from_object('config.Config')
+    db.init_app(bootstrap)
+
+    with bootstrap.app_context():
+        db.create_all()
+        model_store.init_app(bootstrap)
+        digest, size = model_store.save_file(args.model)
+        model = Model(model_name=os.path.basename(args.model), model_digest=digest, file_size=size,
+                      original_filename=os.path.basename(args.model))
+        db.session.add(model)
+
+        cameras = []
+        for index in range(args.cameras):
+            camera = Camera(location=f"Bench {index}", ip_address=f"bench://{index}", status=True, type='Main Room')
+            db.session.add(camera)
+            cameras.append(camera)
+        db.session.flush()
+
+        for index in range(args.detectors):
+            db.session.add(Detector(camera_id=cameras[index % len(cameras)].id, model_id=model.id, running=True,
+                                    max_fps=args.max_fps))
+        db.session.commit()
+
+
+def run_benchmark(args):
+    from app import create_app
+    from app.utils.cctv import register_capture_factory, camera_stream_manager
+    from app.utils.detector import detector_fps_info
+
+    register_capture_factory('bench', lambda url: BenchCapture(url, args.width, args.height, args.fps, args.source))
+
+    app = create_app()
+    from app import detector_manager
+
+    sampler = ResourceSampler()
+    sampler.start()
+
+    # Let models load and the pipeline settle before measuring
+    time.sleep(args.warmup)
+    for thread in detector_manager.detectors.values():
+        thread.stage_samples.clear()
+    capture_start = {ip: stream.frames.seq for ip, stream in camera_stream_manager.camera_streams.items()}
+    sampler.cpu.clear()
+    sampler.rss.clear()
+
+    detector_ids = sorted(detector_manager.detectors)
+    clients = [MjpegClient(app, detector_ids[i % len(detector_ids)], args.duration) for i in range(args.clients)] if detector_ids else []
+    for client in clients:
+        client.start()
+
+    fps_samples = defaultdict(list)
+    started = time.time()
+    while time.time() - started < args.duration:
+        time.sleep(1.0)
+        for detector_id, info in list(detector_fps_info.items()):
+            fps_samples[detector_id].append(info.get('fps', 0.0))
+    elapsed = time.time() - started
+
+    for client in clients:
+        client.join(timeout=5)
+    sampler.stop()
+
+    stages = defaultdict(list)
+    frames_processed = 0
+    for thread in detector_manager.detectors.values():
+        samples = list(thread.stage_samples)
+        frames_processed += len(samples)
+        for frame_age, inference, post in samples:
+            stages['frame_age'].append(frame_age)
+            if inference > 0:
+                stages['inference'].append(inference)
+            stages['post'].append(post)
+            stages['capture_to_publish'].append(frame_age + inference + post)
+
+    capture_fps = [
+        (stream.frames.seq - capture_start.get(ip, 0)) / elapsed
+        for ip, stream in camera_stream_manager.camera_streams.items()
+    ]
+    client_intervals = [interval for client in clients for interval in client.intervals]
+
+    results = {
+        'frames_processed': frames_processed,
+        'detector_fps': round(frames_processed / elapsed / max(1, len(detector_ids)), 2),
+        'total_fps': round(frames_processed / elapsed, 2),
+        'capture_fps': round(float(np.mean(capture_fps)), 2) if capture_fps else 0.0,
+        'client_fps': round(sum(c.frames for c in clients) / elapsed / max(1, len(clients)), 2),
+        'client_bytes_per_second': round(sum(c.bytes for c in clients) / elapsed, 1),
+        'client_errors': [c.error for c in clients if c.error],
+        'dropped_capture_frames': sum(s.dropped_frames for s in camera_stream_manager.camera_streams.values()),
+        'latency_ms': {stage: percentiles(values) for stage, values in stages.items()},
+        'client_interval_ms': percentiles(client_intervals),
+        'per_detector_fps': {str(d): round(float(np.mean(v)), 2) for d, v in fps_samples.items() if v},
+        'cpu_percent': {
+            'mean': round(float(np.mean(sampler.cpu)), 1) if sampler.cpu else None,
+            'max': round(float(np.max(sampler.cpu)), 1) if sampler.cpu else None
+        },
+        'rss_mb': {
+            'mean': round(float(np.mean(sampler.rss)) / 2**20, 1) if sampler.rss else None,
+            'max': round(float(np.max(sampler.rss)) / 2**20, 1) if sampler.rss else None
+        },
+        'inference': detector_manager.get_inference_stats()
+    }
+
+    detector_manager.stop_all()
+    return results
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline_path, tolerance):
+    """Print relative changes against a previous run. Returns the names of regressed metrics."""
+    with open(baseline_path) as baseline_file:
+        baseline = flatten(json.load(baseline_file)['results'])
+    current = flatten(results)
+
+    regressions = []
+    print(f"\n{'metric':<45}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name in sorted(set(baseline) & set(current)):
+        if name.startswith('inference.') or name.startswith('per_detector_fps.') or not baseline[name]:
+            continue
+        change = (current[name] - baseline[name]) / abs(baseline[name])
+        better = name.split('.')[0] in HIGHER_IS_BETTER
+        regressed = change < -tolerance if better else change > tolerance
+        if regressed and not name.endswith('.count'):
+            regressions.append(name)
+        print(f"{name:<45}{baseline[name]:>12.2f}{current[name]:>12.2f}{change:>+9.1%}{'  !' if regressed else ''}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the capture, detection and MJPEG pipeline offline.")
+    parser.add_argument('--model', required=True, help="Local .pt weights to run")
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--detectors', type=int, default=None, help="Defaults to one per camera")
+    parser.add_argument('--clients', type=int, default=1, help="Concurrent MJPEG viewers")
+    parser.add_argument('--source', action='append', default=[], help="Video file, repeat for several; omitted for generated frames")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=float, default=25.0, help="Camera frame rate (files default to their own)")
+    parser.add_argument('--max-fps', type=float, default=15.0, help="Per-detector frame rate ceiling")
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=10.0, help="Seconds before measuring")
+    parser.add_argument('--output', default=None, help="JSON results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="Previous results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+    args.detectors = args.detectors if args.detectors is not None else args.cameras
+    return args
+
+
+def main():
+    args = parse_args()
+    # Relative paths are resolved before moving into the scratch directory
+    args.model = os.path.abspath(args.model)
+    args.source = [os.path.abspath(path) for path in args.source]
+    args.output = os.path.abspath(args.output) if args.output else None
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='detectorcam-bench-') as workdir:
+        configure_environment(args, workdir)
+        os.chdir(workdir)
+        try:
+            seed_database(args)
+            results = run_benchmark(args)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {k: v for k, v in vars(args).items() if k not in ('compare', 'output')},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__
+        },
+        'results': results
+    }
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, default=str)
+
+    print(json.dumps(results, indent=2, default=str))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+    # Detector, camera and worker threads are daemons, leave without waiting on them
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
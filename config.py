@@ -10,3 +10,27 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     WTF_CSRF_ENABLED = True
     WTF_CSRF_SECRET_KEY = os.getenv('WTF_CSRF_SECRET_KEY', 'supersecretkey')
+    MODEL_CACHE_SIZE = int(os.getenv('MODEL_CACHE_SIZE', 2))
+    INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8))
+    INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 10))
+    INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'thread')  # 'thread' or 'process'
+    INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 0))  # 0 = one per CPU core
+    STATE_CACHE_TTL = float(os.getenv('STATE_CACHE_TTL', 60))
+    MODEL_STORE_DIR = os.path.abspath(os.getenv('MODEL_STORE_DIR', 'model_store'))
+    DETECTION_RECORD_INTERVAL = float(os.getenv('DETECTION_RECORD_INTERVAL', 1.0))  # seconds between stored frames per detector, 0 = every frame
+    DETECTION_WRITER_QUEUE_SIZE = int(os.getenv('DETECTION_WRITER_QUEUE_SIZE', 2000))
+    DETECTION_WRITER_BATCH_SIZE = int(os.getenv('DETECTION_WRITER_BATCH_SIZE', 500))
+    DETECTION_WRITER_FLUSH_INTERVAL = float(os.getenv('DETECTION_WRITER_FLUSH_INTERVAL', 1.0))
+    DETECTION_WRITER_POLICY = os.getenv('DETECTION_WRITER_POLICY', 'drop_oldest')  # or 'drop_newest'
+    SCHEDULER_CAPACITY = float(os.getenv('SCHEDULER_CAPACITY', 0))  # most busy inference seconds per second, 0 = one per inference worker; the measured capacity is used below it
+    SCHEDULER_HEADROOM = float(os.getenv('SCHEDULER_HEADROOM', 0.9))  # fraction of the capacity handed out
+    SCHEDULER_INTERVAL = float(os.getenv('SCHEDULER_INTERVAL', 1.0))  # seconds between reallocations
+    CAPTURE_WIDTH = int(os.getenv('CAPTURE_WIDTH', 1280))  # processing width for cameras without their own, 0 = native
+    INFERENCE_IMGSZ = int(os.getenv('INFERENCE_IMGSZ', 640))  # model input size for cameras without their own
+    MODEL_BENCHMARK_RUNS = int(os.getenv('MODEL_BENCHMARK_RUNS', 20))  # timed predicts per model when measuring export latency
+    QUANT_CALIBRATION_FRAMES = int(os.getenv('QUANT_CALIBRATION_FRAMES', 32))  # camera frames sampled to calibrate INT8 models
+    QUANT_SAMPLE_INTERVAL = float(os.getenv('QUANT_SAMPLE_INTERVAL', 0.5))  # seconds between calibration samples
+    ASYNC_STREAM_QUEUE_SIZE = int(os.getenv('ASYNC_STREAM_QUEUE_SIZE', 2))  # frames buffered per async viewer before the oldest is dropped
+    ASYNC_STREAM_IDLE_TIMEOUT = float(os.getenv('ASYNC_STREAM_IDLE_TIMEOUT', 5.0))  # seconds a source pump outlives its last viewer
+    WEBSOCKET_QUEUE_SIZE = int(os.getenv('WEBSOCKET_QUEUE_SIZE', 1))  # frames buffered per WebSocket viewer before the oldest is dropped
+    STREAM_TRANSPORT = os.getenv('STREAM_TRANSPORT', 'auto')  # view pages: 'auto' (WebSocket, MJPEG fallback), 'websocket' or 'mjpeg'
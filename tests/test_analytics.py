@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import pytest
+
+analytics = pytest.importorskip('app.utils.analytics')
+
+
+@pytest.mark.parametrize('granularity, expected', [
+    ('minute', datetime(2024, 5, 6, 7, 8)),
+    ('hour', datetime(2024, 5, 6, 7)),
+    ('day', datetime(2024, 5, 6)),
+])
+def test_bucket_start(granularity, expected):
+    assert analytics.bucket_start(datetime(2024, 5, 6, 7, 8, 9, 123), granularity) == expected
+
+
+def test_bucket_start_rejects_unknown_granularity():
+    with pytest.raises(ValueError):
+        analytics.bucket_start(datetime(2024, 5, 6), 'week')
+
+
+def test_rollup_counts_objects_and_sampled_frames():
+    first, second = datetime(2024, 5, 6, 7, 8, 1), datetime(2024, 5, 6, 7, 9, 30)
+    rows = [
+        {'detector_id': 1, 'class_id': 0, 'class_name': 'person', 'created_at': first},
+        {'detector_id': 1, 'class_id': 0, 'class_name': 'person', 'created_at': first},
+        {'detector_id': 1, 'class_id': 2, 'class_name': None, 'created_at': second},
+    ]
+    # The third frame had no detections but was still sampled
+    frames = [(1, first), (1, second), (1, second)]
+    counts = analytics.rollup_counts(rows, frames)
+
+    assert counts[(1, 'person', 'minute', datetime(2024, 5, 6, 7, 8))] == (2, 0)
+    assert counts[(1, '2', 'minute', datetime(2024, 5, 6, 7, 9))] == (1, 0)
+    assert counts[(1, analytics.ALL_CLASSES, 'minute', datetime(2024, 5, 6, 7, 9))] == (1, 2)
+    assert counts[(1, analytics.ALL_CLASSES, 'hour', datetime(2024, 5, 6, 7))] == (3, 3)
+
+
+def test_per_frame():
+    assert analytics.per_frame(3, 2) == pytest.approx(1.5)
@@ -0,0 +1,28 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+quantization = pytest.importorskip('app.utils.quantization')
+
+
+def frame(*boxes):
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+
+
+def test_identical_predictions_agree_fully():
+    references = [frame([0, 0, 10, 10, 0.9, 0], [20, 20, 40, 40, 0.8, 1]), frame([5, 5, 15, 15, 0.7, 0])]
+    assert quantization.agreement_map(references, [r.copy() for r in references], 0.5) == pytest.approx(1.0)
+
+
+def test_shifted_box_is_a_false_positive():
+    references = [frame([0, 0, 10, 10, 0.9, 0], [50, 50, 60, 60, 0.8, 0])]
+    # Second box moved by half its width: IoU 1/3
+    candidates = [frame([0, 0, 10, 10, 0.9, 0], [55, 50, 65, 60, 0.8, 0])]
+
+    # One hit then one miss: recall 0.5 at precision 1.0
+    assert quantization.agreement_map(references, candidates, 0.5) == pytest.approx(0.5)
+    assert quantization.agreement_map(references, candidates, 0.3) == pytest.approx(1.0)
+
+
+def test_no_reference_objects():
+    assert quantization.agreement_map([frame()], [frame([0, 0, 10, 10, 0.9, 0])], 0.5) is None
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+pytest.importorskip('cv2')
+roi = pytest.importorskip('app.utils.roi')
+
+
+def test_to_frame_shifts_and_filters_by_polygon():
+    # Left half of a 100x100 frame
+    region = roi.RegionOfInterest([(0, 0), (0.5, 0), (0.5, 1), (0, 1)])
+    detections = np.asarray([
+        [10, 10, 20, 30, 0.9, 0, -1],
+        [30, 10, 60, 30, 0.8, 0, -1],
+    ], dtype=np.float32)
+
+    kept = region.to_frame(detections, (5, 10), (100, 100, 3))
+
+    # Bottom centres land on (20, 40) inside and (50, 40) on the edge of the polygon
+    assert kept[:, :4].tolist() == [[15, 20, 25, 40], [35, 20, 65, 40]]
+    assert detections[0, 0] == 10
+
+
+def test_to_frame_drops_detections_outside():
+    region = roi.RegionOfInterest([(0, 0), (0.5, 0), (0.5, 1), (0, 1)])
+    detections = np.asarray([[70, 10, 90, 30, 0.9, 0, -1]], dtype=np.float32)
+
+    assert len(region.to_frame(detections, (0, 0), (100, 100, 3))) == 0
+
+
+def test_to_frame_without_detections():
+    region = roi.RegionOfInterest([(0, 0), (0.5, 0), (0.5, 1), (0, 1)])
+    empty = np.zeros((0, 7), dtype=np.float32)
+
+    assert region.to_frame(empty, (5, 5), (100, 100, 3)) is empty
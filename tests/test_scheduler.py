@@ -0,0 +1,58 @@
+import pytest
+
+scheduler = pytest.importorskip('app.utils.scheduler')
+
+
+def make_scheduler(capacity=1.0):
+    frame_rate_scheduler = scheduler.FrameRateScheduler(capacity=capacity, headroom=1.0)
+    frame_rate_scheduler.register(1, min_fps=1, max_fps=30, weight=1)
+    frame_rate_scheduler.register(2, min_fps=1, max_fps=30, weight=3)
+    for detector_id in (1, 2):
+        frame_rate_scheduler.report(detector_id, 0.05)
+    return frame_rate_scheduler
+
+
+def target_fps(frame_rate_scheduler):
+    with frame_rate_scheduler.lock:
+        frame_rate_scheduler._rebalance()
+        return {d: p.target_fps for d, p in frame_rate_scheduler.policies.items()}
+
+
+def test_spare_capacity_follows_weights():
+    fps = target_fps(make_scheduler())
+
+    # Minimums take 0.1s/s, the other 0.9s/s is split 1:3
+    assert fps[1] == pytest.approx(5.5)
+    assert fps[2] == pytest.approx(14.5)
+
+
+def test_capped_detector_passes_capacity_on():
+    frame_rate_scheduler = make_scheduler()
+    frame_rate_scheduler.register(2, min_fps=1, max_fps=10, weight=3)
+    fps = target_fps(frame_rate_scheduler)
+
+    assert fps[2] == pytest.approx(10)
+    assert fps[1] == pytest.approx(10)
+
+
+def test_minimums_scale_down_when_overloaded():
+    frame_rate_scheduler = make_scheduler(capacity=0.05)
+    fps = target_fps(frame_rate_scheduler)
+
+    assert frame_rate_scheduler.overloaded
+    assert fps[1] == pytest.approx(0.5)
+    assert fps[2] == pytest.approx(0.5)
+
+
+def test_capacity_follows_measured_busy_time_while_saturated():
+    frame_rate_scheduler = make_scheduler()
+    frame_rate_scheduler.configure(probe=lambda: 0.5)
+
+    frame_rate_scheduler._measure()
+    assert not frame_rate_scheduler.saturated
+    assert frame_rate_scheduler.capacity == pytest.approx(1.0)
+
+    frame_rate_scheduler.report(1, 0.05, wait=0.2)
+    frame_rate_scheduler._measure()
+    assert frame_rate_scheduler.saturated
+    assert frame_rate_scheduler.capacity == pytest.approx(1.0 - scheduler.CAPACITY_SMOOTHING * 0.5)